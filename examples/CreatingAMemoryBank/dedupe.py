@@ -0,0 +1,236 @@
+import base64
+import hashlib
+import json
+import os
+import re
+import struct
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from shards import list_files
+
+# Near-duplicate detection before ingestion. Text is extracted from every file
+# in a process pool and reduced to a MinHash signature of its word shingles;
+# locality-sensitive hashing (LSH) over bands of the signature finds candidate
+# pairs without comparing every file with every other, and candidates whose
+# estimated Jaccard similarity reaches the threshold are clustered. One file
+# per cluster is ingested and the rest are recorded as aliases of it.
+
+NUM_PERM = 128
+SHINGLE_WORDS = 5
+_MERSENNE = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+def _permutations(num_perm, seed=1):
+    # (a, b) for the universal hashes (a * x + b) mod p, the same in every process
+    params = []
+    for i in range(num_perm):
+        digest = hashlib.blake2b(f"{seed}:{i}".encode(), digest_size=16).digest()
+        a, b = struct.unpack("<QQ", digest)
+        params.append((a % (_MERSENNE - 1) + 1, b % _MERSENNE))
+    return params
+
+
+_PERMUTATIONS = _permutations(NUM_PERM)
+
+
+_STREAM = re.compile(rb"obj\s*<<((?:(?!endobj).)*?)>>\s*stream\r?\n(.*?)\s*endstream", re.S)
+_TEXT_OP = re.compile(rb"\((?:\\.|[^\\)])*\)|T\*|Td|TD|'|\"|ET")
+_ESCAPES = {b"n": b"\n", b"r": b"\r", b"t": b"\t", b"b": b"\b", b"f": b"\f"}
+
+
+def _unescape(literal):
+    # Body of a PDF literal string, without the parentheses
+    def replace(match):
+        escaped = match.group(1)
+        if escaped[:1].isdigit():
+            return bytes([int(escaped, 8) & 0xFF])
+        return _ESCAPES.get(escaped, escaped)
+    return re.sub(rb"\\([0-7]{1,3}|.)", replace, literal, flags=re.S)
+
+
+def _decode_stream(header, data):
+    filters = re.findall(rb"/(ASCII85Decode|A85|FlateDecode|Fl)\b", header.split(b"/Filter", 1)[-1]) if b"/Filter" in header else []
+    for name in filters:
+        if name in (b"ASCII85Decode", b"A85"):
+            data = data.strip()
+            data = base64.a85decode(data if data.startswith(b"<~") else b"<~" + data, adobe=True)
+        else:
+            data = zlib.decompress(data)
+    return data
+
+
+def _simple_pdf_text(data):
+    # Text-showing operators of uncompressed, Flate or ASCII85 content streams.
+    # Enough for generated PDFs like the sample recipes; pypdf is used when installed.
+    lines = []
+    current = []
+    for header, stream in _STREAM.findall(data):
+        if b"/Subtype" in header or b"/Length1" in header:
+            continue  # images and embedded fonts
+        try:
+            content = _decode_stream(header, stream)
+        except (ValueError, zlib.error):
+            continue
+        for token in _TEXT_OP.findall(content):
+            if token.startswith(b"("):
+                current.append(_unescape(token[1:-1]).decode("latin-1"))
+            elif current:
+                lines.append("".join(current))
+                current = []
+    if current:
+        lines.append("".join(current))
+    return "\n".join(lines)
+
+
+def extract_text(path):
+    if not path.lower().endswith(".pdf"):
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            return f.read()
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        with open(path, "rb") as f:
+            return _simple_pdf_text(f.read())
+    return "\n".join(page.extract_text() or "" for page in PdfReader(path).pages)
+
+
+def shingles(text, size=SHINGLE_WORDS):
+    words = re.findall(r"\w+", text.lower())
+    if len(words) <= size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def minhash(shingle_set, permutations=_PERMUTATIONS):
+    hashes = [struct.unpack("<I", hashlib.blake2b(shingle.encode(), digest_size=4).digest())[0] for shingle in shingle_set]
+    if not hashes:
+        return [_MAX_HASH] * len(permutations)
+    return [min((a * h + b) % _MERSENNE for h in hashes) & _MAX_HASH for a, b in permutations]
+
+
+def estimated_similarity(signature, other):
+    return sum(x == y for x, y in zip(signature, other)) / len(signature)
+
+
+def signature_file(path):
+    # Runs in a worker process: the file's signature plus what is needed to pick a representative
+    try:
+        text = extract_text(path)
+    except Exception as e:
+        print(f"Could not extract text from {path}: {e}")
+        text = ""
+    return {"path": path, "signature": minhash(shingles(text)), "words": len(text.split()),
+            "size": os.path.getsize(path)}
+
+
+def lsh_bands(threshold, num_perm=NUM_PERM):
+    """(bands, rows) with bands * rows <= num_perm whose S-curve threshold,
+    (1 / bands) ** (1 / rows), is closest to `threshold`."""
+    best = None
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        error = abs((1 / bands) ** (1 / rows) - threshold)
+        if best is None or error < best[0]:
+            best = (error, bands, rows)
+    return best[1], best[2]
+
+
+def cluster(entries, threshold):
+    """Groups of near-duplicate entries (index lists), largest first."""
+    bands, rows = lsh_bands(threshold, len(entries[0]["signature"]) if entries else NUM_PERM)
+    parent = list(range(len(entries)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    checked = set()
+    for band in range(bands):
+        buckets = {}
+        for i, entry in enumerate(entries):
+            if not entry["words"]:
+                continue  # no text extracted, so nothing to compare; always ingested
+            buckets.setdefault(tuple(entry["signature"][band * rows:(band + 1) * rows]), []).append(i)
+        for members in buckets.values():
+            for j in members[1:]:
+                pair = (members[0], j)
+                if pair in checked:
+                    continue
+                checked.add(pair)
+                if estimated_similarity(entries[pair[0]]["signature"], entries[j]["signature"]) >= threshold:
+                    parent[find(j)] = find(pair[0])
+
+    groups = {}
+    for i in range(len(entries)):
+        groups.setdefault(find(i), []).append(i)
+    return sorted(groups.values(), key=len, reverse=True)
+
+
+def find_duplicates(input_path, threshold=0.8, workers=None):
+    """Extract and sign every file in `input_path` on a process pool, then
+    cluster near-duplicates.
+
+    Returns the representatives to ingest (the file with the most text in each
+    cluster, plus any member not similar enough to it), the alias map {duplicate: representative} with the estimated
+    similarity, and timing and size totals.
+    """
+    files = list_files(input_path)
+    root = input_path if os.path.isdir(input_path) else os.path.dirname(input_path)
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        entries = list(pool.map(signature_file, files, chunksize=max(1, len(files) // 64)))
+    signed = time.perf_counter()
+
+    keep = []
+    aliases = {}
+    for group in cluster(entries, threshold):
+        members = sorted((entries[i] for i in group), key=lambda entry: (-entry["words"], entry["path"]))
+        # Clusters are transitive (A~B and B~C joins A and C), so only members
+        # close enough to the representative itself become its aliases; the
+        # rest get a representative of their own the same way
+        while members:
+            representative = members[0]
+            keep.append(representative["path"])
+            rest = []
+            for member in members[1:]:
+                similarity = estimated_similarity(member["signature"], representative["signature"])
+                if similarity >= threshold:
+                    aliases[os.path.relpath(member["path"], root)] = {
+                        "representative": os.path.relpath(representative["path"], root),
+                        "similarity": round(similarity, 3),
+                    }
+                else:
+                    rest.append(member)
+            members = rest
+    removed_bytes = sum(entry["size"] for entry in entries if os.path.relpath(entry["path"], root) in aliases)
+    return {
+        "keep": sorted(keep),
+        "aliases": aliases,
+        "files": len(files),
+        "bytes": sum(entry["size"] for entry in entries),
+        "removed_bytes": removed_bytes,
+        "signature_seconds": signed - start,
+        "cluster_seconds": time.perf_counter() - signed,
+    }
+
+
+def format_dedupe(result):
+    files = result["files"] or 1
+    total = result["bytes"] or 1
+    rate = result["files"] / result["signature_seconds"] if result["signature_seconds"] else 0.0
+    return (f"Deduplicated {result['files']} files in {result['signature_seconds'] + result['cluster_seconds']:.2f}s "
+            f"({rate:.1f} files/sec extracting, {result['cluster_seconds'] * 1000:.0f} ms clustering): "
+            f"{len(result['aliases'])} near-duplicates removed ({len(result['aliases']) / files:.1%} of files, "
+            f"{result['removed_bytes'] / total:.1%} of bytes), {len(result['keep'])} files to ingest")
+
+
+def save_aliases(path, memory_bank_name, input_path, threshold, aliases):
+    # Lets results from a representative be attributed to the files it stands for
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({"memory_bank": memory_bank_name, "input_path": input_path, "threshold": threshold,
+                   "created": time.time(), "aliases": aliases}, f, indent=2)
@@ -0,0 +1,77 @@
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from shards import list_files
+
+
+def hash_file(path, block_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_manifest(path, memory_bank_name, input_path, files):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"memory_bank": memory_bank_name, "input_path": input_path, "updated": time.time(), "files": files}, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def scan_changes(input_path, previous_files, workers=None):
+    """Compare the input tree with the files recorded in a manifest.
+
+    Files whose size and mtime match the manifest are taken as unchanged
+    without being read; everything else is hashed on a thread pool (hashlib
+    releases the GIL) and compared by content. Returns the new, changed,
+    unchanged and deleted relative paths plus the manifest entries for the
+    current tree.
+    """
+    previous_files = previous_files or {}
+    root = input_path if os.path.isdir(input_path) else os.path.dirname(input_path)
+    current = {}
+    for path in list_files(input_path):
+        stat = os.stat(path)
+        current[os.path.relpath(path, root)] = {"size": stat.st_size, "mtime": stat.st_mtime}
+
+    to_hash = []
+    for relative, entry in current.items():
+        known = previous_files.get(relative)
+        if known and known["size"] == entry["size"] and known["mtime"] == entry["mtime"]:
+            entry["sha256"] = known["sha256"]
+        else:
+            to_hash.append(relative)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        digests = pool.map(hash_file, [os.path.join(root, relative) for relative in to_hash])
+        for relative, digest in zip(to_hash, digests):
+            current[relative]["sha256"] = digest
+
+    changes = {"new": [], "changed": [], "unchanged": [], "deleted": [], "hashed": len(to_hash)}
+    for relative, entry in current.items():
+        known = previous_files.get(relative)
+        if known is None:
+            changes["new"].append(relative)
+        elif known["sha256"] != entry["sha256"]:
+            changes["changed"].append(relative)
+        else:
+            changes["unchanged"].append(relative)
+    changes["deleted"] = [relative for relative in previous_files if relative not in current]
+    changes["files"] = current
+    return changes
+
+
+def total_bytes(changes, key):
+    files = changes["files"]
+    return sum(files[relative]["size"] for relative in changes[key] if relative in files)
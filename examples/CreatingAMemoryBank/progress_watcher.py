@@ -0,0 +1,202 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future
+
+FAILED_STATUSES = ("error", "failed", "cancelled", "canceled")
+
+
+class ThroughputTracker:
+    """Derives ingestion rates from successive progress snapshots.
+
+    Rates are exponentially smoothed so one slow or fast poll interval does not
+    swing the ETA.
+    """
+
+    def __init__(self, smoothing=0.3):
+        self.smoothing = smoothing
+        self.started_at = time.monotonic()
+        self._last = None  # (time, progress, processed files, processed chunks)
+        self.percent_per_sec = None
+        self.files_per_sec = None
+        self.chunks_per_sec = None
+
+    def _smooth(self, previous, value):
+        if previous is None:
+            return value
+        return self.smoothing * value + (1 - self.smoothing) * previous
+
+    def update(self, item, now=None):
+        now = time.monotonic() if now is None else now
+        sample = (now, item.get('progress') or 0.0, item.get('processedFiles'), item.get('processedChunks'))
+        if self._last is not None and now > self._last[0]:
+            elapsed = now - self._last[0]
+            self.percent_per_sec = self._smooth(self.percent_per_sec, (sample[1] - self._last[1]) / elapsed)
+            if sample[2] is not None and self._last[2] is not None:
+                self.files_per_sec = self._smooth(self.files_per_sec, (sample[2] - self._last[2]) / elapsed)
+            if sample[3] is not None and self._last[3] is not None:
+                self.chunks_per_sec = self._smooth(self.chunks_per_sec, (sample[3] - self._last[3]) / elapsed)
+        self._last = sample
+
+        eta = None
+        if self.percent_per_sec and self.percent_per_sec > 0:
+            eta = max(0.0, (100.0 - sample[1]) / self.percent_per_sec)
+        return {
+            **item,
+            "elapsed": now - self.started_at,
+            "percent_per_sec": self.percent_per_sec,
+            "eta_seconds": eta,
+            "files_per_sec": self.files_per_sec,
+            "chunks_per_sec": self.chunks_per_sec,
+        }
+
+
+class ProgressWatcher:
+    """Watches ingestions until they complete, from a single asyncio poll loop.
+
+    One /api/silk/ingestions request per tick serves every watched memory bank.
+    The poll interval starts at `min_interval`, grows by `backoff` (up to
+    `max_interval`) while nothing changes and drops back as soon as progress
+    moves. A bank with no ingestion listed for `missing_grace` seconds fails,
+    and every watched bank fails once progress could not be fetched for
+    `unreachable_grace` seconds in a row.
+    """
+
+    def __init__(self, sdk, min_interval=0.25, max_interval=5.0, backoff=1.5, missing_grace=30.0, unreachable_grace=60.0):
+        self.sdk = sdk
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.missing_grace = missing_grace
+        self.unreachable_grace = unreachable_grace
+
+        self._watched = {}  # bank -> {"future", "callback", "tracker", "last", "registered_at"}
+        self._poll_task = None
+        self.polls = 0
+        self.fetch_failures = 0  # consecutive
+
+    async def _fetch(self):
+        loop = asyncio.get_running_loop()
+        ingestions = await loop.run_in_executor(None, self.sdk.get_ingestions)
+        return {item.get('memoryBankName'): item for item in ingestions.get('IngestionItems', [])}
+
+    def _finish(self, bank, result=None, error=None):
+        watch = self._watched.pop(bank)
+        if watch["future"].done():
+            return
+        if error is not None:
+            watch["future"].set_exception(error)
+        else:
+            watch["future"].set_result(result)
+
+    async def _poll(self):
+        interval = self.min_interval
+        last_success = time.monotonic()
+        while self._watched:
+            try:
+                items = await self._fetch()
+                last_success = time.monotonic()
+                self.fetch_failures = 0
+            except Exception as e:
+                self.fetch_failures += 1
+                print(f"Error checking ingestion progress ({self.fetch_failures} in a row): {e}")
+                items = None
+                unreachable = time.monotonic() - last_success
+                if unreachable > self.unreachable_grace:
+                    for bank in list(self._watched):
+                        self._finish(bank, error=RuntimeError(
+                            f"Could not check ingestion progress for {unreachable:.0f}s: {e}"))
+                    break
+            self.polls += 1
+
+            changed = False
+            for bank, watch in list(self._watched.items()):
+                item = None if items is None else items.get(bank)
+                if item is None:
+                    if items is not None and time.monotonic() - watch["registered_at"] > self.missing_grace:
+                        self._finish(bank, error=RuntimeError(f"No ingestion found for memory bank '{bank}'"))
+                    continue
+
+                snapshot = (item.get('status'), item.get('progress'), item.get('processedChunks'))
+                if snapshot != watch["last"]:
+                    changed = True
+                    watch["last"] = snapshot
+                progress = watch["tracker"].update(item)
+                if watch["callback"] is not None:
+                    try:
+                        watch["callback"](bank, progress)
+                    except Exception as e:
+                        print(f"Progress callback failed: {e}")
+
+                status = str(item.get('status', '')).lower()
+                if status == "complete":
+                    self._finish(bank, result=progress)
+                elif status in FAILED_STATUSES:
+                    self._finish(bank, error=RuntimeError(f"Ingestion into '{bank}' {status}: {item.get('error')}"))
+
+            if not self._watched:
+                break
+            interval = self.min_interval if changed else min(self.max_interval, interval * self.backoff)
+            await asyncio.sleep(interval)
+        self._poll_task = None
+
+    def watch(self, bank, on_progress=None):
+        """Return an awaitable resolving to the final progress of `bank`'s ingestion.
+
+        `on_progress(bank, progress)` is called on every poll with the server's
+        progress fields plus percent_per_sec, eta_seconds, files_per_sec and
+        chunks_per_sec (None until two samples are available).
+        """
+        loop = asyncio.get_running_loop()
+        if bank in self._watched:
+            return self._watched[bank]["future"]
+        future = loop.create_future()
+        self._watched[bank] = {
+            "future": future,
+            "callback": on_progress,
+            "tracker": ThroughputTracker(),
+            "last": None,
+            "registered_at": time.monotonic(),
+        }
+        if self._poll_task is None:
+            self._poll_task = loop.create_task(self._poll())
+        return future
+
+    async def watch_all(self, banks, on_progress=None):
+        futures = [self.watch(bank, on_progress) for bank in banks]
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        return dict(zip(banks, results))
+
+    def watch_in_background(self, banks, on_progress=None):
+        """Non-blocking watch from synchronous code.
+
+        Returns a concurrent.futures.Future resolving to {bank: final progress or
+        exception}. The watch runs on its own event loop in a daemon thread;
+        `on_progress` is called from that thread.
+        """
+        if isinstance(banks, str):
+            banks = [banks]
+        future = Future()
+        watcher = ProgressWatcher(self.sdk, self.min_interval, self.max_interval, self.backoff, self.missing_grace,
+                                  self.unreachable_grace)
+
+        def run():
+            try:
+                future.set_result(asyncio.run(watcher.watch_all(banks, on_progress)))
+            except Exception as e:
+                future.set_exception(e)
+
+        threading.Thread(target=run, name="ingestion-watcher", daemon=True).start()
+        return future
+
+
+def format_progress(progress):
+    parts = [f"{progress.get('progress') or 0.0:.2f}%"]
+    if progress["percent_per_sec"] is not None:
+        parts.append(f"{progress['percent_per_sec']:.2f}%/s")
+    if progress["eta_seconds"] is not None:
+        minutes, seconds = divmod(int(progress["eta_seconds"]), 60)
+        parts.append(f"ETA {minutes}m{seconds:02d}s")
+    if progress["files_per_sec"] is not None:
+        parts.append(f"{progress['files_per_sec']:.2f} files/s")
+    return ", ".join(parts)
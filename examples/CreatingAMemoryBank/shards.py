@@ -0,0 +1,85 @@
+import heapq
+import json
+import os
+import shutil
+import time
+
+
+def list_files(input_path):
+    if os.path.isfile(input_path):
+        return [input_path]
+    files = []
+    for root, _, names in os.walk(input_path):
+        for name in names:
+            files.append(os.path.join(root, name))
+    return sorted(files)
+
+
+def shard_bank_name(memory_bank_name, index, shard_count):
+    width = max(2, len(str(shard_count - 1)))
+    return f"{memory_bank_name}-{index:0{width}d}"
+
+
+def plan_shards(files, shard_count):
+    """Split files into `shard_count` groups of roughly equal total size.
+
+    Largest file first onto the currently lightest shard (the classic LPT
+    heuristic), which keeps the shards within one file size of each other.
+    """
+    if not files:
+        raise ValueError("No files to split into shards")
+    shard_count = max(1, min(shard_count, len(files)))
+    sized = sorted(((os.path.getsize(path), path) for path in files), reverse=True)
+    heap = [(0, index) for index in range(shard_count)]
+    shards = [{"files": [], "bytes": 0} for _ in range(shard_count)]
+    for size, path in sized:
+        total, index = heapq.heappop(heap)
+        shards[index]["files"].append(path)
+        shards[index]["bytes"] += size
+        heapq.heappush(heap, (total + size, index))
+    return shards
+
+
+def _link(source, target):
+    # Symlink where allowed, else hard link, else copy (e.g. Windows without developer mode)
+    for link in (os.symlink, os.link, shutil.copy2):
+        try:
+            link(os.path.abspath(source), target)
+            return
+        except (OSError, NotImplementedError):
+            continue
+    raise OSError(f"Could not stage {source}")
+
+
+def stage_shard(files, input_root, shard_dir):
+    # Dabarqus ingests a path, so give each shard a directory that mirrors the input tree
+    if os.path.exists(shard_dir):
+        shutil.rmtree(shard_dir)
+    for path in files:
+        relative = os.path.relpath(path, input_root) if os.path.isdir(input_root) else os.path.basename(path)
+        target = os.path.join(shard_dir, relative)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        _link(path, target)
+    return shard_dir
+
+
+def write_manifest(path, memory_bank_name, input_path, shards):
+    # The retrieval side reads this to query the shard banks as one logical bank
+    manifest = {
+        "memory_bank": memory_bank_name,
+        "input_path": input_path,
+        "created": time.time(),
+        "shards": [
+            {"memory_bank": shard["memory_bank"], "files": len(shard["files"]), "bytes": shard["bytes"]}
+            for shard in shards
+        ],
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def load_manifest(path):
+    with open(path, "r") as f:
+        return json.load(f)
@@ -1,8 +1,136 @@
 import argparse
+import asyncio
+import time
 from dabarqus import barq
+from progress_watcher import ProgressWatcher, format_progress
+from shards import list_files, plan_shards, shard_bank_name, stage_shard, write_manifest
+from incremental import load_manifest, save_manifest, scan_changes, total_bytes
+from dedupe import find_duplicates, format_dedupe, save_aliases
 import sys
 import os
 
+def wait_for_ingestion(sdk, memory_bank_name):
+    # Wait until the ingestion is completed, polling with backoff
+    def show_progress(bank, progress):
+        sys.stdout.write(f"Ingestion progress: {format_progress(progress)}    \r")
+        sys.stdout.flush()
+
+    watcher = ProgressWatcher(sdk)
+    result = asyncio.run(watcher.watch_all([memory_bank_name], on_progress=show_progress))[memory_bank_name]
+    print()
+    if isinstance(result, Exception):
+        print(f"Ingestion failed: {result}")
+        return False
+    print(f"Ingestion complete! ({result['elapsed']:.1f}s, {watcher.polls} status checks)")
+    return True
+
+def dedupe_input(memory_bank_name, input_path, threshold, workers, dedupe_dir):
+    # Stage one representative per cluster of near-duplicate files; the rest are aliases of it
+    result = find_duplicates(input_path, threshold, workers)
+    print(format_dedupe(result))
+    aliases_path = os.path.join(dedupe_dir, f"{memory_bank_name}.aliases.json")
+    save_aliases(aliases_path, memory_bank_name, input_path, threshold, result["aliases"])
+    print(f"Alias map written to {aliases_path}")
+    if not result["aliases"]:
+        return input_path
+    return stage_shard(result["keep"], input_path, os.path.join(dedupe_dir, memory_bank_name))
+
+def ingest_incremental(sdk, memory_bank_name, input_path, on_stale, manifest_dir, hash_workers):
+    # Only send new files to Dabarqus; a memory bank can't drop single documents,
+    # so changed or deleted files either trigger a rebuild or are left stale
+    manifest_path = os.path.join(manifest_dir, f"{memory_bank_name}.json")
+    manifest = load_manifest(manifest_path)
+    if manifest is not None and manifest.get("input_path") != input_path:
+        print(f"Manifest {manifest_path} was built from {manifest.get('input_path')}, starting over")
+        manifest = None
+
+    start = time.perf_counter()
+    changes = scan_changes(input_path, manifest["files"] if manifest else None, hash_workers)
+    print(f"Scanned {len(changes['files'])} files in {time.perf_counter() - start:.2f}s "
+          f"({changes['hashed']} hashed): {len(changes['new'])} new, {len(changes['changed'])} changed, "
+          f"{len(changes['deleted'])} deleted, {len(changes['unchanged'])} unchanged")
+
+    stale = changes["changed"] + changes["deleted"]
+    if manifest is not None and not changes["new"] and not stale:
+        print(f"Nothing to ingest: skipped {len(changes['unchanged'])} files ({total_bytes(changes, 'unchanged') / 1e6:.1f} MB)")
+        # Keeps the refreshed sizes and mtimes, so the next scan doesn't hash these files again
+        save_manifest(manifest_path, memory_bank_name, input_path, changes["files"])
+        return True
+
+    if manifest is None or (stale and on_stale == "rebuild"):
+        if stale:
+            print(f"{len(stale)} changed or deleted files, rebuilding the memory bank")
+        ingest_path, overwrite = input_path, True
+        ingested = list(changes["files"])
+    else:
+        if stale:
+            print(f"Keeping stale chunks for {len(stale)} changed or deleted files (--on-stale keep)")
+        ingested = changes["new"] + changes["changed"]
+        if not ingested:
+            print(f"Nothing new to ingest: skipped {len(changes['unchanged'])} files ({total_bytes(changes, 'unchanged') / 1e6:.1f} MB)")
+            save_manifest(manifest_path, memory_bank_name, input_path, changes["files"])
+            return True
+        root = input_path if os.path.isdir(input_path) else os.path.dirname(input_path)
+        ingest_path = stage_shard([os.path.join(root, relative) for relative in ingested], input_path,
+                                  os.path.join(manifest_dir, f"{memory_bank_name}.staging"))
+        overwrite = False
+
+    ingested_bytes = sum(changes["files"][relative]["size"] for relative in ingested)
+    skipped = [relative for relative in changes["files"] if relative not in set(ingested)]
+    skipped_bytes = sum(changes["files"][relative]["size"] for relative in skipped)
+    print(f"Ingesting {len(ingested)} files ({ingested_bytes / 1e6:.1f} MB), "
+          f"skipping {len(skipped)} files ({skipped_bytes / 1e6:.1f} MB)")
+
+    sdk.enqueue_ingestion(memory_bank_name=memory_bank_name, input_path=ingest_path, overwrite=overwrite)
+    if not wait_for_ingestion(sdk, memory_bank_name):
+        return False
+
+    save_manifest(manifest_path, memory_bank_name, input_path, changes["files"])
+    return True
+
+def ingest_shards(sdk, memory_bank_name, input_path, shard_count, parallel, shard_dir):
+    # Split the input into size-balanced shards, each ingested into its own memory bank
+    files = list_files(input_path)
+    if not files:
+        print(f"No files to ingest in {input_path}")
+        return False
+    shards = plan_shards(files, shard_count)
+    for index, shard in enumerate(shards):
+        shard["memory_bank"] = shard_bank_name(memory_bank_name, index, len(shards))
+        shard["path"] = stage_shard(shard["files"], input_path, os.path.join(shard_dir, shard["memory_bank"]))
+        print(f"Shard {shard['memory_bank']}: {len(shard['files'])} files, {shard['bytes'] / 1e6:.1f} MB")
+
+    manifest_path = os.path.join(shard_dir, f"{memory_bank_name}.manifest.json")
+    write_manifest(manifest_path, memory_bank_name, input_path, shards)
+    print(f"Shard manifest written to {manifest_path}")
+
+    total_bytes = sum(shard["bytes"] for shard in shards) or 1
+    progress = {}
+
+    def show_progress(bank, shard_progress):
+        progress[bank] = shard_progress.get('progress') or 0.0
+        overall = sum(progress.get(shard["memory_bank"], 0.0) * shard["bytes"] for shard in shards) / total_bytes
+        per_shard = " ".join(f"{progress.get(shard['memory_bank'], 0.0):3.0f}%" for shard in shards)
+        sys.stdout.write(f"Ingestion progress: {overall:.2f}% overall | {per_shard}    \r")
+        sys.stdout.flush()
+
+    watcher = ProgressWatcher(sdk)
+    results = {}
+    if parallel:
+        for shard in shards:
+            sdk.enqueue_ingestion(memory_bank_name=shard["memory_bank"], input_path=shard["path"], overwrite=True)
+        results = asyncio.run(watcher.watch_all([shard["memory_bank"] for shard in shards], on_progress=show_progress))
+    else:
+        for shard in shards:
+            sdk.enqueue_ingestion(memory_bank_name=shard["memory_bank"], input_path=shard["path"], overwrite=True)
+            results.update(asyncio.run(watcher.watch_all([shard["memory_bank"]], on_progress=show_progress)))
+    print()
+
+    failed = {bank: result for bank, result in results.items() if isinstance(result, Exception)}
+    for bank, error in failed.items():
+        print(f"Shard {bank} failed: {error}")
+    return not failed
+
 def main():
     print(sys.argv)
     parser = argparse.ArgumentParser(description="Store documents using Dabarqus SDK")
@@ -10,7 +138,20 @@ def main():
     parser.add_argument("--input-path", required=True, help="Path to the input file or directory")
     parser.add_argument("--no-override", action="store_true", help="Add random number to the file name to avoid override")
     parser.add_argument("--server-url", default="http://localhost:6568", help="Dabarqus server URL")
+    parser.add_argument("--shards", type=int, default=1, help="Split the input into N size-balanced shards, one memory bank each (<bank>-00..NN)")
+    parser.add_argument("--parallel", action="store_true", help="Ingest all shards concurrently instead of one after another")
+    parser.add_argument("--incremental", action="store_true", help="Only ingest files that are new since the last incremental run (tracked in a content-hash manifest)")
+    parser.add_argument("--on-stale", choices=["rebuild", "keep"], default="rebuild", help="With --incremental: rebuild the memory bank when files changed or were deleted, or keep their old chunks")
+    parser.add_argument("--manifest-dir", default="./ingest_manifests", help="Where incremental ingestion manifests are kept")
+    parser.add_argument("--hash-workers", type=int, default=None, help="Threads used to hash files when scanning")
+    parser.add_argument("--shard-dir", default="./shards", help="Where shard directories and the shard manifest are written")
+    parser.add_argument("--dedupe", action="store_true", help="Ingest only one file per cluster of near-duplicates")
+    parser.add_argument("--dedupe-threshold", type=float, default=0.8, help="With --dedupe: estimated Jaccard similarity of word shingles at which files are near-duplicates")
+    parser.add_argument("--dedupe-workers", type=int, default=None, help="Processes used to extract text and compute signatures")
+    parser.add_argument("--dedupe-dir", default="./dedupe", help="Where the deduplicated input and alias maps are written")
     args = parser.parse_args()
+    if args.incremental and args.shards > 1:
+        parser.error("--incremental can't be combined with --shards")
 
     # Initialize the SDK
     sdk = barq(args.server_url)
@@ -35,17 +176,28 @@ def main():
     
     print(f"Using absolute input path: {input_path}")
 
+    if args.dedupe:
+        input_path = dedupe_input(memory_bank_name, input_path, args.dedupe_threshold, args.dedupe_workers,
+                                  os.path.abspath(args.dedupe_dir))
+
+    if args.shards > 1:
+        if not ingest_shards(sdk, memory_bank_name, input_path, args.shards, args.parallel, os.path.abspath(args.shard_dir)):
+            sys.exit(1)
+        print(f"Ingestion complete!")
+        return
+
+    if args.incremental:
+        if not ingest_incremental(sdk, memory_bank_name, input_path, args.on_stale,
+                                  os.path.abspath(args.manifest_dir), args.hash_workers):
+            sys.exit(1)
+        return
+
     # Enqueue ingestion
     ingestion_result = sdk.enqueue_ingestion(memory_bank_name=memory_bank_name, input_path=input_path, overwrite=True)
     print(f"Ingestion result: {ingestion_result}")
 
-    # Wait until the ingestion is completed
-    ingestions = sdk.check_ingestion_progress(memory_bank_name)
-    while ingestions["status"] != "complete":
-        ingestions = sdk.check_ingestion_progress(memory_bank_name)
-        sys.stdout.write(f"Ingestion progress: {ingestions['progress']:.2f}% \r")
-        sys.stdout.flush()
-    print(f"Ingestion complete!")
+    if not wait_for_ingestion(sdk, memory_bank_name):
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,122 @@
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+# Admission control for multi-user serving. Retrieval and generation each have
+# their own concurrency limit; callers beyond it wait in a bounded queue that
+# is served round-robin across users, so one user's burst cannot starve the
+# others. A full queue or a wait past `max_wait` is shed with Busy.
+#
+#   CHATBOT_RETRIEVAL_CONCURRENCY  concurrent rewrite + retrieval stages (default 8)
+#   CHATBOT_GENERATION_CONCURRENCY concurrent LLM generations (default 2)
+#   CHATBOT_QUEUE_SIZE             waiting turns per stage before shedding (default 32)
+#   CHATBOT_QUEUE_TIMEOUT          seconds a turn may wait for a slot (default 60)
+
+
+class Busy(Exception):
+    pass
+
+
+class AdmissionController:
+    def __init__(self, name, limit, max_queue=32, max_wait=60.0, wait_histogram=None):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.wait_histogram = wait_histogram
+        self.lock = threading.Lock()
+        self.active = 0
+        self.waiting = 0
+        self.queues = OrderedDict()  # user -> deque of waiting events, in round-robin order
+        self.admitted = 0
+        self.shed = 0
+        self.timed_out = 0
+        self.wait_total = 0.0
+
+    def acquire(self, user):
+        start = time.perf_counter()
+        with self.lock:
+            if self.active < self.limit and not self.waiting:
+                self.active += 1
+                self._admitted(0.0)
+                return
+            if self.waiting >= self.max_queue:
+                self.shed += 1
+                raise Busy(f"{self.name}: {self.waiting} turns already waiting")
+            waiter = threading.Event()
+            self.queues.setdefault(user, deque()).append(waiter)
+            self.waiting += 1
+
+        granted = waiter.wait(self.max_wait)
+        with self.lock:
+            if not granted and not waiter.is_set():
+                queue = self.queues[user]
+                queue.remove(waiter)
+                if not queue:
+                    del self.queues[user]
+                self.waiting -= 1
+                self.timed_out += 1
+                raise Busy(f"{self.name}: no slot within {self.max_wait:.0f}s")
+            self._admitted(time.perf_counter() - start)
+
+    def _admitted(self, waited):
+        self.admitted += 1
+        self.wait_total += waited
+        if self.wait_histogram is not None:
+            self.wait_histogram.observe(waited * 1000)
+
+    def release(self):
+        with self.lock:
+            if not self.waiting:
+                self.active -= 1
+                return
+            # Hand the slot straight to the next user in turn, then rotate them to the back
+            user, queue = next(iter(self.queues.items()))
+            waiter = queue.popleft()
+            if queue:
+                self.queues.move_to_end(user)
+            else:
+                del self.queues[user]
+            self.waiting -= 1
+            waiter.set()
+
+    @contextmanager
+    def slot(self, user):
+        self.acquire(user)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "active": self.active,
+                "waiting": self.waiting,
+                "users_waiting": len(self.queues),
+                "admitted": self.admitted,
+                "shed": self.shed,
+                "timed_out": self.timed_out,
+                "mean_wait_ms": self.wait_total / self.admitted * 1000 if self.admitted else 0.0,
+            }
+
+
+def controllers_from_env(retrieval_wait=None, generation_wait=None):
+    max_queue = int(os.environ.get("CHATBOT_QUEUE_SIZE", 32))
+    max_wait = float(os.environ.get("CHATBOT_QUEUE_TIMEOUT", 60))
+    retrieval = AdmissionController(
+        "retrieval", int(os.environ.get("CHATBOT_RETRIEVAL_CONCURRENCY", 8)), max_queue, max_wait, retrieval_wait,
+    )
+    generation = AdmissionController(
+        "generation", int(os.environ.get("CHATBOT_GENERATION_CONCURRENCY", 2)), max_queue, max_wait, generation_wait,
+    )
+    return retrieval, generation
+
+
+def user_key(request):
+    # Logged-in user when auth is on, else the browser session
+    if request is None:
+        return "anonymous"
+    return getattr(request, "username", None) or getattr(request, "session_hash", None) or "anonymous"
@@ -1,6 +1,26 @@
 import gradio as gr
 from dabarqus import barq
-from datetime import datetime
+from pipeline import run_pipeline, format_timings, PIPELINE_MODES
+from multibank import expand_banks, load_shard_manifests, query_banks_sync
+from context_packer import pack_context, estimate_tokens
+from rerank import EmbeddingCache, rerank
+from adaptive_limit import AdaptiveLimit, format_adaptive
+from results import get_hits
+from streaming import stream_reply
+from startup import BackgroundChoices, Prewarmer, parse_duration
+from admission import Busy, controllers_from_env, user_key
+from agent_loop import AGENT_MODE, load_evaluation_prompt, run_agent_loop
+from conversation_store import ConversationStore, to_history, to_messages
+from retrieval_cache import RetrievalCache
+from rewrite_cache import RewriteCache
+from microbatch import BurstBatch, EmbeddingBatch, MicroBatcher, format_batch_stats
+from resilience import CircuitBreaker, ResilienceError, ResilientCaller
+from inference_router import InferenceError, InferenceRouter, format_utilization
+import telemetry
+import asyncio
+import requests
+import time
+import threading
 import json
 import os
 import ollama
@@ -8,6 +28,78 @@ import ollama
 # Initialize the Dabarqus SDK
 sdk = barq("http://localhost:6568")
 
+# Concurrent embedding and query requests from all chat sessions, gathered into
+# batches over a few milliseconds
+embedding_batcher = MicroBatcher(EmbeddingBatch(sdk.get_embedding, sdk.get_embedding), name="embedding")
+query_batcher = MicroBatcher(
+    BurstBatch(lambda query, memory_bank, limit: sdk.query_semantic_search(query, limit=limit, memory_bank=memory_bank)),
+    name="query",
+)
+
+# Shared result cache; entries for a bank are dropped when an ingestion into it completes
+retrieval_cache = RetrievalCache(fetch_ingestions=lambda: sdk.get_ingestions().get('IngestionItems', []))
+
+# Keyword rewrites, reused for repeated (exact) and paraphrased (embedding similarity) prompts
+rewrite_cache = RewriteCache(embed=embedding_batcher, path="rewrite_cache.json")
+
+# Deadline, hedging, retries and a /api/silk/health-driven circuit breaker for
+# queries; the SDK sets no timeouts of its own
+query_resilience = ResilientCaller(
+    "query",
+    deadline=10.0,
+    breaker=CircuitBreaker("query", health_check=sdk.check_silk_health),
+)
+
+# Chunk embeddings for diversity re-ranking, keyed by content hash
+embedding_cache = EmbeddingCache(embedding_batcher)
+
+# Number of results per turn chosen from the score curve when adaptive results are on
+adaptive_limit = AdaptiveLimit()
+
+# Stage spans and /metrics, off unless CHATBOT_METRICS_PORT / CHATBOT_TRACING are set
+telemetry.configure_from_env()
+
+# How long Ollama keeps the model loaded after a turn or a pre-warm
+MODEL_KEEP_ALIVE = "30m"
+
+# Separate concurrency limits and fair wait queues for retrieval and generation
+retrieval_admission, generation_admission = controllers_from_env(
+    telemetry.RETRIEVAL_QUEUE_WAIT_MS, telemetry.GENERATION_QUEUE_WAIT_MS,
+)
+for admission in (retrieval_admission, generation_admission):
+    telemetry.gauge(f"chat_{admission.name}_queue_depth", f"Turns waiting for a {admission.name} slot",
+                    lambda admission=admission: admission.waiting)
+    telemetry.gauge(f"chat_{admission.name}_active", f"Turns holding a {admission.name} slot",
+                    lambda admission=admission: admission.active)
+    telemetry.gauge(f"chat_{admission.name}_shed_total", f"Turns turned away at {admission.name}",
+                    lambda admission=admission: admission.shed + admission.timed_out, kind="counter")
+BUSY_MESSAGE = "The assistant is busy with other requests right now. Please try again in a moment."
+INFERENCE_ERROR_MESSAGE = "The model could not answer this message. Please try again."
+
+# Every turn is appended to conversations/. The prompt carries the most recent
+# turns that fit HISTORY_TOKEN_BUDGET plus a rolling summary of older ones, and
+# the chat shows DISPLAY_TURNS turns at a time.
+conversation_store = ConversationStore()
+HISTORY_TOKEN_BUDGET = 1500
+DISPLAY_TURNS = 20
+active_conversations = {}  # browser session -> conversation id
+SUMMARY_USER = "conversation summaries"  # admission queue key shared by background summaries
+
+def restart_inference_alias(item):
+    sdk.stop_inference(item["alias"])
+    sdk.start_inference(
+        alias=item["alias"], model_repo=item.get("modelRepo"), file_path=item.get("filePath"),
+        address=item.get("address"), port=item.get("port"), context_size=item.get("contextSize"),
+        gpu_layers=item.get("gpuLayers"), chat_template=item.get("chatTemplate"),
+    )
+
+# Generations for "dabarqus:<model>" go to the least-loaded of the inference
+# aliases serving that model; failed aliases are drained and restarted
+inference_router = InferenceRouter(fetch_aliases=sdk.get_inference_info, restart_alias=restart_inference_alias)
+
+# Warm-up state of the model and memory banks, used to label turns cold or warm
+prewarmer = Prewarmer(keep_alive=parse_duration(MODEL_KEEP_ALIVE))
+
 def check_dependencies():
     errors = []
     try:
@@ -28,7 +120,9 @@ def display_error_message(errors):
 def get_memory_banks():
     try:
         memory_banks = sdk.get_memory_banks()
-        return [bank['name'] for bank in memory_banks if bank.get('name')]
+        names = [bank['name'] for bank in memory_banks if bank.get('name')]
+        # Sharded banks are also offered under their logical name
+        return names + [name for name in load_shard_manifests() if name not in names]
     except Exception as e:
         print(f"Error fetching memory banks: {e}")
         return ["Default"]
@@ -45,32 +139,260 @@ def get_inference_models():
         print(f"Error fetching inference models: {e}")
         return [("Error fetching model", None)]
 
-def chat_function(message, history, memory_bank, model, query_limit, retrieval_prompt_template, full_prompt_template):
-    
-    # Convert the user's message to a retrieval prompt
-    retrieval_prompt = convert_prompt_to_retrieval_prompt(message, model)
-    
-    # Retrieve data
-    retrieved_data = sdk.query_semantic_search(retrieval_prompt, limit=int(query_limit), memory_bank=memory_bank)
+def get_chat_models():
+    # Ollama models plus one entry per pool of Dabarqus inference aliases
+    models = get_ollama_models()
+    try:
+        pools = inference_router.refresh()
+    except Exception as e:
+        print(f"Error fetching inference aliases: {e}")
+        return models
+    for alias in inference_router.utilization():
+        register_alias_gauges(alias)
+    return models + pools
+
+def register_alias_gauges(alias):
+    name = "".join(c if c.isalnum() else "_" for c in alias)
+    read = lambda key: lambda: inference_router.utilization().get(alias, {}).get(key) or 0
+    telemetry.gauge(f"chat_inference_{name}_in_flight", f"Generations in flight on {alias}", read("in_flight"))
+    telemetry.gauge(f"chat_inference_{name}_utilization", f"Share of time {alias} was generating", read("utilization"))
+    telemetry.gauge(f"chat_inference_{name}_tokens_per_second", f"Recent generation rate of {alias}", read("tokens_per_sec"))
+
+def chat_stream(model, messages):
+    # Ollama-style chunks from Ollama or, for "dabarqus:" models, the inference router
+    if inference_router.routes(model):
+        return inference_router.chat(model, messages)
+    return ollama.chat(model=model, messages=messages, stream=True, keep_alive=MODEL_KEEP_ALIVE)
+
+def chat_once(model, messages):
+    if inference_router.routes(model):
+        content = "".join(chunk['message']['content'] for chunk in inference_router.chat(model, messages))
+        return {'message': {'content': content}}
+    return ollama.chat(model=model, messages=messages, keep_alive=MODEL_KEEP_ALIVE)
+
+def query_memory_bank(query, memory_bank, query_limit):
+    try:
+        retrieved_data = retrieval_cache.get_or_fetch(
+            memory_bank, query, query_limit,
+            lambda: query_resilience.call(
+                lambda: query_batcher((query, memory_bank, query_limit))
+            ),
+        )
+    except (requests.exceptions.RequestException, ResilienceError) as e:
+        print(f"Error querying {memory_bank}: {e}")
+        # While Dabarqus is unavailable, an expired cached result beats none
+        retrieved_data = retrieval_cache.get_stale(memory_bank, query, query_limit)
+        if retrieved_data is not None:
+            query_resilience.count("stale_served")
+            print("Serving a stale cached result")
+        resilience = query_resilience.stats()
+        print(f"Query resilience: {resilience['failures']} failures, {resilience['deadline_exceeded']} deadlines exceeded, "
+              f"{resilience['retries']} retries, {resilience['hedges']} hedges, "
+              f"{resilience['short_circuited']} short-circuited, breaker {resilience['breaker']}")
+    stats = retrieval_cache.stats()
+    print(f"Retrieval cache: {stats['hits']} hits, {stats['misses']} misses, {stats['entries']} entries")
+    return retrieved_data
+
+def make_retriever(memory_bank, query_limit):
+    # One bank is queried directly; several banks (or a sharded one) are queried concurrently
+    banks = expand_banks(memory_bank)
+    if len(banks) == 1:
+        return lambda query: query_memory_bank(query, banks[0][0], query_limit)
+
+    def retrieve_from_banks(query):
+        hits, status = query_banks_sync(query, banks, query_limit, query_memory_bank)
+        print(f"Queried {len(banks)} memory banks: {status}")
+        return hits
+
+    return retrieve_from_banks
+
+def build_prompt(message, memory_bank, model, query_limit, retrieval_prompt_template, full_prompt_template, pipeline_mode, context_budget, rerank_mmr, adaptive_results=False):
+    # With re-ranking, fetch extra candidates and keep the most relevant diverse subset
+    fetch_limit = min(50, 3 * int(query_limit)) if rerank_mmr else int(query_limit)
+    retrieve = make_retriever(memory_bank, fetch_limit)
+    if adaptive_results:
+        # A small page first; up to fetch_limit only while the scores stay close to the top one
+        adaptive_turn = adaptive_limit.new_turn()
+        retrieve = lambda query: adaptive_limit.retrieve(
+            query, lambda q, limit: make_retriever(memory_bank, limit)(q), fetch_limit, adaptive_turn,
+        )
+    if pipeline_mode == "sequential":
+        # Convert the user's message to a retrieval prompt
+        with telemetry.span("chat.rewrite", telemetry.REWRITE_MS, model=model):
+            retrieval_prompt = get_retrieval_keywords(message, model)
+
+        # Retrieve data
+        with telemetry.span("chat.retrieve", telemetry.RETRIEVAL_MS, limit=fetch_limit):
+            retrieved_data = retrieve(retrieval_prompt)
+    else:
+        # Run the keyword rewrite concurrently with a speculative retrieval on the raw message
+        with telemetry.span("chat.pipeline", pipeline_mode=pipeline_mode) as pipeline_span:
+            retrieval_prompt, retrieved_data, timings = asyncio.run(run_pipeline(
+                message,
+                rewrite=lambda prompt: get_retrieval_keywords(prompt, model),
+                retrieve=retrieve,
+                mode=pipeline_mode,
+                limit=fetch_limit,
+            ))
+            for name, value in timings.items():
+                pipeline_span.set_attribute(name, value)
+        if not timings.get("rewrite_abandoned"):
+            # An abandoned rewrite's time is only how long it ran before being dropped
+            telemetry.REWRITE_MS.observe(timings.get("rewrite_ms"))
+        telemetry.RETRIEVAL_MS.observe(timings.get("retrieval_ms", timings.get("speculative_retrieval_ms")))
+        print(f"Pipeline timings ({pipeline_mode}): {format_timings(timings)}")
+    telemetry.result_bytes(retrieved_data)
+    if adaptive_results:
+        adaptive_limit.record(adaptive_turn, retrieved_data)
+        telemetry.RESULTS_USED.observe(len(get_hits(retrieved_data)))
+        print(f"Adaptive results: {format_adaptive(adaptive_limit.stats())}")
+    print(f"Micro-batching: embeddings {format_batch_stats(embedding_batcher.stats())}; "
+          f"queries {format_batch_stats(query_batcher.stats())}")
     
+    if rerank_mmr:
+        with telemetry.span("chat.rerank", telemetry.RERANK_MS):
+            retrieved_data, reranking = rerank(retrieved_data, retrieval_prompt or message, int(query_limit), embedding_cache)
+        print(f"MMR re-rank: kept {reranking['kept']}/{reranking['candidates']} results "
+              f"(embeddings {reranking['embed_ms']:.0f} ms, MMR {reranking['mmr_ms']:.1f} ms)")
+
     # Prepare the prompt for the LLM
-    full_prompt = f"{full_prompt_template} : RAG_response {retrieved_data}, keywords: {retrieval_prompt}, original_prompt: {message}"
-
-    # Use Ollama to generate a response
-    response = ""
-    stream = ollama.chat(
-        model=model,
-        messages=[{"role": "system", "content": "You are a helpful assistant."}, 
-                  {"role": "user", "content": full_prompt}],
-        stream=True,
+    with telemetry.span("chat.prompt", telemetry.PROMPT_BUILD_MS, context_budget=int(context_budget)):
+        if context_budget:
+            # De-duplicated, compact context filled best-first up to the token budget
+            rag_context, packing = pack_context(retrieved_data, int(context_budget))
+            print(f"Context: kept {packing['kept']}/{packing['hits']} results ({packing['duplicates']} duplicates, "
+                  f"{packing['over_budget']} over budget), {packing['packed_tokens']} tokens, saved ~{packing['saved_tokens']} prompt tokens")
+        else:
+            rag_context = retrieved_data
+        # The speculative pipeline has no keywords when the rewrite lost the race
+        keywords = f", keywords: {retrieval_prompt}" if retrieval_prompt else ""
+        full_prompt = f"{full_prompt_template} : RAG_response {rag_context}{keywords}, original_prompt: {message}"
+    return full_prompt
+
+def session_key(request):
+    return getattr(request, "session_hash", None) or "anonymous"
+
+def conversation_for(request):
+    key = session_key(request)
+    if key not in active_conversations:
+        active_conversations[key] = conversation_store.new_conversation(user_key(request))
+    return active_conversations[key]
+
+def history_messages(conversation_id):
+    summary, turns, _ = conversation_store.window(conversation_id)
+    return to_messages(summary, turns)
+
+def record_turn(conversation_id, message, response, model):
+    conversation_store.append_turn(conversation_id, message, response, model=model)
+
+    def summarize(prompt):
+        # A generation like any other, so it waits for a slot; all summaries share one
+        # place in the round-robin so they cannot crowd out people's turns
+        with generation_admission.slot(SUMMARY_USER):
+            return chat_once(model, [{"role": "user", "content": prompt}])['message']['content'].strip()
+
+    def update_summary():
+        try:
+            conversation_store.update_summary(conversation_id, HISTORY_TOKEN_BUDGET, summarize)
+        except Busy as e:
+            # The window keeps the unsummarized turns; the next turn tries again
+            print(f"Conversation summary postponed: {e}")
+
+    # Turns that slid out of the prompt window are folded into the summary off the request path
+    threading.Thread(target=update_summary, daemon=True).start()
+
+def agent_chunks(message, memory_bank, model, query_limit, retrieval_prompt_template, context_budget, stats, earlier=()):
+    # REPROMPT / NEW KEYWORDS / ACCEPT loop from sample_prompt.md; query_limit results per page
+    with telemetry.span("chat.rewrite", telemetry.REWRITE_MS, model=model):
+        keywords = get_retrieval_keywords(message, model)
+    return run_agent_loop(
+        message,
+        keywords,
+        retrieve=lambda query, limit: make_retriever(memory_bank, limit)(query),
+        chat=lambda messages: chat_stream(
+            model,
+            [{"role": "system", "content": "You are a helpful assistant."}] + list(earlier) + messages,
+        ),
+        evaluation_prompt=load_evaluation_prompt(),
+        page_size=int(query_limit),
+        token_budget=int(context_budget),
+        stats=stats,
     )
-    
-    for chunk in stream:
-        response += chunk['message']['content']
-        yield history + [("Human", message), ("AI", response)]
+
+def chat_function(message, history, memory_bank, model, query_limit, retrieval_prompt_template, full_prompt_template, pipeline_mode="sequential", context_budget=2000, rerank_mmr=False, stream_rate=20, adaptive_results=False, request: gr.Request = None):
+    user = user_key(request)
+    conversation_id = conversation_for(request)
+    earlier = history_messages(conversation_id)
+    # Only the latest turns stay in the chat; older ones are a "Load older messages" away
+    history = history if history is not None else []
+    if len(history) > 4 * DISPLAY_TURNS:
+        del history[:-2 * DISPLAY_TURNS]
+    shown = len(history)
+    turn_started = time.perf_counter()
+    targets = warm_targets(model, memory_bank)
+    warm = prewarmer.is_warm(targets)
+    try:
+        if pipeline_mode == AGENT_MODE:
+            # Retrieval and generation alternate, so the turn holds a generation slot throughout
+            with generation_admission.slot(user):
+                agent = {}
+                chunks = agent_chunks(message, memory_bank, model, query_limit, retrieval_prompt_template, context_budget, agent, earlier)
+                yield from prewarmer.time_first_update(
+                    stream_reply(history, message, chunks, updates_per_sec=stream_rate), turn_started, warm,
+                )
+            prewarmer.touch(targets)
+            record_turn(conversation_id, message, history[-1][1], model)
+            telemetry.AGENT_ROUNDS.observe(agent.get("rounds"))
+            telemetry.AGENT_TOKENS_NOT_RESENT.observe(agent.get("tokens_not_resent"))
+            print(f"Agent loop: {agent.get('rounds')} rounds, {agent.get('pages')} pages, {agent.get('results_sent')} results, "
+                  f"stopped by {agent.get('stop')}, {agent.get('tokens_sent')} prompt tokens sent, {agent.get('tokens_not_resent')} tokens not re-sent")
+            return
+        # Rewrite and retrieval, then generation, each under its own concurrency limit
+        with retrieval_admission.slot(user):
+            full_prompt = build_prompt(message, memory_bank, model, query_limit, retrieval_prompt_template,
+                                       full_prompt_template, pipeline_mode, context_budget, rerank_mmr, adaptive_results)
+        with generation_admission.slot(user):
+            # Use Ollama, or the least-loaded Dabarqus inference alias, to generate a response
+            stream = chat_stream(
+                model,
+                [{"role": "system", "content": "You are a helpful assistant."}] + earlier +
+                [{"role": "user", "content": full_prompt}],
+            )
+
+            # Buffered tokens, pushed to the UI at most `stream_rate` times a second
+            chunks = telemetry.instrument_stream(stream, estimate_tokens(full_prompt), model=model)
+            yield from prewarmer.time_first_update(
+                stream_reply(history, message, chunks, updates_per_sec=stream_rate), turn_started, warm,
+            )
+        prewarmer.touch(targets)
+        record_turn(conversation_id, message, history[-1][1], model)
+        if inference_router.routes(model):
+            print(f"Inference aliases: {format_utilization(inference_router.utilization())}")
+    except InferenceError as e:
+        print(f"Turn from {user} failed: {e}")
+        if len(history) > shown:
+            # Failed mid-stream: keep what was generated and say it is incomplete
+            history[-1] = ("AI", (history[-1][1] + "\n\n" if history[-1][1] else "") + INFERENCE_ERROR_MESSAGE)
+            yield history
+        else:
+            yield history + [("Human", message), ("AI", INFERENCE_ERROR_MESSAGE)]
+    except Busy as e:
+        print(f"Turn from {user} shed: {e}")
+        yield history + [("Human", message), ("AI", BUSY_MESSAGE)]
+
+def get_retrieval_keywords(prompt, model="llama3"):
+    keywords = rewrite_cache.rewrite(
+        prompt,
+        lambda p: convert_prompt_to_retrieval_prompt(p, model)['message']['content'].strip(),
+        context=model,
+    )
+    stats = rewrite_cache.stats()
+    print(f"Rewrite cache: {stats['exact_hits']} exact / {stats['semantic_hits']} semantic hits, "
+          f"{stats['misses']} misses, {stats['llm_ms_saved'] / 1000:.1f}s of LLM time saved")
+    return keywords
 
 def convert_prompt_to_retrieval_prompt(prompt, model="llama3"):
-    response = ollama.chat(model=model, messages=[
+    response = chat_once(model, [
     {
         'role': 'user',
         'content': f"Take the user's prompt to create a prompt for a semantic database retriever. Only respond with a list of comma-separated keywords. DO NOT say anything before or afer the keywords.#Prompt:{prompt}",
@@ -78,34 +400,46 @@ def convert_prompt_to_retrieval_prompt(prompt, model="llama3"):
     ])
     return response
 
-def save_conversation(history):
-    if not history:
+def save_conversation(request: gr.Request):
+    # Turns are already on disk; hand out the conversation's log
+    conversation_id = active_conversations.get(session_key(request))
+    if conversation_id is None or not conversation_store.turn_count(conversation_id):
         gr.Warning("No conversation to save.")
         return None, gr.update(visible=False)
-    
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"conversation_{timestamp}.json"
-    with open(filename, "w") as f:
-        json.dump(history, f)
-    
-    gr.Info(f"Conversation saved as {filename}")
-    return filename, gr.update(visible=True)
+    gr.Info(f"Conversation saved as {conversation_store.path(conversation_id)}")
+    return conversation_store.path(conversation_id), gr.update(visible=True)
 
-def toggle_load_file(file, chatbot):
-    if file is None:
-        return gr.update(visible=True), chatbot
-    
-    try:
-        with open(file.name, "r") as f:
-            history = json.load(f)
-        gr.Info("Conversation loaded successfully.")
-        return gr.update(value=None, visible=False), history
-    except json.JSONDecodeError:
-        gr.Warning("Invalid JSON file. Please select a valid conversation file.")
-    except Exception as e:
-        gr.Warning(f"Error loading conversation: {str(e)}")
-    
-    return gr.update(value=None), chatbot
+def toggle_load_file(conversation_id, chatbot, request: gr.Request):
+    owner = user_key(request)
+    if not conversation_id:
+        # If no conversation is selected, show the list of this user's stored ones
+        choices = [(name.split("/", 1)[1], name) for name in conversation_store.list_conversations(owner)]
+        return gr.update(choices=choices, visible=True), chatbot
+    if not conversation_store.owns(owner, conversation_id):
+        gr.Warning("That conversation is not yours.")
+        return gr.update(value=None), chatbot
+    if not conversation_store.turn_count(conversation_id):
+        gr.Warning("That conversation has no messages.")
+        return gr.update(value=None), chatbot
+    # Continue the stored conversation; only its latest turns are read
+    active_conversations[session_key(request)] = conversation_id
+    gr.Info("Conversation loaded successfully.")
+    return gr.update(value=None, visible=False), to_history(conversation_store.recent_turns(conversation_id, DISPLAY_TURNS))
+
+def load_older(chatbot, request: gr.Request):
+    conversation_id = active_conversations.get(session_key(request))
+    if conversation_id is None or not conversation_store.owns(user_key(request), conversation_id):
+        return chatbot
+    chatbot = chatbot or []
+    shown = conversation_store.turn_count(conversation_id) - len(chatbot) // 2
+    older = conversation_store.load_turns(conversation_id, shown - DISPLAY_TURNS, shown)
+    if not older:
+        gr.Info("No older messages.")
+    return to_history(older) + chatbot
+
+def new_conversation(request: gr.Request):
+    active_conversations.pop(session_key(request), None)
+    return None
 
 def save_prompts(retrieval_prompt, full_prompt):
     prompts = {
@@ -137,9 +471,51 @@ def get_ollama_models():
         print(f"Error fetching Ollama models: {e}")
         return ["llama3"]  # Default model if fetching fails
 
+def warm_targets(model, memory_bank):
+    return [("model", model), ("embedding",)] + [("memory_bank", bank) for bank, _ in expand_banks(memory_bank)]
+
+
+def prewarm_model(model):
+    # An empty prompt makes Ollama load the model; keep_alive holds it in memory.
+    # Dabarqus inference aliases keep their model loaded while they run.
+    if model and not inference_router.routes(model):
+        prewarmer.warm(("model", model), lambda: ollama.generate(model=model, prompt="", keep_alive=MODEL_KEEP_ALIVE))
+
+
+def prewarm_retriever(memory_bank):
+    # The first embedding and query load the embedding model and the bank's index
+    prewarmer.warm(("embedding",), lambda: sdk.get_embedding("warm up"))
+    for bank, _ in expand_banks(memory_bank):
+        prewarmer.warm(("memory_bank", bank), lambda bank=bank: sdk.query_semantic_search("warm up", limit=1, memory_bank=bank))
+
+
+def prewarm_default_model(values):
+    if values["models"]:
+        prewarm_model(values["models"][0])
+
+
+def refresh_choices(selected_banks, selected_model, version):
+    # Called on page load and by a timer; only sends updates when the background load changed something
+    if version == background_choices.version:
+        return gr.update(), gr.update(), version
+    models = background_choices.get("models")
+    return (
+        gr.update(choices=background_choices.get("memory_banks")),
+        gr.update(choices=models, value=selected_model or (models[0] if models else None)),
+        background_choices.version,
+    )
+
+
+# Memory banks and models are fetched in the background, so the UI does not wait on Dabarqus or Ollama
+background_choices = BackgroundChoices(
+    {"memory_banks": (get_memory_banks, []), "models": (get_chat_models, [])},
+    on_ready=prewarm_default_model,
+).start()
+
 with gr.Blocks(title="dabarqus") as demo:
-    memory_banks = get_memory_banks()
-    ollama_models = get_ollama_models()
+    memory_banks = background_choices.get("memory_banks")
+    ollama_models = background_choices.get("models")
+    choices_version = gr.State(-1)
 
     with gr.Row():
         with gr.Column(scale=3):
@@ -149,15 +525,16 @@ with gr.Blocks(title="dabarqus") as demo:
                 save_button = gr.Button("Save", size="sm")
                 load_button = gr.Button("Load", size="sm")
             file_output = gr.File(label="Saved Conversation", visible=False)
-            file_input = gr.File(label="Load Conversation", file_types=[".json"], visible=False)
+            file_input = gr.Dropdown(label="Load Conversation", choices=[], visible=False)
 
     with gr.Row():
         memory_bank = gr.Dropdown(
             choices=memory_banks,
             label="Select Memory Bank",
             value=None,
+            multiselect=True,
             allow_custom_value=False,
-            info="Choose a memory bank to query for relevant information."
+            info="Choose one or more memory banks to query for relevant information."
         )
         # Modify the model_selection Dropdown in your Gradio interface
         model_selection = gr.Dropdown(
@@ -194,28 +571,75 @@ with gr.Blocks(title="dabarqus") as demo:
             placeholder="Enter the prompt template...",
             value="Use these results from your recipe catalog to form your answer (include the file reference in your answer if you use one)"
         )
+        pipeline_mode = gr.Dropdown(
+            choices=PIPELINE_MODES + [AGENT_MODE],
+            label="Retrieval Pipeline",
+            value="sequential",
+            info="sequential: rewrite then retrieve. speculative/merge: retrieve on your message while the keywords are generated. agent: the model asks for more results or new keywords before answering (sample_prompt.md)."
+        )
+        context_budget = gr.Slider(
+            minimum=0,
+            maximum=8000,
+            value=2000,
+            step=100,
+            label="Context token budget",
+            info="Approximate prompt tokens for retrieved results, de-duplicated and best first. 0 sends the raw results."
+        )
+        rerank_mmr = gr.Checkbox(
+            label="Diversity re-ranking (MMR)",
+            value=False,
+            info="Fetch extra results and keep the most relevant ones that are not near-duplicates of each other."
+        )
+        adaptive_results = gr.Checkbox(
+            label="Adaptive number of results",
+            value=False,
+            info="Fetch a few results first and more only while their scores stay close to the best one. Number of RAG results becomes the maximum."
+        )
+        stream_rate = gr.Slider(
+            minimum=0,
+            maximum=60,
+            value=20,
+            step=1,
+            label="Streaming updates per second",
+            info="How often the response is redrawn while it streams. 0 redraws on every token."
+        )
         with gr.Row():
             save_prompts_btn = gr.Button("Save Prompts")
             load_prompts_btn = gr.Button("Load Prompts")
-    clear = gr.Button("Clear Chat")
+    with gr.Row():
+        load_older_button = gr.Button("Load older messages")
+        clear = gr.Button("Clear Chat")
     
     memory_bank.change(enable_input, inputs=[memory_bank], outputs=[msg, submit])
+    memory_bank.change(prewarm_retriever, inputs=[memory_bank], queue=False)
+    model_selection.change(prewarm_model, inputs=[model_selection], queue=False)
+    demo.load(
+        refresh_choices,
+        inputs=[memory_bank, model_selection, choices_version],
+        outputs=[memory_bank, model_selection, choices_version],
+    )
+    gr.Timer(5).tick(
+        refresh_choices,
+        inputs=[memory_bank, model_selection, choices_version],
+        outputs=[memory_bank, model_selection, choices_version],
+    )
 
     msg.submit(
         chat_function,
-        inputs=[msg, chatbot, memory_bank, model_selection, query_limit, retrieval_prompt, prompt_template],
+        inputs=[msg, chatbot, memory_bank, model_selection, query_limit, retrieval_prompt, prompt_template, pipeline_mode, context_budget, rerank_mmr, stream_rate, adaptive_results],
         outputs=[chatbot]
     )      
     submit.click(
         chat_function,
-        inputs=[msg, chatbot, memory_bank, model_selection, query_limit, retrieval_prompt, prompt_template],
+        inputs=[msg, chatbot, memory_bank, model_selection, query_limit, retrieval_prompt, prompt_template, pipeline_mode, context_budget, rerank_mmr, stream_rate, adaptive_results],
         outputs=[chatbot]
     )
-    clear.click(lambda: None, None, chatbot, queue=False)
+    clear.click(new_conversation, None, chatbot, queue=False)
+    load_older_button.click(load_older, inputs=[chatbot], outputs=[chatbot], queue=False)
 
     save_button.click(
         save_conversation,
-        inputs=[chatbot],
+        inputs=None,
         outputs=[file_output, file_output]
     )
 
@@ -226,6 +650,8 @@ with gr.Blocks(title="dabarqus") as demo:
     )
 
 if __name__ == "__main__":
+    # Concurrency is limited per stage by retrieval_admission / generation_admission rather than by Gradio's queue
+    demo.queue(default_concurrency_limit=None)
     demo.launch()
     demo.load(lambda: display_error_message(check_dependencies()), outputs=[error_box])
 
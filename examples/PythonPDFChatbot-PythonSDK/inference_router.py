@@ -0,0 +1,294 @@
+import json
+import os
+import threading
+import time
+import requests
+
+# Routes chat generations across the Dabarqus inference aliases that serve the
+# same model (each started with /api/inference/start on its own port). Each
+# generation goes to the healthy alias with the least expected wait: requests
+# in flight divided by its recent tokens/sec. An alias that fails is drained
+# (no new requests) and, once its last request has finished, only that alias
+# is restarted (stopped and started again with the settings it was started
+# with) and probed until it answers again; the other aliases keep serving. An
+# alias that does not come back stays DOWN, out of rotation, and is probed
+# again on every refresh() until /health answers.
+# Only connection errors, timeouts and 5xx responses count as failures: a 4xx
+# is a problem with the request, so it is neither retried nor held against
+# the alias.
+#
+# Aliases serve the OpenAI-compatible /v1/chat/completions API; their streams
+# are converted to Ollama-style chunks so the rest of the app does not care
+# which backend answered.
+
+ROUTED_PREFIX = "dabarqus:"
+
+HEALTHY, DRAINING, RESTARTING, DOWN = "healthy", "draining", "restarting", "down"
+
+
+class InferenceError(Exception):
+    pass
+
+
+class NoBackendAvailable(InferenceError):
+    pass
+
+
+def is_backend_failure(exc):
+    if isinstance(exc, requests.exceptions.HTTPError):
+        return exc.response is not None and exc.response.status_code >= 500
+    return isinstance(exc, (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                            requests.exceptions.ChunkedEncodingError))
+
+
+def backend_url(item):
+    # WingmanItems carry the address and port the alias was started on
+    address = item.get("address") or item.get("host") or "127.0.0.1"
+    if "://" in address:
+        return address.rstrip("/")
+    port = item.get("port")
+    return f"http://{address}:{port}" if port and ":" not in address else f"http://{address}"
+
+
+def model_key(item):
+    # Aliases started from the same model file form one pool
+    path = item.get("filePath") or item.get("modelRepo") or item.get("alias", "")
+    return os.path.splitext(os.path.basename(path))[0] or item.get("alias", "")
+
+
+class Backend:
+    def __init__(self, alias, url, model, item):
+        self.alias = alias
+        self.url = url
+        self.model = model
+        self.item = item  # the WingmanItem, to start the alias again the same way
+        self.state = HEALTHY
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.restarts = 0
+        self.tokens_per_sec = None  # moving average of recent generations
+        self.busy_seconds = 0.0
+        self.busy_since = None
+        self.created = time.monotonic()
+
+    def utilization(self, now):
+        busy = self.busy_seconds + (now - self.busy_since if self.busy_since is not None else 0.0)
+        return busy / max(now - self.created, 1e-9)
+
+
+class InferenceRouter:
+    def __init__(self, fetch_aliases, restart_alias, failure_threshold=2, rate_smoothing=0.3,
+                 restart_timeout=120.0, timeout=(5, 300)):
+        # restart_alias(item) stops and starts one alias from its WingmanItem
+        self.fetch_aliases = fetch_aliases
+        self.restart_alias = restart_alias
+        self.failure_threshold = failure_threshold
+        self.rate_smoothing = rate_smoothing
+        self.restart_timeout = restart_timeout
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.lock = threading.Lock()
+        self.backends = {}  # alias -> Backend
+
+    def refresh(self):
+        # Pick up aliases started or stopped since the last call; stats of known aliases are kept
+        items = self.fetch_aliases() or []
+        with self.lock:
+            seen = set()
+            for item in items:
+                alias = item.get("alias")
+                if not alias:
+                    continue
+                seen.add(alias)
+                url, model = backend_url(item), model_key(item)
+                backend = self.backends.get(alias)
+                if backend is None or backend.url != url or backend.model != model:
+                    self.backends[alias] = Backend(alias, url, model, item)
+                else:
+                    backend.item = item
+            for alias in list(self.backends):
+                if alias not in seen and not self.backends[alias].in_flight:
+                    del self.backends[alias]
+            down = [backend for backend in self.backends.values() if backend.state == DOWN]
+        for backend in down:
+            self._probe_down(backend)
+        return self.models()
+
+    def _probe_down(self, backend):
+        if self._healthy(backend):
+            with self.lock:
+                if backend.state == DOWN:
+                    backend.state = HEALTHY
+                    backend.consecutive_failures = 0
+                    backend.restarts += 1
+            print(f"Inference alias {backend.alias} is back")
+
+    def models(self):
+        # Dropdown names of the pools, e.g. "dabarqus:llama-3-8b"
+        with self.lock:
+            return sorted({ROUTED_PREFIX + backend.model for backend in self.backends.values()})
+
+    def routes(self, model):
+        return bool(model) and model.startswith(ROUTED_PREFIX)
+
+    def _pick(self, model, exclude):
+        with self.lock:
+            pool = [backend for backend in self.backends.values()
+                    if backend.model == model and backend.state == HEALTHY and backend.alias not in exclude]
+            if not pool:
+                return None
+            known = [backend.tokens_per_sec for backend in pool if backend.tokens_per_sec]
+            default_rate = sum(known) / len(known) if known else 1.0
+            backend = min(pool, key=lambda b: ((b.in_flight + 1) / (b.tokens_per_sec or default_rate), b.requests))
+            backend.in_flight += 1
+            backend.requests += 1
+            if backend.busy_since is None:
+                backend.busy_since = time.monotonic()
+            return backend
+
+    def _finish(self, backend, failed, tokens=0, streaming_seconds=0.0):
+        restart = False
+        with self.lock:
+            backend.in_flight -= 1
+            if not backend.in_flight and backend.busy_since is not None:
+                backend.busy_seconds += time.monotonic() - backend.busy_since
+                backend.busy_since = None
+            if failed:
+                backend.failures += 1
+                backend.consecutive_failures += 1
+                if backend.state == HEALTHY and backend.consecutive_failures >= self.failure_threshold:
+                    print(f"Inference alias {backend.alias} failed {backend.consecutive_failures} times, draining")
+                    backend.state = DRAINING
+            else:
+                backend.consecutive_failures = 0
+                if tokens and streaming_seconds > 0:
+                    rate = tokens / streaming_seconds
+                    backend.tokens_per_sec = rate if backend.tokens_per_sec is None else (
+                        self.rate_smoothing * rate + (1 - self.rate_smoothing) * backend.tokens_per_sec)
+            if backend.state == DRAINING and not backend.in_flight:
+                backend.state = RESTARTING
+                restart = True
+        if restart:
+            threading.Thread(target=self._restart, args=(backend,), daemon=True).start()
+
+    def _healthy(self, backend):
+        try:
+            return self.session.get(f"{backend.url}/health", timeout=2).status_code == 200
+        except requests.exceptions.RequestException:
+            return False
+
+    def _restart(self, backend):
+        # The alias is drained, so nothing is cut off; the rest of the pool keeps serving
+        print(f"Restarting inference alias {backend.alias}")
+        try:
+            self.restart_alias(backend.item)
+        except Exception as e:
+            print(f"Restarting inference alias {backend.alias} failed: {e}")
+        deadline = time.monotonic() + self.restart_timeout
+        while time.monotonic() < deadline:
+            if self._healthy(backend):
+                with self.lock:
+                    backend.state = HEALTHY
+                    backend.consecutive_failures = 0
+                    backend.restarts += 1
+                print(f"Inference alias {backend.alias} is back")
+                return
+            time.sleep(2)
+        # Kept out of rotation; refresh() probes it again and brings it back once /health answers
+        with self.lock:
+            backend.state = DOWN
+        print(f"Inference alias {backend.alias} did not come back within {self.restart_timeout:.0f}s, marked down")
+
+    def _stream(self, backend, messages):
+        response = self.session.post(
+            f"{backend.url}/v1/chat/completions",
+            json={"model": backend.model, "messages": messages, "stream": True},
+            stream=True,
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        for line in response.iter_lines(chunk_size=None):
+            if not line.startswith(b"data:"):
+                continue
+            data = line[len(b"data:"):].strip()
+            if data == b"[DONE]":
+                break
+            choices = json.loads(data).get("choices") or [{}]
+            content = (choices[0].get("delta") or {}).get("content")
+            if content:
+                yield content
+
+    def chat(self, model, messages):
+        """Stream a chat completion from the least-loaded alias of `model`
+        (a name from models()) as Ollama-style chunks.
+
+        A request that fails (connection error, timeout or 5xx) before its
+        first token is retried on another alias. Any other error, or a failure
+        once tokens have been sent, is raised as InferenceError.
+        """
+        model = model[len(ROUTED_PREFIX):] if self.routes(model) else model
+        tried = set()
+        while True:
+            backend = self._pick(model, tried)
+            if backend is None:
+                raise NoBackendAvailable(f"No healthy inference alias for {model}")
+            tried.add(backend.alias)
+            started = time.perf_counter()
+            first_token_at = None
+            tokens = 0
+            try:
+                for content in self._stream(backend, messages):
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    tokens += 1
+                    yield {'message': {'content': content}}
+            except Exception as e:
+                failed = is_backend_failure(e)
+                self._finish(backend, failed=failed)
+                if first_token_at is not None or not failed:
+                    raise InferenceError(f"Inference alias {backend.alias}: {e}") from e
+                print(f"Inference alias {backend.alias} failed: {e}")
+                continue
+            except GeneratorExit:
+                # The caller stopped reading; not the backend's fault
+                self._finish(backend, failed=False)
+                raise
+            finished = time.perf_counter()
+            streaming = finished - first_token_at if first_token_at is not None else 0.0
+            self._finish(backend, failed=False, tokens=tokens, streaming_seconds=streaming)
+            yield {
+                'message': {'content': ''},
+                'done': True,
+                'eval_count': tokens,
+                'eval_duration': int(streaming * 1e9),
+                'total_duration': int((finished - started) * 1e9),
+            }
+            return
+
+    def utilization(self):
+        now = time.monotonic()
+        with self.lock:
+            return {
+                backend.alias: {
+                    "model": backend.model,
+                    "state": backend.state,
+                    "in_flight": backend.in_flight,
+                    "requests": backend.requests,
+                    "failures": backend.failures,
+                    "restarts": backend.restarts,
+                    "tokens_per_sec": backend.tokens_per_sec,
+                    "utilization": backend.utilization(now),
+                }
+                for backend in self.backends.values()
+            }
+
+
+def format_utilization(utilization):
+    return "; ".join(
+        f"{alias} {stats['state']}, {stats['in_flight']} in flight, {stats['requests']} requests, "
+        f"{stats['utilization']:.0%} busy, "
+        + (f"{stats['tokens_per_sec']:.1f} tok/s" if stats['tokens_per_sec'] else "no rate yet")
+        for alias, stats in sorted(utilization.items())
+    ) or "no inference aliases"
@@ -0,0 +1,143 @@
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class MicroBatcher:
+    """Gathers concurrent requests into batches.
+
+    The first request of a batch opens a `window` (seconds) during which
+    further requests join it, up to `max_batch`. The batch is then handed to
+    `batch_fn(items)`, which returns one result per item (an Exception instance
+    fails just that item). Identical items in a batch are sent once. Each
+    caller waits on its own future.
+    """
+
+    def __init__(self, batch_fn, max_batch=32, window=0.003, workers=4, name="batch"):
+        self.batch_fn = batch_fn
+        self.max_batch = max_batch
+        self.window = window
+        self.name = name
+        self.queue = queue.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"microbatch-{name}")
+        self.lock = threading.Lock()
+        self.batch_sizes = Counter()
+        self.waits = []  # seconds from submit to dispatch, most recent last
+        self.items = 0
+        self.deduplicated = 0
+        threading.Thread(target=self._run, daemon=True, name=f"microbatch-{name}").start()
+
+    def submit(self, item):
+        future = Future()
+        self.queue.put((item, future, time.perf_counter()))
+        return future
+
+    def __call__(self, item, timeout=None):
+        return self.submit(item).result(timeout)
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            closes_at = time.perf_counter() + self.window
+            while len(batch) < self.max_batch:
+                remaining = closes_at - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            dispatched = time.perf_counter()
+            with self.lock:
+                self.batch_sizes[len(batch)] += 1
+                self.items += len(batch)
+                self.waits.extend(dispatched - submitted for _, _, submitted in batch)
+                del self.waits[:-1000]
+            # Dispatch off this thread so the next window starts collecting now
+            self.executor.submit(self._dispatch, batch)
+
+    def _dispatch(self, batch):
+        unique = list(dict.fromkeys(item for item, _, _ in batch))
+        with self.lock:
+            self.deduplicated += len(batch) - len(unique)
+        try:
+            results = dict(zip(unique, self.batch_fn(unique)))
+        except Exception as e:
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+        for item, future, _ in batch:
+            result = results.get(item)
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def stats(self):
+        with self.lock:
+            batches = sum(self.batch_sizes.values())
+            waits = sorted(self.waits)
+            return {
+                "batches": batches,
+                "items": self.items,
+                "mean_batch_size": self.items / batches if batches else 0.0,
+                "max_batch_size": max(self.batch_sizes) if self.batch_sizes else 0,
+                "deduplicated": self.deduplicated,
+                "added_ms_mean": sum(waits) / len(waits) * 1000 if waits else 0.0,
+                "added_ms_p95": waits[int(0.95 * (len(waits) - 1))] * 1000 if waits else 0.0,
+            }
+
+
+def format_batch_stats(stats):
+    return (f"{stats['items']} requests in {stats['batches']} batches (mean {stats['mean_batch_size']:.1f}, "
+            f"max {stats['max_batch_size']}, {stats['deduplicated']} duplicates), "
+            f"added latency mean {stats['added_ms_mean']:.1f} ms / p95 {stats['added_ms_p95']:.1f} ms")
+
+
+class BurstBatch:
+    """batch_fn that sends each item as its own request, all at once over the
+    client's keep-alive connection pool."""
+
+    def __init__(self, call, workers=16):
+        self.call = call
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="burst")
+
+    def _one(self, item):
+        try:
+            return self.call(*item) if isinstance(item, tuple) else self.call(item)
+        except Exception as e:
+            return e
+
+    def __call__(self, items):
+        if len(items) == 1:
+            return [self._one(items[0])]
+        return list(self.executor.map(self._one, items))
+
+
+class EmbeddingBatch:
+    """batch_fn for embeddings: one call with a list of inputs
+    (`embed_many(texts)` returning one result per text) if the server accepts
+    that, else a burst of single `embed(text)` calls. Which one works is found
+    out on the first multi-item batch."""
+
+    def __init__(self, embed_many, embed, workers=16):
+        self.embed_many = embed_many
+        self.burst = BurstBatch(embed, workers)
+        self.batched = None  # unknown until tried
+
+    def __call__(self, texts):
+        if len(texts) > 1 and self.batched is not False:
+            try:
+                data = self.embed_many(list(texts))
+                if isinstance(data, list) and len(data) == len(texts):
+                    self.batched = True
+                    # Shaped like a single-input response, so callers see no difference
+                    return [[item] for item in data]
+            except Exception as e:
+                if self.batched:
+                    raise
+                print(f"Batched embedding not supported by the server, sending bursts instead: {e}")
+            self.batched = False
+        return self.burst(texts)
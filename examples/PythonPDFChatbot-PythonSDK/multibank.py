@@ -0,0 +1,151 @@
+import asyncio
+import glob
+import heapq
+import itertools
+import json
+import os
+import threading
+from results import get_hits, hit_score
+
+# Shard manifests written by CreatingAMemoryBank/store_files.py --shards; a
+# sharded bank is listed under its logical name and queried across its shards.
+# CHATBOT_SHARD_MANIFEST_DIR points at another directory (store_files.py --shard-dir).
+SHARD_MANIFEST_DIR = os.environ.get("CHATBOT_SHARD_MANIFEST_DIR") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "CreatingAMemoryBank", "shards")
+
+_manifest_cache = {}  # directory -> (mtimes, manifests)
+_manifest_lock = threading.Lock()
+
+
+def _manifest_mtimes(directory):
+    # Cheap to stat on every call; a manifest is only re-read when this changes
+    try:
+        mtimes = [os.path.getmtime(directory)]
+        mtimes += [(path, os.path.getmtime(path)) for path in sorted(glob.glob(os.path.join(directory, "*.manifest.json")))]
+    except OSError:
+        return None
+    return tuple(mtimes)
+
+
+def load_shard_manifests(directory=None):
+    directory = directory or SHARD_MANIFEST_DIR
+    mtimes = _manifest_mtimes(directory)
+    with _manifest_lock:
+        cached = _manifest_cache.get(directory)
+    if cached is not None and mtimes is not None and cached[0] == mtimes:
+        return dict(cached[1])
+    manifests = {}
+    for path in glob.glob(os.path.join(directory, "*.manifest.json")):
+        try:
+            with open(path, "r") as f:
+                manifest = json.load(f)
+            manifests[manifest["memory_bank"]] = [shard["memory_bank"] for shard in manifest["shards"]]
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Skipping shard manifest {path}: {e}")
+    with _manifest_lock:
+        _manifest_cache[directory] = (mtimes, manifests)
+    return dict(manifests)
+
+
+def expand_banks(selected, manifests=None):
+    # [(bank to query, bank to report)], with logical sharded banks replaced by their shards
+    if isinstance(selected, str):
+        selected = [selected]
+    manifests = load_shard_manifests() if manifests is None else manifests
+    banks = []
+    for bank in selected or []:
+        for physical in manifests.get(bank, [bank]):
+            banks.append((physical, bank))
+    return banks
+
+
+def merge_top_k(results, limit):
+    """Merge per-bank query results into the `limit` best hits by score.
+
+    `results` maps (bank, label) to a query response. A bounded min-heap keeps
+    the merge at O(n log k); each hit is tagged with the bank it came from.
+    """
+    heap = []
+    counter = itertools.count()
+    for (bank, label), data in results.items():
+        for hit in get_hits(data):
+            tagged = {**hit, "memory_bank": label} if isinstance(hit, dict) else {"text": hit, "memory_bank": label}
+            if bank != label:
+                tagged["shard"] = bank
+            entry = (hit_score(tagged), next(counter), tagged)
+            if len(heap) < limit:
+                heapq.heappush(heap, entry)
+            elif entry[0] > heap[0][0]:
+                heapq.heapreplace(heap, entry)
+    return [hit for _, _, hit in sorted(heap, key=lambda entry: (-entry[0], entry[1]))]
+
+
+async def _call(fn, *args):
+    if asyncio.iscoroutinefunction(fn):
+        return await fn(*args)
+    # A thread of its own rather than a shared pool: a call given up on keeps
+    # running until its own HTTP timeout, and must not hold up later queries
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def run():
+        try:
+            result, error = fn(*args), None
+        except Exception as e:
+            result, error = None, e
+        try:
+            loop.call_soon_threadsafe(_resolve, future, result, error)
+        except RuntimeError:
+            pass  # the query already returned and its event loop is closed
+
+    threading.Thread(target=run, daemon=True, name="multibank").start()
+    return await future
+
+
+def _resolve(future, result, error):
+    if future.done():
+        return  # timed out or cancelled meanwhile
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+async def query_banks(query, banks, limit, query_fn, bank_timeout=None, deadline=8.0):
+    """Query several memory banks concurrently and merge the top `limit` hits.
+
+    `banks` is a list of (bank, label) pairs as from expand_banks and
+    `query_fn(query, bank, limit)` returns one bank's response (plain function
+    or coroutine function). Whatever has arrived when `deadline` passes is
+    returned; a `bank_timeout` shorter than that gives up on a slow bank
+    earlier. Returns (hits, status) where status maps each bank to "ok",
+    "timeout", "deadline" or the error.
+    """
+    def bounded(bank):
+        call = _call(query_fn, query, bank, limit)
+        if bank_timeout is not None and bank_timeout < deadline:
+            return asyncio.wait_for(call, bank_timeout)
+        return call
+
+    tasks = {asyncio.ensure_future(bounded(bank)): (bank, label) for bank, label in banks}
+    done, pending = await asyncio.wait(tasks, timeout=deadline) if tasks else (set(), set())
+
+    status = {}
+    results = {}
+    for task in pending:
+        task.cancel()
+        status[tasks[task][0]] = "deadline"
+    for task in done:
+        bank = tasks[task]
+        try:
+            results[bank] = task.result()
+            status[bank[0]] = "ok"
+        except asyncio.TimeoutError:
+            status[bank[0]] = "timeout"
+        except Exception as e:
+            status[bank[0]] = f"error: {e}"
+    return merge_top_k(results, limit), status
+
+
+def query_banks_sync(query, banks, limit, query_fn, bank_timeout=None, deadline=8.0):
+    return asyncio.run(query_banks(query, banks, limit, query_fn, bank_timeout, deadline))
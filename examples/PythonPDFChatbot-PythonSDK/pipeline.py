@@ -0,0 +1,117 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from results import get_hits, with_hits, hit_key, hit_score
+
+# sequential:  rewrite, then retrieve on the keywords (original behaviour)
+# speculative: retrieve on the raw message while the rewrite runs, and use
+#              that result; keywords are only kept if the rewrite beat it
+# merge:       as speculative, but if the rewrite finishes within
+#              `rewrite_budget` seconds also retrieve on the keywords and
+#              merge both result sets
+PIPELINE_MODES = ["sequential", "speculative", "merge"]
+
+# Blocking calls (Ollama, requests) run here. A dedicated pool rather than the
+# loop's default executor, so asyncio.run() does not wait on an abandoned
+# rewrite before returning.
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="pipeline")
+
+
+async def _call(fn, *args):
+    if asyncio.iscoroutinefunction(fn):
+        return await fn(*args)
+    return await asyncio.get_running_loop().run_in_executor(_executor, fn, *args)
+
+
+async def _timed(timings, name, fn, *args):
+    start = time.perf_counter()
+    try:
+        return await _call(fn, *args)
+    finally:
+        timings[name] = (time.perf_counter() - start) * 1000
+
+
+def _consume_rewrite(task):
+    # Done-callback on the rewrite task: its outcome is always retrieved, so a
+    # rewrite that fails after the pipeline stopped waiting is logged here
+    # rather than as "Task exception was never retrieved"
+    if not task.cancelled() and task.exception() is not None:
+        print(f"Keyword rewrite failed: {task.exception()}")
+
+
+def merge_results(primary, secondary, limit=None):
+    # Union of both hit lists, de-duplicated by chunk, best score first
+    merged = {}
+    for hit in get_hits(primary) + get_hits(secondary):
+        key = hit_key(hit)
+        if key not in merged or hit_score(hit) > hit_score(merged[key]):
+            merged[key] = hit
+    hits = sorted(merged.values(), key=hit_score, reverse=True)
+    if limit:
+        hits = hits[:limit]
+    return with_hits(primary if primary is not None else secondary, hits)
+
+
+async def run_pipeline(message, rewrite, retrieve, mode="merge", rewrite_budget=1.0, limit=None):
+    """Produce (keywords, retrieved_data, timings) for a chat turn.
+
+    `rewrite(message)` returns retrieval keywords and `retrieve(query)` returns
+    a query response; either may be a plain function (run in a worker thread)
+    or a coroutine function. `timings` holds the per-stage durations in ms.
+    """
+    if mode not in PIPELINE_MODES:
+        raise ValueError(f"Unknown pipeline mode: {mode}")
+
+    timings = {}
+    start = time.perf_counter()
+
+    if mode == "sequential":
+        keywords = await _timed(timings, "rewrite_ms", rewrite, message)
+        retrieved_data = await _timed(timings, "retrieval_ms", retrieve, keywords)
+        timings["total_ms"] = (time.perf_counter() - start) * 1000
+        return keywords, retrieved_data, timings
+
+    rewrite_task = asyncio.create_task(_timed(timings, "rewrite_ms", rewrite, message))
+    rewrite_task.add_done_callback(_consume_rewrite)
+    speculative = await _timed(timings, "speculative_retrieval_ms", retrieve, message)
+
+    keywords = None
+    if rewrite_task.done() and not rewrite_task.exception():
+        keywords = rewrite_task.result()
+    elif mode == "merge":
+        remaining = max(0.0, rewrite_budget - (time.perf_counter() - start))
+        try:
+            keywords = await asyncio.wait_for(asyncio.shield(rewrite_task), remaining)
+        except asyncio.TimeoutError:
+            pass
+        except Exception:
+            pass  # logged by _consume_rewrite; the speculative retrieval is used alone
+
+    if not rewrite_task.done():
+        # Nobody waits for it any more; its thread finishes in the background
+        timings["rewrite_abandoned"] = True
+        rewrite_task.cancel()
+        try:
+            await rewrite_task
+        except asyncio.CancelledError:
+            pass
+
+    retrieved_data = speculative
+    if mode == "merge" and keywords:
+        keyword_data = await _timed(timings, "retrieval_ms", retrieve, keywords)
+        retrieved_data = merge_results(keyword_data, speculative, limit)
+
+    timings["total_ms"] = (time.perf_counter() - start) * 1000
+    if "rewrite_ms" in timings and not timings.get("rewrite_abandoned"):
+        # What the sequential pipeline would have spent on the same turn
+        sequential_ms = timings["rewrite_ms"] + timings.get("retrieval_ms", timings["speculative_retrieval_ms"])
+        timings["saved_ms"] = sequential_ms - timings["total_ms"]
+    # Snapshot, as an abandoned rewrite still records into `timings` when it ends
+    return keywords, retrieved_data, dict(timings)
+
+
+def format_timings(timings):
+    return ", ".join(
+        f"{name}={value:.0f}" if isinstance(value, float) else f"{name}={value}"
+        for name, value in timings.items()
+    )
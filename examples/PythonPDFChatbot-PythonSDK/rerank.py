@@ -0,0 +1,114 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from results import embedding_vector, get_hits, hit_text, with_hits
+
+
+class EmbeddingCache:
+    """Chunk embeddings keyed by a hash of the chunk text, LRU-bounded.
+
+    Misses are fetched with `embed(text)` (e.g. /api/silk/embedding) on a small
+    thread pool so a result set costs one round of concurrent requests.
+    """
+
+    def __init__(self, embed, max_entries=20000, workers=8):
+        self.embed = embed
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="embedding")
+        self.hits = 0
+        self.misses = 0
+
+    def _fetch(self, text):
+        vector = np.asarray(embedding_vector(self.embed(text)), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get_many(self, texts):
+        keys = [hashlib.sha1(text.encode("utf-8")).hexdigest() for text in texts]
+        vectors = [None] * len(texts)
+        missing = []
+        with self._lock:
+            for i, key in enumerate(keys):
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    vectors[i] = self._entries[key]
+                    self.hits += 1
+                else:
+                    missing.append(i)
+                    self.misses += 1
+
+        for i, vector in zip(missing, self._executor.map(self._fetch, [texts[i] for i in missing])):
+            vectors[i] = vector
+            with self._lock:
+                self._entries[keys[i]] = vector
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return np.vstack(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+
+    def get(self, text):
+        return self.get_many([text])[0]
+
+
+def mmr(query_vector, vectors, k, diversity=0.3):
+    """Maximal Marginal Relevance over unit-normalized vectors.
+
+    Picks, one at a time, the candidate maximizing
+    (1 - diversity) * sim(query, c) - diversity * max sim(c, already picked).
+    Both similarity terms come from two matrix products up front; each step
+    is then a vectorized update. Returns the selected row indices in order.
+    """
+    n = len(vectors)
+    k = min(k, n)
+    if k <= 0:
+        return []
+    relevance = vectors @ query_vector
+    similarity = vectors @ vectors.T
+
+    selected = [int(np.argmax(relevance))]
+    max_similarity = similarity[selected[0]].copy()
+    available = np.ones(n, dtype=bool)
+    available[selected[0]] = False
+    while len(selected) < k:
+        scores = (1 - diversity) * relevance - diversity * max_similarity
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(max_similarity, similarity[best], out=max_similarity)
+    return selected
+
+
+def rerank(retrieved_data, query, k, embeddings, diversity=0.3):
+    """Keep the `k` most relevant yet mutually diverse hits of a query response.
+
+    Returns (reranked response, stats) with the embedding and MMR timings.
+    """
+    hits = [hit for hit in get_hits(retrieved_data) if hit_text(hit).strip()]
+    if len(hits) <= 1:
+        return retrieved_data, {"candidates": len(hits), "kept": len(hits), "embed_ms": 0.0, "mmr_ms": 0.0}
+
+    start = time.perf_counter()
+    try:
+        vectors = embeddings.get_many([hit_text(hit) for hit in hits])
+        query_vector = embeddings.get(str(query))
+    except Exception as e:
+        print(f"Could not embed results, skipping re-ranking: {e}")
+        return with_hits(retrieved_data, hits[:k]), {"candidates": len(hits), "kept": min(k, len(hits)), "embed_ms": 0.0, "mmr_ms": 0.0}
+    embedded = time.perf_counter()
+    order = mmr(query_vector, vectors, k, diversity)
+    done = time.perf_counter()
+
+    stats = {
+        "candidates": len(hits),
+        "kept": len(order),
+        "embed_ms": (embedded - start) * 1000,
+        "mmr_ms": (done - embedded) * 1000,
+        "embedding_cache_hits": embeddings.hits,
+        "embedding_cache_misses": embeddings.misses,
+    }
+    return with_hits(retrieved_data, [hits[i] for i in order]), stats
@@ -0,0 +1,38 @@
+import time
+
+# Default cap on tokens buffered between UI updates, for models that stream
+# faster than the frame rate
+FLUSH_TOKENS = 64
+
+
+def stream_reply(history, message, chunks, updates_per_sec=20.0, flush_tokens=FLUSH_TOKENS):
+    """Stream an Ollama chat response into the chat history.
+
+    Tokens are buffered and the history is yielded at most `updates_per_sec`
+    times a second (0 = every token), or once `flush_tokens` tokens are waiting.
+    The turn is appended to `history` in place and the same list is yielded on
+    every update, only its last entry replaced, so each update costs one join
+    of the buffered tokens instead of a copy of the history and the response.
+    Gradio renders each yielded value before asking for the next one, so
+    reusing the list between yields is safe.
+    """
+    history = history if history is not None else []
+    history.append(("Human", message))
+    history.append(("AI", ""))
+    interval = 1.0 / updates_per_sec if updates_per_sec else 0.0
+    response = ""
+    buffer = []
+    next_update = time.monotonic() + interval
+    for chunk in chunks:
+        buffer.append(chunk['message']['content'])
+        if len(buffer) < flush_tokens and interval and time.monotonic() < next_update:
+            continue
+        response += "".join(buffer)
+        buffer.clear()
+        history[-1] = ("AI", response)
+        yield history
+        next_update = time.monotonic() + interval
+    if buffer or not response:
+        response += "".join(buffer)
+        history[-1] = ("AI", response)
+        yield history
@@ -0,0 +1,252 @@
+# Per-stage spans and in-process histograms for the chat pipeline.
+#
+# Both are off by default; a disabled span() or observe() is a flag check and
+# returns a shared no-op object. Enable them with environment variables:
+#
+#   CHATBOT_METRICS_PORT=9464  record histograms, served at http://localhost:9464/metrics
+#   CHATBOT_TRACING=otel       also emit spans through OpenTelemetry (needs
+#                              opentelemetry-api plus an SDK and exporter set up)
+import bisect
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+MS_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+BYTES_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+RATE_BUCKETS = (1, 2, 5, 10, 20, 30, 50, 75, 100, 200)
+
+_metrics_enabled = False
+_tracer = None
+_active = False
+
+REGISTRY = {}
+_registry_lock = threading.Lock()
+
+
+class Histogram:
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        if not _metrics_enabled or value is None:
+            return
+        # Prometheus buckets are inclusive upper bounds
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def render(self):
+        with self.lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {count}')
+        lines.append(f"{self.name}_sum {total}")
+        lines.append(f"{self.name}_count {count}")
+        return "\n".join(lines)
+
+
+def histogram(name, help, buckets=MS_BUCKETS):
+    with _registry_lock:
+        if name not in REGISTRY:
+            REGISTRY[name] = Histogram(name, help, buckets)
+        return REGISTRY[name]
+
+
+class Gauge:
+    # Value read from `read()` at scrape time; `kind` "counter" for running totals
+    def __init__(self, name, help, read, kind="gauge"):
+        self.name = name
+        self.help = help
+        self.read = read
+        self.kind = kind
+
+    def render(self):
+        return f"# HELP {self.name} {self.help}\n# TYPE {self.name} {self.kind}\n{self.name} {self.read()}"
+
+
+def gauge(name, help, read, kind="gauge"):
+    with _registry_lock:
+        REGISTRY[name] = Gauge(name, help, read, kind)
+        return REGISTRY[name]
+
+
+REWRITE_MS = histogram("chat_rewrite_milliseconds", "Keyword rewrite time")
+RETRIEVAL_MS = histogram("chat_retrieval_milliseconds", "Memory bank retrieval time")
+RERANK_MS = histogram("chat_rerank_milliseconds", "MMR re-rank time including embeddings")
+PROMPT_BUILD_MS = histogram("chat_prompt_build_milliseconds", "Context packing and prompt assembly time")
+RESULT_BYTES = histogram("chat_result_bytes", "Size of the retrieved results", BYTES_BUCKETS)
+PROMPT_TOKENS = histogram("chat_prompt_tokens", "Prompt tokens sent to the LLM", TOKEN_BUCKETS)
+TTFT_MS = histogram("chat_time_to_first_token_milliseconds", "Time from the LLM request to the first streamed token")
+GENERATION_MS = histogram("chat_generation_milliseconds", "Time from the LLM request to the last streamed token")
+TOKENS_PER_SEC = histogram("chat_generation_tokens_per_second", "LLM generation rate", RATE_BUCKETS)
+RETRIEVAL_QUEUE_WAIT_MS = histogram("chat_retrieval_queue_wait_milliseconds", "Wait for a retrieval slot")
+GENERATION_QUEUE_WAIT_MS = histogram("chat_generation_queue_wait_milliseconds", "Wait for a generation slot")
+AGENT_ROUNDS = histogram("chat_agent_rounds", "LLM rounds per agent-mode turn", (1, 2, 3, 4, 6, 8))
+RESULTS_USED = histogram("chat_results_used", "Results kept per turn by the adaptive limit", (1, 2, 3, 5, 8, 10, 15, 20, 30, 50))
+AGENT_TOKENS_NOT_RESENT = histogram("chat_agent_tokens_not_resent", "Context tokens an agent-mode turn did not send again", TOKEN_BUCKETS)
+
+
+class _NoopSpan:
+    elapsed_ms = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set_attribute(self, key, value):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    def __init__(self, name, metric, attributes):
+        self.name = name
+        self.metric = metric
+        self.attributes = attributes
+        self.otel_span = None
+        self.elapsed_ms = None
+
+    def __enter__(self):
+        if _tracer is not None:
+            # Not made the current span: Gradio may resume a streaming generator
+            # on another thread, where detaching the context would fail
+            self.otel_span = _tracer.start_span(self.name, attributes=self.attributes)
+        self.start = time.perf_counter()
+        return self
+
+    def set_attribute(self, key, value):
+        if self.otel_span is not None:
+            self.otel_span.set_attribute(key, value)
+
+    def __exit__(self, exc_type, exc, tb):
+        self.elapsed_ms = (time.perf_counter() - self.start) * 1000
+        if self.metric is not None:
+            self.metric.observe(self.elapsed_ms)
+        if self.otel_span is not None:
+            if exc is not None:
+                self.otel_span.record_exception(exc)
+            self.otel_span.end()
+        return False
+
+
+def span(name, metric=None, **attributes):
+    """Time a stage: `with span("chat.retrieve", RETRIEVAL_MS, memory_bank=bank): ...`
+
+    The elapsed time goes into `metric` (a Histogram) and, with tracing on,
+    an OpenTelemetry span with the given attributes is emitted.
+    """
+    if not _active:
+        return _NOOP_SPAN
+    return Span(name, metric, attributes)
+
+
+def metrics_enabled():
+    return _metrics_enabled
+
+
+def result_bytes(data):
+    # Only worth serializing when someone is collecting it
+    if _metrics_enabled:
+        RESULT_BYTES.observe(len(json.dumps(data, default=str)))
+
+
+def instrument_stream(stream, prompt_tokens=None, **attributes):
+    """Pass through an Ollama chat stream, recording TTFT, generation time,
+    tokens/sec and prompt tokens (Ollama's own counts from the final chunk
+    when present, else `prompt_tokens` and the number of chunks)."""
+    if not _active:
+        yield from stream
+        return
+    with span("chat.generate", GENERATION_MS, **attributes) as generation:
+        start = time.perf_counter()
+        first_token_at = None
+        chunks = 0
+        last = None
+        for chunk in stream:
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+                TTFT_MS.observe((first_token_at - start) * 1000)
+            chunks += 1
+            last = chunk
+            yield chunk
+        if last is not None and last.get('done'):
+            prompt_tokens = last.get('prompt_eval_count') or prompt_tokens
+            if last.get('eval_count') and last.get('eval_duration'):
+                TOKENS_PER_SEC.observe(last['eval_count'] / (last['eval_duration'] / 1e9))
+                chunks = None
+        if chunks and first_token_at is not None:
+            streaming_s = time.perf_counter() - first_token_at
+            if streaming_s > 0:
+                TOKENS_PER_SEC.observe(chunks / streaming_s)
+        PROMPT_TOKENS.observe(prompt_tokens)
+        generation.set_attribute("prompt_tokens", prompt_tokens or 0)
+
+
+def render_metrics():
+    with _registry_lock:
+        metrics = list(REGISTRY.values())
+    return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+def start_metrics_server(port=9464, host="127.0.0.1"):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render_metrics().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def configure(metrics=False, tracing=None):
+    global _metrics_enabled, _tracer, _active
+    _metrics_enabled = bool(metrics)
+    _tracer = None
+    if tracing == "otel":
+        try:
+            from opentelemetry import trace
+            _tracer = trace.get_tracer("dabarqus.chatbot")
+        except ImportError:
+            print("CHATBOT_TRACING=otel but opentelemetry-api is not installed; tracing disabled")
+    _active = _metrics_enabled or _tracer is not None
+
+
+def configure_from_env():
+    port = os.environ.get("CHATBOT_METRICS_PORT")
+    configure(metrics=bool(port), tracing=os.environ.get("CHATBOT_TRACING"))
+    if port:
+        # Local only unless CHATBOT_METRICS_HOST asks for more (e.g. 0.0.0.0 for a remote scraper)
+        host = os.environ.get("CHATBOT_METRICS_HOST", "127.0.0.1")
+        start_metrics_server(int(port), host)
+        print(f"Metrics at http://{host}:{port}/metrics")
@@ -0,0 +1,137 @@
+import json
+import threading
+from collections import deque
+from context_packer import estimate_tokens, format_hit
+from results import get_hits, hit_score, with_hits
+
+# Adaptive number of results. A small first page is fetched and its score
+# curve examined: results are kept while their score stays within
+# `min_relative` of the top score and no gap between neighbouring scores is
+# larger than the gap threshold. Only when every result on the page passed
+# (the tail is still relevant) is the full page, the limit set in the UI,
+# fetched and cut the same way. The query API has no offset, so the full page
+# re-fetches the first one.
+#
+# The gap threshold is learned: once enough turns have been seen it is the
+# `gap_percentile` of the recent gaps between neighbouring scores, so a cut
+# happens at a drop that is unusual for this memory bank. Until then the
+# configured `gap` is used.
+#
+# A turn may retrieve more than once (the speculative and keyword retrievals of
+# the merge pipeline), so retrieve() only tallies into the turn's record and
+# record() adds it to the stats once, with the results the prompt actually used.
+
+
+class AdaptiveLimit:
+    def __init__(self, first_page=3, min_relative=0.8, gap=0.05, gap_percentile=90, min_gap_samples=50):
+        self.first_page = first_page
+        self.min_relative = min_relative
+        self.gap = gap
+        self.gap_percentile = gap_percentile
+        self.min_gap_samples = min_gap_samples
+        self.gaps = deque(maxlen=1000)
+        self.lock = threading.Lock()
+        self.turns = 0
+        self.fetches = 0
+        self.used = 0
+        self.fetched = 0
+        self.bytes = 0
+        self.prompt_tokens = 0
+        self.fixed_bytes = 0.0
+        self.fixed_prompt_tokens = 0.0
+
+    def gap_threshold(self):
+        with self.lock:
+            if len(self.gaps) < self.min_gap_samples:
+                return self.gap
+            gaps = sorted(self.gaps)
+        return gaps[min(len(gaps) - 1, int(self.gap_percentile / 100 * len(gaps)))]
+
+    def cutoff(self, hits):
+        """Number of leading hits (sorted best first) worth keeping."""
+        if not hits:
+            return 0
+        top = hit_score(hits[0])
+        gap = self.gap_threshold()
+        kept = 1
+        for previous, hit in zip(hits, hits[1:]):
+            score = hit_score(hit)
+            if top > 0 and score < self.min_relative * top:
+                break
+            if hit_score(previous) - score > gap:
+                break
+            kept += 1
+        return kept
+
+    def new_turn(self):
+        return {"fetches": 0, "bytes": 0, "fetched": 0, "fixed_bytes": 0.0, "fixed_prompt_tokens": 0.0, "gaps": []}
+
+    def retrieve(self, query, fetch, limit, turn):
+        """Fetch with `fetch(query, limit)`, a small page first and `limit`
+        results only if needed, and return the response holding only the
+        relevant leading results. The cost is tallied into `turn`."""
+        page = min(self.first_page, limit)
+        while True:
+            data = fetch(query, page)
+            last_bytes = len(json.dumps(data, default=str))
+            turn["fetches"] += 1
+            turn["bytes"] += last_bytes
+            hits = sorted(get_hits(data), key=hit_score, reverse=True)
+            kept = self.cutoff(hits)
+            # A short page means the bank has no more; a cut means the tail stopped being relevant
+            if kept < len(hits) or len(hits) < page or page >= limit:
+                break
+            page = limit
+        scores = [hit_score(hit) for hit in hits]
+        turn["gaps"].extend(a - b for a, b in zip(scores, scores[1:]))
+        turn["fetched"] += len(hits)
+        # What one request at the fixed limit would have cost, from this retrieval's per-result averages
+        fixed_count = len(hits) if len(hits) < page else limit
+        tokens = [estimate_tokens(format_hit(i + 1, hit)) for i, hit in enumerate(hits)]
+        turn["fixed_bytes"] += (last_bytes / len(hits) if hits else 0.0) * fixed_count
+        # Merged retrievals share one prompt, so the fixed limit's prompt is the largest of them
+        turn["fixed_prompt_tokens"] = max(turn["fixed_prompt_tokens"],
+                                          (sum(tokens) / len(tokens) if tokens else 0.0) * fixed_count)
+        return with_hits(data, hits[:kept])
+
+    def record(self, turn, data):
+        """Add a turn to the stats; `data` is the response the prompt is built from."""
+        used = get_hits(data)
+        prompt_tokens = sum(estimate_tokens(format_hit(i + 1, hit)) for i, hit in enumerate(used))
+        with self.lock:
+            self.gaps.extend(turn["gaps"])
+            self.turns += 1
+            self.fetches += turn["fetches"]
+            self.used += len(used)
+            self.fetched += turn["fetched"]
+            self.bytes += turn["bytes"]
+            self.prompt_tokens += prompt_tokens
+            self.fixed_bytes += turn["fixed_bytes"]
+            self.fixed_prompt_tokens += turn["fixed_prompt_tokens"]
+
+    def stats(self):
+        gap_threshold = self.gap_threshold()
+        with self.lock:
+            turns = self.turns or 1
+            return {
+                "turns": self.turns,
+                "mean_used": self.used / turns,
+                "mean_fetched": self.fetched / turns,
+                "fetches_per_turn": self.fetches / turns,
+                "bytes": self.bytes,
+                "fixed_bytes": self.fixed_bytes,
+                "prompt_tokens": self.prompt_tokens,
+                "fixed_prompt_tokens": self.fixed_prompt_tokens,
+                "gap_threshold": gap_threshold,
+            }
+
+
+def format_adaptive(stats):
+    def saved(actual, fixed):
+        return f"{actual / fixed - 1:+.0%}" if fixed else "n/a"
+
+    return (f"{stats['mean_used']:.1f} results used per turn (of {stats['mean_fetched']:.1f} fetched, "
+            f"{stats['fetches_per_turn']:.1f} requests); {stats['bytes'] / 1024:.1f} KB transferred vs "
+            f"~{stats['fixed_bytes'] / 1024:.1f} KB with the fixed limit ({saved(stats['bytes'], stats['fixed_bytes'])}); "
+            f"{stats['prompt_tokens']} prompt tokens vs ~{stats['fixed_prompt_tokens']:.0f} "
+            f"({saved(stats['prompt_tokens'], stats['fixed_prompt_tokens'])}); gap threshold {stats['gap_threshold']:.3f}")
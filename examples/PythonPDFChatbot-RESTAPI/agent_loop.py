@@ -0,0 +1,163 @@
+import os
+import re
+import time
+from context_packer import estimate_tokens, format_hit
+from results import get_hits, hit_key, hit_score, hit_text
+
+# The evaluation loop from sample_prompt.md as a pipeline mode. Each round the
+# LLM sees results and answers REPROMPT (more results for the same keywords),
+# NEW KEYWORDS: ... or ACCEPT followed by its answer. The chat API is stateless,
+# so each round is one request of its own: the evaluation prompt with only the
+# results not sent before, plus a short note of the keywords and pages already
+# seen, instead of the whole conversation with every earlier page again.
+AGENT_MODE = "agent"
+
+SAMPLE_PROMPT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sample_prompt.md")
+
+# The sample prompt spells it "ACCECPT"; accept either
+_ACCEPT = re.compile(r"^\W*ACCE?C?PT\W*", re.IGNORECASE)
+_NEW_KEYWORDS = re.compile(r"^\W*NEW KEYWORDS\W*:?\s*(.*)", re.IGNORECASE)
+_REPROMPT = re.compile(r"^\W*REPROMPT", re.IGNORECASE)
+
+
+def load_evaluation_prompt(path=SAMPLE_PROMPT_PATH):
+    with open(path, "r") as f:
+        return f.read()
+
+
+def parse_decision(first_line):
+    # ("accept" | "reprompt" | "new_keywords" | None, new keywords)
+    if _ACCEPT.match(first_line):
+        return "accept", None
+    match = _NEW_KEYWORDS.match(first_line)
+    if match:
+        return "new_keywords", match.group(1).strip()
+    if _REPROMPT.match(first_line):
+        return "reprompt", None
+    return None, None
+
+
+class WorkingSet:
+    """Results seen so far in one turn, numbered in the order they were sent."""
+
+    def __init__(self, token_budget=0):
+        self.token_budget = token_budget
+        self.keys = set()
+        self.count = 0
+        self.sent_tokens = 0
+
+    def add(self, retrieved_data):
+        # Context block of the hits not sent yet, best score first
+        lines = []
+        used = 0
+        for hit in sorted(get_hits(retrieved_data), key=hit_score, reverse=True):
+            key = hit_key(hit)
+            if key in self.keys or not hit_text(hit).strip():
+                continue
+            line = format_hit(self.count + 1, hit)
+            tokens = estimate_tokens(line) + 1
+            if self.token_budget and used + tokens > self.token_budget:
+                break
+            self.keys.add(key)
+            self.count += 1
+            lines.append(line)
+            used += tokens
+        self.sent_tokens += used
+        return "\n".join(lines)
+
+
+def _first_line_then_rest(chunks):
+    """Read a streamed reply until its first line is complete.
+
+    Returns (first line, text already received after it, remaining chunks)."""
+    received = ""
+    for chunk in chunks:
+        received += chunk['message']['content']
+        if "\n" in received.lstrip():
+            stripped = received.lstrip()
+            first, rest = stripped.split("\n", 1)
+            return first, rest, chunks
+    return received.strip(), "", iter(())
+
+
+def _seen_note(seen, count):
+    # "Already seen: 2 pages for 'a b', 1 page for 'c' (12 results)"
+    pages = ", ".join(f"{n} page{'s' if n > 1 else ''} for '{keywords}'" for keywords, n in seen.items())
+    return f"\n\nAlready seen in earlier rounds (not repeated here): {pages} ({count} results)."
+
+
+def run_agent_loop(message, keywords, retrieve, chat, evaluation_prompt, page_size=5, max_rounds=4,
+                   max_seconds=30.0, token_budget=0, stats=None):
+    """Yield Ollama-style chunks of the final answer.
+
+    `retrieve(keywords, limit)` returns a query response and `chat(messages)`
+    an Ollama chat stream. The query API has no offset, so page n is fetched
+    with limit n * page_size and only hits not in the working set are sent.
+    `stats` (a dict) is filled with rounds, pages, results sent, why the loop
+    stopped, the prompt tokens sent, and the context tokens that re-sending
+    every earlier page each round would have added.
+    """
+    stats = stats if stats is not None else {}
+    start = time.perf_counter()
+    working_set = WorkingSet(token_budget)
+    page = 1
+    seen = {}  # keywords -> pages sent in earlier rounds
+    cumulative_tokens = 0  # what re-sending all context so far each round would cost
+    prompt_tokens = 0
+    exhausted = False
+    stats.update(rounds=0, pages=1, stop="accept")
+
+    sent_before = 0  # results sent in earlier rounds
+    context = working_set.add(retrieve(keywords, page_size))
+
+    while True:
+        stats["rounds"] += 1
+        cumulative_tokens += working_set.sent_tokens
+        final = True
+        if exhausted:
+            stats["stop"] = "exhausted"
+        elif stats["rounds"] >= max_rounds:
+            stats["stop"] = "max_rounds"
+        elif time.perf_counter() - start >= max_seconds:
+            stats["stop"] = "max_seconds"
+        else:
+            final = False
+        content = (evaluation_prompt.replace("{RAG_response}", context or "(no new results)")
+                   .replace("{original_prompt}", message)
+                   .replace("{keywords}", keywords))
+        if seen:
+            content += _seen_note(seen, sent_before)
+        if final:
+            content += "\n\nStop searching. Say ACCEPT, then answer the original prompt using the context you have."
+        prompt_tokens += estimate_tokens(content)
+
+        first, rest, chunks = _first_line_then_rest(chat([{"role": "user", "content": content}]))
+        decision, new_keywords = parse_decision(first)
+        if final or decision in (None, "accept"):
+            # Stream the answer; a reply that is not a decision is taken as the answer
+            if decision != "accept":
+                rest = first + "\n" + rest
+            if rest:
+                yield {'message': {'content': rest}}
+            yield from chunks
+            break
+
+        # Stop the model generating the rest of a REPROMPT / NEW KEYWORDS reply
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+        seen[keywords] = seen.get(keywords, 0) + 1
+        if decision == "new_keywords" and new_keywords:
+            keywords, page = new_keywords, 1
+        else:
+            page += 1
+        sent_before = working_set.count
+        context = working_set.add(retrieve(keywords, page * page_size))
+        stats["pages"] += 1
+        exhausted = not context
+
+    stats["results_sent"] = working_set.count
+    stats["tokens_sent"] = prompt_tokens
+    # Each page went out once; a growing conversation would have carried every earlier page again
+    stats["tokens_not_resent"] = cumulative_tokens - working_set.sent_tokens
+    stats["elapsed_ms"] = (time.perf_counter() - start) * 1000
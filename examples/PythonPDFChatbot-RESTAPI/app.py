@@ -1,10 +1,63 @@
 import gradio as gr
 import ollama
-from retriever import retrieve_data, convert_prompt_to_retrieval_prompt
+from retriever import retrieve_data, get_retrieval_keywords, local_replicas, search_local_replica, embedding_batcher, query_batcher
+from microbatch import format_batch_stats
+from pipeline import run_pipeline, format_timings, PIPELINE_MODES
+from multibank import expand_banks, load_shard_manifests, query_banks_sync
+from context_packer import pack_context, estimate_tokens
+from rerank import EmbeddingCache, rerank
+from adaptive_limit import AdaptiveLimit, format_adaptive
+from results import get_hits
+from streaming import stream_reply
+from startup import BackgroundChoices, Prewarmer, parse_duration
+from admission import Busy, controllers_from_env, user_key
+from agent_loop import AGENT_MODE, load_evaluation_prompt, run_agent_loop
+from conversation_store import ConversationStore, to_history, to_messages
+from dabarqus_client import get_client
+import telemetry
 import requests
+import asyncio
+import time
+import threading
 import json
 import os
-from datetime import datetime
+
+# Chunk embeddings for diversity re-ranking, keyed by content hash
+embedding_cache = EmbeddingCache(embedding_batcher)
+
+# Number of results per turn chosen from the score curve when adaptive results are on
+adaptive_limit = AdaptiveLimit()
+
+# Stage spans and /metrics, off unless CHATBOT_METRICS_PORT / CHATBOT_TRACING are set
+telemetry.configure_from_env()
+
+# How long Ollama keeps the model loaded after a turn or a pre-warm
+MODEL_KEEP_ALIVE = "30m"
+
+# Separate concurrency limits and fair wait queues for retrieval and generation
+retrieval_admission, generation_admission = controllers_from_env(
+    telemetry.RETRIEVAL_QUEUE_WAIT_MS, telemetry.GENERATION_QUEUE_WAIT_MS,
+)
+for admission in (retrieval_admission, generation_admission):
+    telemetry.gauge(f"chat_{admission.name}_queue_depth", f"Turns waiting for a {admission.name} slot",
+                    lambda admission=admission: admission.waiting)
+    telemetry.gauge(f"chat_{admission.name}_active", f"Turns holding a {admission.name} slot",
+                    lambda admission=admission: admission.active)
+    telemetry.gauge(f"chat_{admission.name}_shed_total", f"Turns turned away at {admission.name}",
+                    lambda admission=admission: admission.shed + admission.timed_out, kind="counter")
+BUSY_MESSAGE = "The assistant is busy with other requests right now. Please try again in a moment."
+
+# Every turn is appended to conversations/. The prompt carries the most recent
+# turns that fit HISTORY_TOKEN_BUDGET plus a rolling summary of older ones, and
+# the chat shows DISPLAY_TURNS turns at a time.
+conversation_store = ConversationStore()
+HISTORY_TOKEN_BUDGET = 1500
+DISPLAY_TURNS = 20
+active_conversations = {}  # browser session -> conversation id
+SUMMARY_USER = "conversation summaries"  # admission queue key shared by background summaries
+
+# Warm-up state of the model and memory banks, used to label turns cold or warm
+prewarmer = Prewarmer(keep_alive=parse_duration(MODEL_KEEP_ALIVE))
 
 def check_dependencies():
     errors = []
@@ -17,9 +70,9 @@ def check_dependencies():
     
     # Check Dabarqus
     try:
-        response = requests.get("http://localhost:6568/health")
-        if response.status_code != 200:
-            errors.append("Dabarqus is not responding properly.")
+        get_client().health()
+    except requests.HTTPError:
+        errors.append("Dabarqus is not responding properly.")
     except requests.RequestException:
         errors.append("Dabarqus is not running or installed properly.")
     
@@ -46,71 +99,257 @@ def get_ollama_models():
 
 
 def get_memory_banks():
-    url = "http://localhost:6568/api/silk/memorybanks"
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        memory_banks = response.json()
+        memory_banks = get_client().get_memory_banks()
 
-        return [bank.get('name') for bank in memory_banks['SilkMemoryBanks'] if bank.get('name')]
+        names = [bank.get('name') for bank in memory_banks if bank.get('name')]
+        # Sharded banks are also offered under their logical name
+        return names + [name for name in load_shard_manifests() if name not in names]
     except requests.exceptions.RequestException as e:
         print(f"Error fetching memory banks: {e}")
         return ["Default"]  # Return a default option if the API call fails
 
 
-def chat_function(message, history, memory_bank, model, query_limit, retrieval_prompt_template, full_prompt_template):
-    # Convert the user's message to a retrieval prompt
-    retrieval_prompt = convert_prompt_to_retrieval_prompt(message, retrieval_prompt_template)
-    
-    # Retrieve data
-    retrieved_data = retrieve_data(retrieval_prompt, memory_bank, int(query_limit))
+def make_retriever(memory_bank, query_limit):
+    # One bank goes straight to retrieve_data; several banks (or a sharded one) are queried concurrently
+    banks = expand_banks(memory_bank)
+    if len(banks) == 1:
+        bank = banks[0][0]
+        # A local snapshot of the bank answers in-process; it is refreshed when an ingestion completes
+        if local_replicas.get(bank) is not None:
+            return lambda query: search_local_replica(query, bank, query_limit)
+        return lambda query: retrieve_data(query, bank, query_limit)
+
+    def retrieve_from_banks(query):
+        hits, status = query_banks_sync(
+            query, banks, query_limit,
+            lambda q, bank, limit: retrieve_data(q, bank, limit, show_spinner=False),
+        )
+        print(f"Queried {len(banks)} memory banks: {status}")
+        return hits
+
+    return retrieve_from_banks
+
+
+def build_prompt(message, memory_bank, model, query_limit, retrieval_prompt_template, full_prompt_template, pipeline_mode, context_budget, rerank_mmr, adaptive_results=False):
+    # With re-ranking, fetch extra candidates and keep the most relevant diverse subset
+    fetch_limit = min(50, 3 * int(query_limit)) if rerank_mmr else int(query_limit)
+    retrieve = make_retriever(memory_bank, fetch_limit)
+    if adaptive_results:
+        # A small page first; up to fetch_limit only while the scores stay close to the top one
+        adaptive_turn = adaptive_limit.new_turn()
+        retrieve = lambda query: adaptive_limit.retrieve(
+            query, lambda q, limit: make_retriever(memory_bank, limit)(q), fetch_limit, adaptive_turn,
+        )
+    if pipeline_mode == "sequential":
+        # Convert the user's message to a retrieval prompt
+        with telemetry.span("chat.rewrite", telemetry.REWRITE_MS, model=model):
+            retrieval_prompt = get_retrieval_keywords(message, retrieval_prompt_template)
+
+        # Retrieve data
+        with telemetry.span("chat.retrieve", telemetry.RETRIEVAL_MS, limit=fetch_limit):
+            retrieved_data = retrieve(retrieval_prompt)
+    else:
+        # Run the keyword rewrite concurrently with a speculative retrieval on the raw message
+        with telemetry.span("chat.pipeline", pipeline_mode=pipeline_mode) as pipeline_span:
+            retrieval_prompt, retrieved_data, timings = asyncio.run(run_pipeline(
+                message,
+                rewrite=lambda prompt: get_retrieval_keywords(prompt, retrieval_prompt_template),
+                retrieve=retrieve,
+                mode=pipeline_mode,
+                limit=fetch_limit,
+            ))
+            for name, value in timings.items():
+                pipeline_span.set_attribute(name, value)
+        if not timings.get("rewrite_abandoned"):
+            # An abandoned rewrite's time is only how long it ran before being dropped
+            telemetry.REWRITE_MS.observe(timings.get("rewrite_ms"))
+        telemetry.RETRIEVAL_MS.observe(timings.get("retrieval_ms", timings.get("speculative_retrieval_ms")))
+        print(f"Pipeline timings ({pipeline_mode}): {format_timings(timings)}")
+    telemetry.result_bytes(retrieved_data)
+    if adaptive_results:
+        adaptive_limit.record(adaptive_turn, retrieved_data)
+        telemetry.RESULTS_USED.observe(len(get_hits(retrieved_data)))
+        print(f"Adaptive results: {format_adaptive(adaptive_limit.stats())}")
+    print(f"Micro-batching: embeddings {format_batch_stats(embedding_batcher.stats())}; "
+          f"queries {format_batch_stats(query_batcher.stats())}")
     
+    if rerank_mmr:
+        with telemetry.span("chat.rerank", telemetry.RERANK_MS):
+            retrieved_data, reranking = rerank(retrieved_data, retrieval_prompt or message, int(query_limit), embedding_cache)
+        print(f"MMR re-rank: kept {reranking['kept']}/{reranking['candidates']} results "
+              f"(embeddings {reranking['embed_ms']:.0f} ms, MMR {reranking['mmr_ms']:.1f} ms)")
+
     # Prepare the prompt for the LLM
-    full_prompt = f"{full_prompt_template} : RAG_response {retrieved_data}, keywords: {retrieval_prompt}, original_prompt: {message}"
-    
-    # Use Ollama to generate a response
-    response = ""
-    stream = ollama.chat(
-        model=model,
-        messages=[{"role": "system", "content": "You are a helpful assistant."}, 
-                  {"role": "user", "content": full_prompt}],
-        stream=True,
+    with telemetry.span("chat.prompt", telemetry.PROMPT_BUILD_MS, context_budget=int(context_budget)):
+        if context_budget:
+            # De-duplicated, compact context filled best-first up to the token budget
+            rag_context, packing = pack_context(retrieved_data, int(context_budget))
+            print(f"Context: kept {packing['kept']}/{packing['hits']} results ({packing['duplicates']} duplicates, "
+                  f"{packing['over_budget']} over budget), {packing['packed_tokens']} tokens, saved ~{packing['saved_tokens']} prompt tokens")
+        else:
+            rag_context = retrieved_data
+        # The speculative pipeline has no keywords when the rewrite lost the race
+        keywords = f", keywords: {retrieval_prompt}" if retrieval_prompt else ""
+        full_prompt = f"{full_prompt_template} : RAG_response {rag_context}{keywords}, original_prompt: {message}"
+    return full_prompt
+
+
+def session_key(request):
+    return getattr(request, "session_hash", None) or "anonymous"
+
+
+def conversation_for(request):
+    key = session_key(request)
+    if key not in active_conversations:
+        active_conversations[key] = conversation_store.new_conversation(user_key(request))
+    return active_conversations[key]
+
+
+def history_messages(conversation_id):
+    summary, turns, _ = conversation_store.window(conversation_id)
+    return to_messages(summary, turns)
+
+
+def record_turn(conversation_id, message, response, model):
+    conversation_store.append_turn(conversation_id, message, response, model=model)
+
+    def summarize(prompt):
+        # A generation like any other, so it waits for a slot; all summaries share one
+        # place in the round-robin so they cannot crowd out people's turns
+        with generation_admission.slot(SUMMARY_USER):
+            return ollama.chat(model=model, messages=[{"role": "user", "content": prompt}], keep_alive=MODEL_KEEP_ALIVE)['message']['content'].strip()
+
+    def update_summary():
+        try:
+            conversation_store.update_summary(conversation_id, HISTORY_TOKEN_BUDGET, summarize)
+        except Busy as e:
+            # The window keeps the unsummarized turns; the next turn tries again
+            print(f"Conversation summary postponed: {e}")
+
+    # Turns that slid out of the prompt window are folded into the summary off the request path
+    threading.Thread(target=update_summary, daemon=True).start()
+
+
+def agent_chunks(message, memory_bank, model, query_limit, retrieval_prompt_template, context_budget, stats, earlier=()):
+    # REPROMPT / NEW KEYWORDS / ACCEPT loop from sample_prompt.md; query_limit results per page
+    with telemetry.span("chat.rewrite", telemetry.REWRITE_MS, model=model):
+        keywords = get_retrieval_keywords(message, retrieval_prompt_template)
+    return run_agent_loop(
+        message,
+        keywords,
+        retrieve=lambda query, limit: make_retriever(memory_bank, limit)(query),
+        chat=lambda messages: ollama.chat(
+            model=model,
+            messages=[{"role": "system", "content": "You are a helpful assistant."}] + list(earlier) + messages,
+            stream=True,
+            keep_alive=MODEL_KEEP_ALIVE,
+        ),
+        evaluation_prompt=load_evaluation_prompt(),
+        page_size=int(query_limit),
+        token_budget=int(context_budget),
+        stats=stats,
     )
-    
-    for chunk in stream:
-        response += chunk['message']['content']
-        yield history + [("Human", message), ("AI", response)]
 
 
-def save_conversation(history):
-    if not history:
+def chat_function(message, history, memory_bank, model, query_limit, retrieval_prompt_template, full_prompt_template, pipeline_mode="sequential", context_budget=2000, rerank_mmr=False, stream_rate=20, adaptive_results=False, request: gr.Request = None):
+    user = user_key(request)
+    conversation_id = conversation_for(request)
+    earlier = history_messages(conversation_id)
+    # Only the latest turns stay in the chat; older ones are a "Load older messages" away
+    history = history if history is not None else []
+    if len(history) > 4 * DISPLAY_TURNS:
+        del history[:-2 * DISPLAY_TURNS]
+    turn_started = time.perf_counter()
+    targets = warm_targets(model, memory_bank)
+    warm = prewarmer.is_warm(targets)
+    try:
+        if pipeline_mode == AGENT_MODE:
+            # Retrieval and generation alternate, so the turn holds a generation slot throughout
+            with generation_admission.slot(user):
+                agent = {}
+                chunks = agent_chunks(message, memory_bank, model, query_limit, retrieval_prompt_template, context_budget, agent, earlier)
+                yield from prewarmer.time_first_update(
+                    stream_reply(history, message, chunks, updates_per_sec=stream_rate), turn_started, warm,
+                )
+            prewarmer.touch(targets)
+            record_turn(conversation_id, message, history[-1][1], model)
+            telemetry.AGENT_ROUNDS.observe(agent.get("rounds"))
+            telemetry.AGENT_TOKENS_NOT_RESENT.observe(agent.get("tokens_not_resent"))
+            print(f"Agent loop: {agent.get('rounds')} rounds, {agent.get('pages')} pages, {agent.get('results_sent')} results, "
+                  f"stopped by {agent.get('stop')}, {agent.get('tokens_sent')} prompt tokens sent, {agent.get('tokens_not_resent')} tokens not re-sent")
+            return
+        # Rewrite and retrieval, then generation, each under its own concurrency limit
+        with retrieval_admission.slot(user):
+            full_prompt = build_prompt(message, memory_bank, model, query_limit, retrieval_prompt_template,
+                                       full_prompt_template, pipeline_mode, context_budget, rerank_mmr, adaptive_results)
+        with generation_admission.slot(user):
+            # Use Ollama to generate a response
+            stream = ollama.chat(
+                model=model,
+                messages=[{"role": "system", "content": "You are a helpful assistant."}] + earlier +
+                         [{"role": "user", "content": full_prompt}],
+                stream=True,
+                keep_alive=MODEL_KEEP_ALIVE,
+            )
+
+            # Buffered tokens, pushed to the UI at most `stream_rate` times a second
+            chunks = telemetry.instrument_stream(stream, estimate_tokens(full_prompt), model=model)
+            yield from prewarmer.time_first_update(
+                stream_reply(history, message, chunks, updates_per_sec=stream_rate), turn_started, warm,
+            )
+        prewarmer.touch(targets)
+        record_turn(conversation_id, message, history[-1][1], model)
+    except Busy as e:
+        print(f"Turn from {user} shed: {e}")
+        yield history + [("Human", message), ("AI", BUSY_MESSAGE)]
+
+
+def save_conversation(request: gr.Request):
+    # Turns are already on disk; hand out the conversation's log
+    conversation_id = active_conversations.get(session_key(request))
+    if conversation_id is None or not conversation_store.turn_count(conversation_id):
         gr.Warning("No conversation to save.")
         return None, gr.update(visible=False)
-    
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"conversation_{timestamp}.json"
-    with open(filename, "w") as f:
-        json.dump(history, f)
-    
-    gr.Info(f"Conversation saved as {filename}")
-    return filename, gr.update(visible=True)
+    gr.Info(f"Conversation saved as {conversation_store.path(conversation_id)}")
+    return conversation_store.path(conversation_id), gr.update(visible=True)
+
+
+def toggle_load_file(conversation_id, chatbot, request: gr.Request):
+    owner = user_key(request)
+    if not conversation_id:
+        # If no conversation is selected, show the list of this user's stored ones
+        choices = [(name.split("/", 1)[1], name) for name in conversation_store.list_conversations(owner)]
+        return gr.update(choices=choices, visible=True), chatbot
+    if not conversation_store.owns(owner, conversation_id):
+        gr.Warning("That conversation is not yours.")
+        return gr.update(value=None), chatbot
+    if not conversation_store.turn_count(conversation_id):
+        gr.Warning("That conversation has no messages.")
+        return gr.update(value=None), chatbot
+    # Continue the stored conversation; only its latest turns are read
+    active_conversations[session_key(request)] = conversation_id
+    gr.Info("Conversation loaded successfully.")
+    return gr.update(value=None, visible=False), to_history(conversation_store.recent_turns(conversation_id, DISPLAY_TURNS))
+
+
+def load_older(chatbot, request: gr.Request):
+    conversation_id = active_conversations.get(session_key(request))
+    if conversation_id is None or not conversation_store.owns(user_key(request), conversation_id):
+        return chatbot
+    chatbot = chatbot or []
+    shown = conversation_store.turn_count(conversation_id) - len(chatbot) // 2
+    older = conversation_store.load_turns(conversation_id, shown - DISPLAY_TURNS, shown)
+    if not older:
+        gr.Info("No older messages.")
+    return to_history(older) + chatbot
+
+
+def new_conversation(request: gr.Request):
+    active_conversations.pop(session_key(request), None)
+    return None
+
 
-def toggle_load_file(file, chatbot):
-    if file is None:
-        # If no file is selected, just toggle visibility
-        return gr.update(visible=True), chatbot
-    
-    try:
-        with open(file.name, "r") as f:
-            history = json.load(f)
-        gr.Info("Conversation loaded successfully.")
-        return gr.update(value=None, visible=False), history
-    except json.JSONDecodeError:
-        gr.Warning("Invalid JSON file. Please select a valid conversation file.")
-    except Exception as e:
-        gr.Warning(f"Error loading conversation: {str(e)}")
-    
-    return gr.update(value=None), chatbot
 def show_load_file():
     return gr.update(visible=True)
 
@@ -137,15 +376,54 @@ def load_prompts():
         return None, None
 
 
-
 def enable_input(choice):
     return gr.update(interactive=bool(choice)), gr.update(interactive=bool(choice))
 
 
+def warm_targets(model, memory_bank):
+    return [("model", model), ("embedding",)] + [("memory_bank", bank) for bank, _ in expand_banks(memory_bank)]
+
+
+def prewarm_model(model):
+    # An empty prompt makes Ollama load the model; keep_alive holds it in memory
+    if model:
+        prewarmer.warm(("model", model), lambda: ollama.generate(model=model, prompt="", keep_alive=MODEL_KEEP_ALIVE))
+
+
+def prewarm_retriever(memory_bank):
+    # The first embedding and query load the embedding model and the bank's index
+    prewarmer.warm(("embedding",), lambda: get_client().embedding("warm up"))
+    for bank, _ in expand_banks(memory_bank):
+        prewarmer.warm(("memory_bank", bank), lambda bank=bank: get_client().query("warm up", bank, 1))
+
+
+def prewarm_default_model(values):
+    if values["models"]:
+        prewarm_model(values["models"][0])
+
+
+def refresh_choices(selected_banks, selected_model, version):
+    # Called on page load and by a timer; only sends updates when the background load changed something
+    if version == background_choices.version:
+        return gr.update(), gr.update(), version
+    models = background_choices.get("models")
+    return (
+        gr.update(choices=background_choices.get("memory_banks")),
+        gr.update(choices=models, value=selected_model or (models[0] if models else None)),
+        background_choices.version,
+    )
+
+
+# Memory banks and models are fetched in the background, so the UI does not wait on Dabarqus or Ollama
+background_choices = BackgroundChoices(
+    {"memory_banks": (get_memory_banks, []), "models": (get_ollama_models, [])},
+    on_ready=prewarm_default_model,
+).start()
 
 with gr.Blocks(title="dabarqus") as demo:
-    memory_banks = get_memory_banks()
-    ollama_models = get_ollama_models()
+    memory_banks = background_choices.get("memory_banks")
+    ollama_models = background_choices.get("models")
+    choices_version = gr.State(-1)
 
     with gr.Row():
         with gr.Column(scale=3):
@@ -155,15 +433,16 @@ with gr.Blocks(title="dabarqus") as demo:
                 save_button = gr.Button("Save", size="sm")
                 load_button = gr.Button("Load", size="sm")
             file_output = gr.File(label="Saved Conversation", visible=False)
-            file_input = gr.File(label="Load Conversation", file_types=[".json"], visible=False)
+            file_input = gr.Dropdown(label="Load Conversation", choices=[], visible=False)
 
     with gr.Row():
         memory_bank = gr.Dropdown(
         choices=memory_banks,
         label="Select Memory Bank",
         value=None,
+        multiselect=True,
         allow_custom_value=False,
-        info="Choose a memory bank to query for relevant information."
+        info="Choose one or more memory banks to query for relevant information."
     )
         model_selection = gr.Dropdown(
             choices=ollama_models,
@@ -201,28 +480,75 @@ with gr.Blocks(title="dabarqus") as demo:
             placeholder="Enter the prompt template...",
             value="Use these results from your recipe catalog to form your answer (include the file reference in your answer if you use one)"
         )
+        pipeline_mode = gr.Dropdown(
+            choices=PIPELINE_MODES + [AGENT_MODE],
+            label="Retrieval Pipeline",
+            value="sequential",
+            info="sequential: rewrite then retrieve. speculative/merge: retrieve on your message while the keywords are generated. agent: the model asks for more results or new keywords before answering (sample_prompt.md)."
+        )
+        context_budget = gr.Slider(
+            minimum=0,
+            maximum=8000,
+            value=2000,
+            step=100,
+            label="Context token budget",
+            info="Approximate prompt tokens for retrieved results, de-duplicated and best first. 0 sends the raw results."
+        )
+        rerank_mmr = gr.Checkbox(
+            label="Diversity re-ranking (MMR)",
+            value=False,
+            info="Fetch extra results and keep the most relevant ones that are not near-duplicates of each other."
+        )
+        adaptive_results = gr.Checkbox(
+            label="Adaptive number of results",
+            value=False,
+            info="Fetch a few results first and more only while their scores stay close to the best one. Number of RAG results becomes the maximum."
+        )
+        stream_rate = gr.Slider(
+            minimum=0,
+            maximum=60,
+            value=20,
+            step=1,
+            label="Streaming updates per second",
+            info="How often the response is redrawn while it streams. 0 redraws on every token."
+        )
         with gr.Row():
             save_prompts_btn = gr.Button("Save Prompts")
             load_prompts_btn = gr.Button("Load Prompts")
-    clear = gr.Button("Clear Chat")
+    with gr.Row():
+        load_older_button = gr.Button("Load older messages")
+        clear = gr.Button("Clear Chat")
     
     memory_bank.change(enable_input, inputs=[memory_bank], outputs=[msg, submit])
+    memory_bank.change(prewarm_retriever, inputs=[memory_bank], queue=False)
+    model_selection.change(prewarm_model, inputs=[model_selection], queue=False)
+    demo.load(
+        refresh_choices,
+        inputs=[memory_bank, model_selection, choices_version],
+        outputs=[memory_bank, model_selection, choices_version],
+    )
+    gr.Timer(5).tick(
+        refresh_choices,
+        inputs=[memory_bank, model_selection, choices_version],
+        outputs=[memory_bank, model_selection, choices_version],
+    )
 
     msg.submit(
     chat_function,
-    inputs=[msg, chatbot, memory_bank, model_selection, query_limit, retrieval_prompt, prompt_template],
+    inputs=[msg, chatbot, memory_bank, model_selection, query_limit, retrieval_prompt, prompt_template, pipeline_mode, context_budget, rerank_mmr, stream_rate, adaptive_results],
     outputs=[chatbot]
     )
     submit.click(
         chat_function,
-        inputs=[msg, chatbot, memory_bank, model_selection, query_limit, retrieval_prompt, prompt_template],
+        inputs=[msg, chatbot, memory_bank, model_selection, query_limit, retrieval_prompt, prompt_template, pipeline_mode, context_budget, rerank_mmr, stream_rate, adaptive_results],
         outputs=[chatbot]
     )
-    clear.click(lambda: None, None, chatbot, queue=False)
+    clear.click(new_conversation, None, chatbot, queue=False)
+    load_older_button.click(load_older, inputs=[chatbot], outputs=[chatbot], queue=False)
 
     save_button.click(
         save_conversation,
-        inputs=[chatbot],
+        inputs=None,
         outputs=[file_output, file_output]
     )
 
@@ -234,6 +560,8 @@ with gr.Blocks(title="dabarqus") as demo:
 # Launch the app
 if __name__ == "__main__":
 
+    # Concurrency is limited per stage by retrieval_admission / generation_admission rather than by Gradio's queue
+    demo.queue(default_concurrency_limit=None)
     demo.launch()
     demo.load(lambda: display_error_message(check_dependencies()), outputs=[error_box])
 
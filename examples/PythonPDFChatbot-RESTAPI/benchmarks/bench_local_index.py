@@ -0,0 +1,92 @@
+# Benchmark: local replica (local_index.py) against the /api/silk/query REST path.
+#
+# For every query, fetches the top-k over REST and from the local snapshot and
+# reports recall@k of the local results (taking REST as ground truth) and the
+# latency of each path. Local latency is shown both with the query embedding
+# call and for the in-process search alone.
+#
+#   python local_index.py snapshot --memory-bank MyNewRecipeBook
+#   python benchmarks/bench_local_index.py --memory-bank MyNewRecipeBook --queries queries.txt
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from dabarqus_client import DabarqusClient  # noqa: E402
+from local_index import LOCAL_INDEX_DIR, LocalIndex  # noqa: E402
+from results import embedding_vector, get_hits, hit_key  # noqa: E402
+from retrieval_log import read_log  # noqa: E402
+
+DEFAULT_QUERIES = [
+    "macaroni and cheese",
+    "teriyaki chicken wings",
+    "garlic bread spread",
+    "lasagna without noodles",
+    "ice box cookies",
+    "potato rolls with lemon and orange",
+    "pork sandwich",
+    "macaroni salad",
+]
+
+
+def load_queries(args):
+    if args.queries:
+        with open(args.queries, "r") as f:
+            return [line.strip() for line in f if line.strip()]
+    if args.from_log and os.path.exists(args.from_log):
+        queries = list(dict.fromkeys(str(record["query"]) for record in read_log(args.from_log)))
+        if queries:
+            return queries
+    return DEFAULT_QUERIES
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare local replica recall and latency with the REST query path")
+    parser.add_argument("--memory-bank", required=True)
+    parser.add_argument("--server-url", default="http://localhost:6568")
+    parser.add_argument("--index-dir", default=LOCAL_INDEX_DIR)
+    parser.add_argument("--queries", help="File with one query per line")
+    parser.add_argument("--from-log", default="./retrievals/", help="Take queries from the retrieval log if no --queries file")
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, default=4, help="IVF lists searched per query")
+    args = parser.parse_args()
+
+    client = DabarqusClient(args.server_url)
+    index = LocalIndex(os.path.join(args.index_dir, args.memory_bank))
+    queries = load_queries(args)
+
+    rest_ms, local_ms, search_us, recalls = [], [], [], []
+    for query in queries:
+        start = time.perf_counter()
+        rest_hits = get_hits(client.query(query, args.memory_bank, args.limit).json())
+        rest_ms.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        vector = embedding_vector(client.embedding(query))
+        searched = time.perf_counter()
+        local_hits = get_hits(index.query(vector, args.limit, args.nprobe))
+        done = time.perf_counter()
+        local_ms.append((done - start) * 1000)
+        search_us.append((done - searched) * 1e6)
+
+        expected = {hit_key(hit) for hit in rest_hits}
+        if expected:
+            recalls.append(len(expected & {hit_key(hit) for hit in local_hits}) / len(expected))
+
+    print(f"{len(queries)} queries, {len(index)} chunks, dtype {index.meta['dtype']}, "
+          f"IVF lists {index.meta.get('ivf_lists', 0)}")
+    print(f"recall@{args.limit}: {statistics.mean(recalls) if recalls else float('nan'):.3f}")
+    print(f"REST query          p50 {percentile(rest_ms, 50):8.2f} ms   p99 {percentile(rest_ms, 99):8.2f} ms")
+    print(f"local embed+search  p50 {percentile(local_ms, 50):8.2f} ms   p99 {percentile(local_ms, 99):8.2f} ms")
+    print(f"local search only   p50 {percentile(search_us, 50):8.1f} µs   p99 {percentile(search_us, 99):8.1f} µs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+# Load generator for /api/silk/query.
+#
+# Replays a query set either open-loop at a fixed rate (--qps) or closed-loop
+# with N concurrent clients (--concurrency), through the pooled sync client
+# (threads) or the asyncio client. Open-loop latency is measured from when each
+# request was scheduled, not when a worker got to send it. Reports latency percentiles, throughput and
+# error rate, and writes them as JSON so runs can be compared over time.
+#
+# Query sets: --queries FILE (one per line), the retrieval log (--from-log), or
+# by default a set generated from the CreatingAMemoryBank recipes/ file names.
+# --stub starts stub_server.py in-process (replaying --from-log recordings if
+# given), so the benchmark runs in CI with no Dabarqus install.
+#
+#   python benchmarks/bench_query_load.py --memory-bank MyNewRecipeBook --concurrency 8 --duration 30
+#   python benchmarks/bench_query_load.py --stub --qps 200 --mode async --output results.json
+import argparse
+import asyncio
+import glob
+import itertools
+import json
+import os
+import re
+import sys
+import threading
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from dabarqus_client import DabarqusClient  # noqa: E402
+from retrieval_log import read_log  # noqa: E402
+from stub_server import Recordings, StubConfig, start_server  # noqa: E402
+
+RECIPES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "CreatingAMemoryBank", "recipes")
+
+
+def queries_from_corpus(directory=RECIPES_DIR):
+    # "world_s_best__macaroni___cheese_(580).pdf" -> "world s best macaroni cheese"
+    queries = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.pdf"))):
+        name = re.sub(r"\(\d+\)", "", os.path.splitext(os.path.basename(path))[0])
+        words = [word for word in re.split(r"[_\W]+", name) if word]
+        if words:
+            queries.append(" ".join(words))
+    return queries
+
+
+def queries_from_log(path):
+    queries = []
+    for record in read_log(path):
+        if isinstance(record.get("query"), str):
+            queries.append(record["query"])
+    # Responses saved one per file by the older serialize_response, if they carry the query
+    for file_path in glob.glob(os.path.join(path, "*.json")):
+        try:
+            with open(file_path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if isinstance(data, dict) and isinstance(data.get("query"), str):
+            queries.append(data["query"])
+    return queries
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    def record(self, latency_ms, ok):
+        with self.lock:
+            if ok:
+                self.latencies.append(latency_ms)
+            else:
+                self.errors += 1
+
+
+_request_counter = itertools.count()
+
+
+def _next_query(queries):
+    return queries[next(_request_counter) % len(queries)]
+
+
+def run_sync(client, args, queries, recorder):
+    stop_at = time.perf_counter() + args.duration
+
+    def one_request(scheduled_at=None):
+        # Open-loop latency counts from the scheduled send time, so time spent
+        # queued behind slow requests is measured (no coordinated omission)
+        query = _next_query(queries)
+        start = scheduled_at if scheduled_at is not None else time.perf_counter()
+        try:
+            client.query(query, args.memory_bank, args.limit).content
+            recorder.record((time.perf_counter() - start) * 1000, True)
+        except Exception:
+            recorder.record(0.0, False)
+
+    if args.qps:
+        # Open loop: issue on schedule regardless of how long responses take
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=args.max_in_flight) as pool:
+            next_at = time.perf_counter()
+            while next_at < stop_at:
+                time.sleep(max(0.0, next_at - time.perf_counter()))
+                pool.submit(one_request, next_at)
+                next_at += 1.0 / args.qps
+    else:
+        def worker():
+            while time.perf_counter() < stop_at:
+                one_request()
+        threads = [threading.Thread(target=worker) for _ in range(args.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+
+async def run_async(client, args, queries, recorder):
+    stop_at = time.perf_counter() + args.duration
+    in_flight = asyncio.Semaphore(args.max_in_flight)
+
+    async def one_request(scheduled_at=None):
+        query = _next_query(queries)
+        start = scheduled_at if scheduled_at is not None else time.perf_counter()
+        try:
+            await client.aquery(query, args.memory_bank, args.limit)
+            recorder.record((time.perf_counter() - start) * 1000, True)
+        except Exception:
+            recorder.record(0.0, False)
+
+    if args.qps:
+        tasks = []
+
+        async def limited(scheduled_at):
+            async with in_flight:
+                await one_request(scheduled_at)
+
+        next_at = time.perf_counter()
+        while next_at < stop_at:
+            await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+            tasks.append(asyncio.create_task(limited(next_at)))
+            next_at += 1.0 / args.qps
+        await asyncio.gather(*tasks)
+    else:
+        async def worker():
+            while time.perf_counter() < stop_at:
+                await one_request()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    await client.aclose()
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test /api/silk/query")
+    parser.add_argument("--server-url", default="http://localhost:6568")
+    parser.add_argument("--memory-bank", default="MyNewRecipeBook")
+    parser.add_argument("--limit", type=int, default=10, help="Results per query")
+    parser.add_argument("--mode", choices=["sync", "async"], default="sync")
+    parser.add_argument("--qps", type=float, default=0.0, help="Open-loop request rate (0 = closed loop)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Closed-loop clients")
+    parser.add_argument("--max-in-flight", type=int, default=64, help="Open-loop cap on outstanding requests")
+    parser.add_argument("--pool-size", type=int, default=16, help="Client connection pool size")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds to run")
+    parser.add_argument("--queries", help="File with one query per line")
+    parser.add_argument("--from-log", help="Take queries from a retrieval log directory")
+    parser.add_argument("--stub", action="store_true", help="Run against an in-process stub server")
+    parser.add_argument("--stub-latency-ms", type=float, default=5.0, help="Mean of the stub's exponential query latency")
+    parser.add_argument("--stub-error-rate", type=float, default=0.0, help="Fraction of stub queries that fail")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    if args.queries:
+        with open(args.queries, "r") as f:
+            queries = [line.strip() for line in f if line.strip()]
+    elif args.from_log:
+        queries = queries_from_log(args.from_log)
+    else:
+        queries = queries_from_corpus()
+    if not queries:
+        parser.error("No queries found")
+
+    server_url = args.server_url
+    if args.stub:
+        recordings = Recordings()
+        if args.from_log:
+            recordings.load(args.from_log)
+        latency = f"exp:{args.stub_latency_ms}" if args.stub_latency_ms else "fixed:0"
+        _, server_url = start_server(StubConfig(recordings, {"query": latency}, args.stub_error_rate))
+
+    client = DabarqusClient(server_url, pool_size=args.pool_size)
+    recorder = Recorder()
+    start = time.perf_counter()
+    if args.mode == "sync":
+        run_sync(client, args, queries, recorder)
+    else:
+        asyncio.run(run_async(client, args, queries, recorder))
+    elapsed = time.perf_counter() - start
+
+    total = len(recorder.latencies) + recorder.errors
+    results = {
+        "timestamp": datetime.now().isoformat(),
+        "server_url": server_url,
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "queries": len(queries),
+        "requests": total,
+        "errors": recorder.errors,
+        "error_rate": recorder.errors / total if total else 0.0,
+        "throughput_rps": len(recorder.latencies) / elapsed if elapsed else 0.0,
+        "latency_ms": {
+            "p50": percentile(recorder.latencies, 50),
+            "p90": percentile(recorder.latencies, 90),
+            "p99": percentile(recorder.latencies, 99),
+            "max": max(recorder.latencies) if recorder.latencies else None,
+        },
+    }
+    latency = results["latency_ms"]
+    if recorder.latencies:
+        print(f"{total} requests in {elapsed:.1f}s: {results['throughput_rps']:.1f} req/s, "
+              f"{results['error_rate'] * 100:.2f}% errors")
+        print(f"latency p50 {latency['p50']:.2f} ms, p90 {latency['p90']:.2f} ms, "
+              f"p99 {latency['p99']:.2f} ms, max {latency['max']:.2f} ms")
+    else:
+        print(f"{total} requests, all failed")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
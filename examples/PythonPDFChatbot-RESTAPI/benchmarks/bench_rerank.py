@@ -0,0 +1,77 @@
+# Benchmark: cost of MMR re-ranking vs. the prompt evaluation time it saves.
+#
+# Builds synthetic result sets where hits come in clusters of near-duplicates
+# (like the several macaroni & cheese recipes in the recipes corpus), then
+# measures how many results plain top-k and MMR need to cover the same number
+# of distinct clusters, and what the re-rank itself costs. Prompt evaluation
+# time is estimated from --tokens-per-chunk and --prompt-eval-tps (measure the
+# latter with `ollama run <model> --verbose`).
+#
+#   python benchmarks/bench_rerank.py --candidates 30 50 --dim 768
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rerank import mmr  # noqa: E402
+
+
+def make_result_set(rng, candidates, dim, cluster_size):
+    clusters = (candidates + cluster_size - 1) // cluster_size
+    centers = rng.normal(size=(clusters, dim))
+    labels = np.repeat(np.arange(clusters), cluster_size)[:candidates]
+    vectors = centers[labels] + 0.05 * rng.normal(size=(candidates, dim))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    # Query close to every cluster, more so to the first ones
+    weights = np.linspace(1.0, 0.5, clusters)
+    query = (weights[:, None] * centers).sum(axis=0)
+    query /= np.linalg.norm(query)
+    return query.astype(np.float32), vectors.astype(np.float32), labels
+
+
+def results_for_coverage(order, labels, clusters):
+    seen = set()
+    for count, index in enumerate(order, start=1):
+        seen.add(labels[index])
+        if len(seen) >= clusters:
+            return count
+    return len(order)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark MMR re-ranking cost against prompt tokens saved")
+    parser.add_argument("--candidates", type=int, nargs="+", default=[10, 30, 50, 150])
+    parser.add_argument("--dim", type=int, default=768, help="Embedding dimension")
+    parser.add_argument("--cluster-size", type=int, default=4, help="Near-duplicates per distinct chunk")
+    parser.add_argument("--coverage", type=int, default=5, help="Distinct chunks the prompt should contain")
+    parser.add_argument("--tokens-per-chunk", type=int, default=250)
+    parser.add_argument("--prompt-eval-tps", type=float, default=400.0, help="LLM prompt evaluation tokens/sec")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'candidates':>10} {'mmr ms':>8} {'top-k n':>8} {'mmr n':>6} {'tokens saved':>13} {'eval ms saved':>14}")
+    for candidates in args.candidates:
+        query, vectors, labels = make_result_set(rng, candidates, args.dim, args.cluster_size)
+        coverage = min(args.coverage, len(set(labels)))
+
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            order = mmr(query, vectors, candidates)
+            timings.append((time.perf_counter() - start) * 1000)
+        mmr_ms = float(np.median(timings))
+
+        plain_order = list(np.argsort(-(vectors @ query)))
+        plain_needed = results_for_coverage(plain_order, labels, coverage)
+        mmr_needed = results_for_coverage(order, labels, coverage)
+        tokens_saved = (plain_needed - mmr_needed) * args.tokens_per_chunk
+        eval_ms_saved = tokens_saved / args.prompt_eval_tps * 1000
+        print(f"{candidates:>10} {mmr_ms:>8.2f} {plain_needed:>8} {mmr_needed:>6} {tokens_saved:>13} {eval_ms_saved:>14.0f}")
+    print("Embedding calls are not included; with the content-hash cache warm they cost one query embedding per turn.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# Benchmark: cold versus warm first chat turn, and what a blocking startup costs.
+#
+# Startup: times the memory bank and model list calls the UI used to make
+# before it could render. First turn: unloads the model from Ollama
+# (keep_alive=0), times a turn (query embedding, memory bank query, time to
+# the first generated token), then pre-warms the model the way app.py does
+# and times the same turn again. Dabarqus' embedding model cannot be unloaded
+# from here, so run once right after starting Dabarqus to see its cold cost.
+#
+#   python benchmarks/bench_startup.py --memory-bank MyNewRecipeBook --model llama3 --trials 3
+import argparse
+import os
+import statistics
+import sys
+import time
+import ollama
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from dabarqus_client import DabarqusClient  # noqa: E402
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return (time.perf_counter() - start) * 1000
+
+
+def first_turn(client, args):
+    stages = {}
+    stages["embedding_ms"] = timed(lambda: client.embedding(args.query))
+    stages["query_ms"] = timed(lambda: client.query(args.query, args.memory_bank, args.limit))
+    start = time.perf_counter()
+    stream = ollama.chat(model=args.model, messages=[{"role": "user", "content": args.query}], stream=True, keep_alive="30m")
+    for _ in stream:
+        stages["ttft_ms"] = (time.perf_counter() - start) * 1000
+        break
+    stream.close()
+    stages["total_ms"] = sum(stages.values())
+    return stages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold vs. warm first-turn latency")
+    parser.add_argument("--server-url", default="http://localhost:6568")
+    parser.add_argument("--memory-bank", required=True)
+    parser.add_argument("--model", default="llama3")
+    parser.add_argument("--query", default="How do I make macaroni and cheese?")
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--trials", type=int, default=3)
+    args = parser.parse_args()
+
+    client = DabarqusClient(args.server_url)
+    print(f"Blocking startup: memory banks {timed(client.get_memory_banks):.0f} ms, "
+          f"Ollama models {timed(ollama.list):.0f} ms")
+
+    results = {"cold": [], "warm": []}
+    for trial in range(args.trials):
+        # Unload the model, then measure a turn that has to load it
+        ollama.generate(model=args.model, prompt="", keep_alive=0)
+        results["cold"].append(first_turn(client, args))
+
+        # What app.py does in the background when the model is selected
+        warm_ms = timed(lambda: ollama.generate(model=args.model, prompt="", keep_alive="30m"))
+        results["warm"].append(first_turn(client, args))
+        print(f"trial {trial + 1}: cold {results['cold'][-1]['total_ms']:.0f} ms, "
+              f"warm {results['warm'][-1]['total_ms']:.0f} ms (pre-warm took {warm_ms:.0f} ms)")
+
+    for state, turns in results.items():
+        summary = ", ".join(f"{stage} {statistics.median(turn[stage] for turn in turns):.0f}" for stage in turns[0])
+        print(f"{state:>5} first turn (median): {summary}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# Benchmark: CPU per generated token of the chat streaming loop.
+#
+# Compares the original loop (append each token to the response and yield a
+# fresh `history + [turn]` per token) with streaming.stream_reply at a few
+# update rates, for long answers and long conversations. Each yielded value
+# is JSON-serialized, standing in for Gradio sending the chatbot to the
+# browser. Tokens are produced without delay, so time-based coalescing is
+# modelled by --tokens-per-sec: the generator's clock advances by
+# 1/tokens-per-sec per token.
+#
+#   python benchmarks/bench_streaming.py --answer-tokens 500 2000 8000 --history-turns 0 20 100
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import streaming  # noqa: E402
+from streaming import stream_reply  # noqa: E402
+
+
+def make_history(turns, words_per_message=120):
+    text = " ".join(["recipe"] * words_per_message)
+    history = []
+    for _ in range(turns):
+        history.append(("Human", text))
+        history.append(("AI", text))
+    return history
+
+
+def make_chunks(tokens):
+    return [{'message': {'content': "word "}} for _ in range(tokens)]
+
+
+def per_token_loop(history, message, chunks):
+    # The loop chat_function used before stream_reply
+    response = ""
+    for chunk in chunks:
+        response += chunk['message']['content']
+        yield history + [("Human", message), ("AI", response)]
+
+
+class SimulatedClock:
+    def __init__(self, tokens_per_sec):
+        self.now = 0.0
+        self.step = 1.0 / tokens_per_sec
+
+    def monotonic(self):
+        return self.now
+
+    def tokens(self, chunks):
+        for chunk in chunks:
+            self.now += self.step
+            yield chunk
+
+
+def measure(run, tokens):
+    start = time.process_time()
+    updates = 0
+    sent_bytes = 0
+    for value in run():
+        sent_bytes += len(json.dumps(value))
+        updates += 1
+    cpu = time.process_time() - start
+    return cpu / tokens * 1e6, updates, sent_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CPU per token of per-token vs. coalesced chat streaming")
+    parser.add_argument("--answer-tokens", type=int, nargs="+", default=[500, 2000, 8000])
+    parser.add_argument("--history-turns", type=int, nargs="+", default=[0, 20, 100])
+    parser.add_argument("--rates", type=float, nargs="+", default=[20.0, 5.0], help="stream_reply updates per second")
+    parser.add_argument("--tokens-per-sec", type=float, default=50.0, help="Simulated generation rate")
+    args = parser.parse_args()
+
+    print(f"{'tokens':>7} {'turns':>6} {'mode':>14} {'cpu us/token':>13} {'updates':>8} {'MB sent':>9}")
+    for tokens in args.answer_tokens:
+        for turns in args.history_turns:
+            chunks = make_chunks(tokens)
+            history = make_history(turns)
+            rows = [("per-token", lambda: per_token_loop(history, "question", chunks))]
+            for rate in args.rates:
+                def coalesced(rate=rate):
+                    clock = SimulatedClock(args.tokens_per_sec)
+                    streaming.time = clock
+                    return stream_reply(list(history), "question", clock.tokens(chunks), updates_per_sec=rate)
+                rows.append((f"{rate:g}/s", coalesced))
+            for name, run in rows:
+                us_per_token, updates, sent_bytes = measure(run, tokens)
+                print(f"{tokens:>7} {turns:>6} {name:>14} {us_per_token:>13.1f} {updates:>8} {sent_bytes / 1e6:>9.1f}")
+            streaming.time = time
+
+
+if __name__ == "__main__":
+    main()
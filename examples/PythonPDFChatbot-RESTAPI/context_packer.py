@@ -0,0 +1,79 @@
+import os
+import re
+from results import get_hits, hit_score, hit_source, hit_text
+
+_WORD = re.compile(r"\w+")
+
+
+def estimate_tokens(text):
+    # Roughly 4 characters per token for English text with common LLM tokenizers
+    return (len(text) + 3) // 4
+
+
+def _shingles(text, size=5):
+    words = _WORD.findall(text.lower())
+    if len(words) <= size:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def _is_duplicate(shingles, kept_shingles, threshold):
+    # Containment rather than Jaccard, so a chunk that is mostly the overlap of
+    # a neighbouring chunk counts as a duplicate too
+    for other in kept_shingles:
+        smaller = min(len(shingles), len(other))
+        if smaller and len(shingles & other) / smaller >= threshold:
+            return True
+    return False
+
+
+def format_hit(index, hit):
+    source = os.path.basename(hit_source(hit)) or "unknown"
+    text = " ".join(hit_text(hit).split())
+    return f"[{index}] ({source}) {text}"
+
+
+def pack_context(retrieved_data, token_budget, count_tokens=estimate_tokens, duplicate_threshold=0.8):
+    """Turn a query response into a compact, de-duplicated context block.
+
+    Hits are taken best score first; near-identical or overlapping chunks are
+    skipped, and each kept chunk is written as "[n] (source) text" until
+    `token_budget` tokens are used. Returns (context, stats), where stats
+    compares the packed size with the raw response the prompt used to embed.
+    """
+    raw_tokens = count_tokens(str(retrieved_data))
+    hits = sorted(get_hits(retrieved_data), key=hit_score, reverse=True)
+
+    lines = []
+    kept_shingles = []
+    used = 0
+    duplicates = 0
+    over_budget = 0
+    for hit in hits:
+        text = hit_text(hit)
+        if not text.strip():
+            continue
+        shingles = _shingles(text)
+        if _is_duplicate(shingles, kept_shingles, duplicate_threshold):
+            duplicates += 1
+            continue
+        line = format_hit(len(lines) + 1, hit)
+        tokens = count_tokens(line) + 1
+        if used + tokens > token_budget:
+            over_budget += 1
+            continue
+        lines.append(line)
+        kept_shingles.append(shingles)
+        used += tokens
+
+    context = "\n".join(lines)
+    stats = {
+        "hits": len(hits),
+        "kept": len(lines),
+        "duplicates": duplicates,
+        "over_budget": over_budget,
+        "raw_tokens": raw_tokens,
+        "packed_tokens": count_tokens(context),
+    }
+    stats["saved_tokens"] = stats["raw_tokens"] - stats["packed_tokens"]
+    return context, stats
@@ -0,0 +1,187 @@
+import hashlib
+import json
+import os
+import re
+import struct
+import threading
+import time
+import uuid
+from context_packer import estimate_tokens
+
+# Conversations are stored one per pair of files in a subdirectory of
+# `directory` per owner (logged-in user or browser session), so a user can
+# only list and continue their own. A conversation id is "<owner dir>/<name>".
+# Each conversation has:
+#   <id>.jsonl          one line per turn, appended as the turn completes
+#   <id>.idx            byte offset of every turn in the .jsonl, 8 bytes each
+#   <id>.summary.json   rolling summary of the turns that no longer fit the
+#                       prompt window (small, replaced on update)
+# The index lets a page of turns be read with two seeks, however long the
+# conversation is.
+CONVERSATIONS_DIR = "./conversations/"
+
+_OFFSET = struct.Struct("<Q")
+_CONVERSATION_ID = re.compile(r"^[0-9a-f]{16}/\w+$")
+
+SUMMARY_PROMPT = (
+    "Update the summary of an earlier part of a conversation between a user and an assistant. "
+    "Keep the facts, names, files and decisions that later questions may refer to, in under 200 words. "
+    "Reply with the summary only.\n\nCurrent summary:\n{summary}\n\nNew turns:\n{turns}"
+)
+
+
+class ConversationStore:
+    def __init__(self, directory=CONVERSATIONS_DIR):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.summarizing = set()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, conversation_id, suffix):
+        return os.path.join(self.directory, f"{conversation_id}{suffix}")
+
+    def path(self, conversation_id):
+        return self._path(conversation_id, ".jsonl")
+
+    def owner_dir(self, owner):
+        # Owners are user names or session hashes; hashed into a safe directory name
+        return hashlib.sha256(str(owner).encode("utf-8")).hexdigest()[:16]
+
+    def new_conversation(self, owner):
+        return f"{self.owner_dir(owner)}/{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+
+    def owns(self, owner, conversation_id):
+        return (isinstance(conversation_id, str) and bool(_CONVERSATION_ID.match(conversation_id))
+                and conversation_id.split("/", 1)[0] == self.owner_dir(owner))
+
+    def list_conversations(self, owner):
+        # The owner's conversation ids, most recent first
+        owner_dir = self.owner_dir(owner)
+        try:
+            names = os.listdir(os.path.join(self.directory, owner_dir))
+        except OSError:
+            return []
+        return sorted((f"{owner_dir}/{name[:-len('.jsonl')]}" for name in names if name.endswith(".jsonl")), reverse=True)
+
+    def append_turn(self, conversation_id, user, assistant, **extra):
+        record = {"timestamp": time.time(), "user": user, "assistant": assistant, **extra}
+        line = (json.dumps(record) + "\n").encode("utf-8")
+        with self.lock:
+            os.makedirs(os.path.dirname(self.path(conversation_id)), exist_ok=True)
+            with open(self.path(conversation_id), "ab") as log, open(self._path(conversation_id, ".idx"), "ab") as index:
+                offset = log.seek(0, os.SEEK_END)
+                turn = index.seek(0, os.SEEK_END) // _OFFSET.size
+                log.write(line)
+                index.write(_OFFSET.pack(offset))
+        return turn
+
+    def turn_count(self, conversation_id):
+        try:
+            return os.path.getsize(self._path(conversation_id, ".idx")) // _OFFSET.size
+        except OSError:
+            return 0
+
+    def load_turns(self, conversation_id, start, end=None):
+        """Turns [start, end) as dicts, reading only that part of the log."""
+        count = self.turn_count(conversation_id)
+        end = count if end is None else min(end, count)
+        start = max(0, start)
+        if start >= end:
+            return []
+        with open(self._path(conversation_id, ".idx"), "rb") as index:
+            index.seek(start * _OFFSET.size)
+            (first,) = _OFFSET.unpack(index.read(_OFFSET.size))
+            index.seek(end * _OFFSET.size)
+            following = index.read(_OFFSET.size)
+        with open(self.path(conversation_id), "rb") as log:
+            log.seek(first)
+            data = log.read(_OFFSET.unpack(following)[0] - first) if following else log.read()
+        return [json.loads(line) for line in data.splitlines() if line.strip()]
+
+    def recent_turns(self, conversation_id, n):
+        count = self.turn_count(conversation_id)
+        return self.load_turns(conversation_id, count - n, count)
+
+    def load_summary(self, conversation_id):
+        try:
+            with open(self._path(conversation_id, ".summary.json"), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"upto": 0, "text": ""}
+
+    def save_summary(self, conversation_id, upto, text):
+        path = self._path(conversation_id, ".summary.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump({"upto": upto, "text": text}, f)
+        os.replace(path + ".tmp", path)
+
+    def _fit(self, conversation_id, token_budget, max_turns):
+        # (count, loaded turns, index of the first turn that still fits in token_budget)
+        count = self.turn_count(conversation_id)
+        turns = self.load_turns(conversation_id, count - max_turns, count)
+        used = 0
+        kept = 0
+        for turn in reversed(turns):
+            tokens = estimate_tokens(turn["user"]) + estimate_tokens(turn["assistant"])
+            if used + tokens > token_budget:
+                break
+            used += tokens
+            kept += 1
+        return count, turns, count - kept
+
+    def window(self, conversation_id):
+        """(summary, turns, first) for the prompt: the rolling summary, every
+        later turn, and the index of the first of those turns.
+
+        update_summary() folds turns into the summary once they no longer fit
+        its token budget, so these are normally the turns that fit. While the
+        summary lags behind, turns not summarized yet stay in however many
+        there are, so no turn is missing or repeated in the summary.
+        """
+        count = self.turn_count(conversation_id)
+        summary = self.load_summary(conversation_id)
+        # Everything after the summary; update_summary() keeps this close to the budget
+        first = min(summary["upto"], count)
+        return summary, self.load_turns(conversation_id, first, count), first
+
+    def update_summary(self, conversation_id, token_budget, summarize, max_turns=50):
+        """Fold turns that have slid out of the prompt window into the rolling
+        summary with `summarize(prompt)`. Only the newly-dropped turns are sent."""
+        with self.lock:
+            # One summarizer per conversation; a later call picks up what this one leaves
+            if conversation_id in self.summarizing:
+                return None
+            self.summarizing.add(conversation_id)
+        try:
+            _, _, first = self._fit(conversation_id, token_budget, max_turns)
+            summary = self.load_summary(conversation_id)
+            if first <= summary["upto"]:
+                return summary
+            dropped = self.load_turns(conversation_id, summary["upto"], first)
+            turns = "\n".join(f"User: {turn['user']}\nAssistant: {turn['assistant']}" for turn in dropped)
+            text = summarize(SUMMARY_PROMPT.format(summary=summary["text"] or "(none)", turns=turns))
+            self.save_summary(conversation_id, first, text)
+            return {"upto": first, "text": text}
+        finally:
+            with self.lock:
+                self.summarizing.discard(conversation_id)
+
+
+def to_history(turns):
+    # Chatbot rows, in the ("Human", message), ("AI", response) layout chat_function uses
+    history = []
+    for turn in turns:
+        history.append(("Human", turn["user"]))
+        history.append(("AI", turn["assistant"]))
+    return history
+
+
+def to_messages(summary, turns):
+    # Ollama chat messages for the earlier conversation
+    messages = []
+    if summary.get("text"):
+        messages.append({"role": "system", "content": f"Summary of the earlier conversation: {summary['text']}"})
+    for turn in turns:
+        messages.append({"role": "user", "content": turn["user"]})
+        messages.append({"role": "assistant", "content": turn["assistant"]})
+    return messages
@@ -0,0 +1,164 @@
+import asyncio
+import threading
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+DABARQUS_URL = "http://localhost:6568"
+
+# (connect, read) timeouts in seconds, per endpoint
+DEFAULT_TIMEOUT = (3.0, 30.0)
+ENDPOINT_TIMEOUTS = {
+    "/health": (1.0, 3.0),
+    "/api/silk/health": (1.0, 3.0),
+    "/api/silk/memorybanks": (2.0, 10.0),
+    "/api/silk/query": (2.0, 30.0),
+    "/api/silk/embedding": (2.0, 15.0),
+}
+
+
+class DabarqusClient:
+    """Pooled, keep-alive HTTP client for the Dabarqus REST API.
+
+    The sync methods share one requests.Session whose pool is capped at
+    `pool_size` connections (extra callers wait for a free connection instead
+    of opening new sockets). The async methods use an httpx.AsyncClient with
+    the same limits, created lazily for the running event loop and closed when
+    that loop shuts down (e.g. at the end of asyncio.run).
+    """
+
+    def __init__(self, base_url=DABARQUS_URL, pool_size=16, timeouts=None):
+        self.base_url = base_url.rstrip('/')
+        self.pool_size = pool_size
+        self.timeouts = dict(ENDPOINT_TIMEOUTS)
+        if timeouts:
+            self.timeouts.update(timeouts)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._async_client = None
+        self._async_loop = None
+        self._async_closer = None
+
+    def timeout_for(self, endpoint):
+        return self.timeouts.get(endpoint, DEFAULT_TIMEOUT)
+
+    # Sync interface
+    def request(self, method, endpoint, params=None, json=None, timeout=None):
+        response = self.session.request(
+            method,
+            f"{self.base_url}{endpoint}",
+            params=params,
+            json=json,
+            timeout=timeout or self.timeout_for(endpoint),
+        )
+        response.raise_for_status()
+        return response
+
+    def get(self, endpoint, params=None, timeout=None):
+        return self.request("GET", endpoint, params=params, timeout=timeout)
+
+    def post(self, endpoint, json=None, timeout=None):
+        return self.request("POST", endpoint, json=json, timeout=timeout)
+
+    def health(self):
+        return self.get("/health")
+
+    def get_memory_banks(self):
+        return self.get("/api/silk/memorybanks").json()['SilkMemoryBanks']
+
+    def query(self, prompt, memory_bank, limit=10):
+        return self.get("/api/silk/query", params={"q": prompt, "limit": limit, "memorybank": memory_bank})
+
+    def embedding(self, text):
+        return self.post("/api/silk/embedding", json={"input": text}).json()['data']
+
+    def embeddings(self, texts):
+        # Several inputs in one call; one result per text, in order
+        return self.post("/api/silk/embedding", json={"input": list(texts)}).json()['data']
+
+    # Async interface
+    def _get_async_client(self):
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_loop is not loop:
+            # httpx clients are bound to the loop they were first used on, so
+            # the previous loop's client is closed on that loop
+            if self._async_closer is not None and not self._async_loop.is_closed():
+                self._async_loop.call_soon_threadsafe(self._async_closer.cancel)
+            connect, read = DEFAULT_TIMEOUT
+            self._async_client = httpx.AsyncClient(
+                base_url=self.base_url,
+                limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+                timeout=httpx.Timeout(read, connect=connect),
+            )
+            self._async_loop = loop
+            self._async_closer = loop.create_task(self._close_on_shutdown(self._async_client))
+        return self._async_client
+
+    async def _close_on_shutdown(self, client):
+        # Waits until cancelled: asyncio.run cancels leftover tasks before closing its loop
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await client.aclose()
+
+    async def arequest(self, method, endpoint, params=None, json=None, timeout=None):
+        connect, read = timeout or self.timeout_for(endpoint)
+        if params:
+            # Match requests, which drops None-valued params
+            params = {key: value for key, value in params.items() if value is not None}
+        response = await self._get_async_client().request(
+            method,
+            endpoint,
+            params=params,
+            json=json,
+            timeout=httpx.Timeout(read, connect=connect),
+        )
+        response.raise_for_status()
+        return response
+
+    async def aget(self, endpoint, params=None, timeout=None):
+        return await self.arequest("GET", endpoint, params=params, timeout=timeout)
+
+    async def apost(self, endpoint, json=None, timeout=None):
+        return await self.arequest("POST", endpoint, json=json, timeout=timeout)
+
+    async def ahealth(self):
+        return await self.aget("/health")
+
+    async def aget_memory_banks(self):
+        return (await self.aget("/api/silk/memorybanks")).json()['SilkMemoryBanks']
+
+    async def aquery(self, prompt, memory_bank, limit=10):
+        return await self.aget("/api/silk/query", params={"q": prompt, "limit": limit, "memorybank": memory_bank})
+
+    async def aembedding(self, text):
+        return (await self.apost("/api/silk/embedding", json={"input": text})).json()['data']
+
+    def close(self):
+        self.session.close()
+
+    async def aclose(self):
+        if self._async_client is not None:
+            self._async_closer.cancel()
+            await self._async_client.aclose()
+            self._async_client = None
+            self._async_loop = None
+            self._async_closer = None
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    # Shared client so every caller in the process reuses the same pool
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = DabarqusClient()
+    return _client
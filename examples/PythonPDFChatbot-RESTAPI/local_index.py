@@ -0,0 +1,340 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import numpy as np
+from results import embedding_vector, get_hits, hit_key, hit_text
+
+LOCAL_INDEX_DIR = "./local_index"
+
+# Starting points for crawling a memory bank through /api/silk/query; every
+# chunk found then seeds further probes with its own opening words
+DEFAULT_PROBES = ["overview", "introduction", "summary", "instructions", "ingredients", "details", "list", "notes"]
+
+
+def _content_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def quantize(matrix, dtype):
+    # Returns (stored matrix, per-row scales or None)
+    if dtype == "float16":
+        return matrix.astype(np.float16), None
+    if dtype == "int8":
+        scales = np.abs(matrix).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        return np.round(matrix / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+    raise ValueError(f"Unknown dtype: {dtype}")
+
+
+def kmeans(matrix, clusters, iterations=10, seed=0):
+    # Spherical k-means on unit vectors, enough for a coarse IVF partition
+    rng = np.random.default_rng(seed)
+    centroids = matrix[rng.choice(len(matrix), clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(matrix @ centroids.T, axis=1)
+        for c in range(clusters):
+            members = matrix[assignment == c]
+            if len(members):
+                centroids[c] = members.mean(axis=0)
+        centroids = _normalize_rows(centroids)
+    return centroids, np.argmax(matrix @ centroids.T, axis=1)
+
+
+def crawl_bank(client, memory_bank, probes=None, probe_limit=100, max_probes=500, probe_words=8):
+    """Collect a memory bank's chunks by issuing probe queries.
+
+    Dabarqus has no endpoint listing a bank's chunks, so the snapshot is built
+    from query results: each newly seen chunk contributes its opening words as
+    another probe, until no probe finds anything new or `max_probes` is hit.
+    """
+    queue = list(probes or DEFAULT_PROBES)
+    asked = set()
+    chunks = {}
+    while queue and len(asked) < max_probes:
+        probe = queue.pop(0)
+        if probe in asked:
+            continue
+        asked.add(probe)
+        try:
+            data = client.query(probe, memory_bank, probe_limit).json()
+        except Exception as e:
+            print(f"Probe '{probe}' failed: {e}")
+            continue
+        for hit in get_hits(data):
+            key = hit_key(hit)
+            if key in chunks or not hit_text(hit).strip():
+                continue
+            chunks[key] = hit
+            queue.append(" ".join(re.findall(r"\w+", hit_text(hit))[:probe_words]))
+    return list(chunks.values()), len(asked)
+
+
+class LocalIndex:
+    """Read-only, memory-mapped copy of a memory bank's chunk embeddings.
+
+    Layout under `directory`: vectors.npy (float16 or int8 rows, unit-norm
+    before quantization), scales.npy for int8, chunks.jsonl with one hit per
+    row, meta.json, and with IVF ivf_centroids.npy / ivf_order.npy /
+    ivf_offsets.npy (rows grouped by cluster).
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, "meta.json"), "r") as f:
+            self.meta = json.load(f)
+        self.vectors = np.load(os.path.join(directory, "vectors.npy"), mmap_mode="r")
+        self.scales = None
+        if self.meta["dtype"] == "int8":
+            self.scales = np.load(os.path.join(directory, "scales.npy"))
+        with open(os.path.join(directory, "chunks.jsonl"), "r") as f:
+            self.chunks = [json.loads(line) for line in f]
+        self.centroids = None
+        if self.meta.get("ivf_lists"):
+            self.centroids = np.load(os.path.join(directory, "ivf_centroids.npy"))
+            self.ivf_order = np.load(os.path.join(directory, "ivf_order.npy"))
+            self.ivf_offsets = np.load(os.path.join(directory, "ivf_offsets.npy"))
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def _scores(self, query_vector, rows=None):
+        vectors = self.vectors if rows is None else self.vectors[rows]
+        scores = vectors.astype(np.float32) @ query_vector
+        if self.scales is not None:
+            scores *= self.scales if rows is None else self.scales[rows]
+        return scores
+
+    def search(self, query_vector, k=10, nprobe=4):
+        """Top-k (row, cosine score) pairs; exact unless the snapshot has an IVF index."""
+        query_vector = np.asarray(query_vector, dtype=np.float32)
+        query_vector = query_vector / (np.linalg.norm(query_vector) or 1.0)
+        rows = None
+        if self.centroids is not None:
+            lists = np.argsort(-(self.centroids @ query_vector))[:nprobe]
+            rows = np.concatenate([self.ivf_order[self.ivf_offsets[c]:self.ivf_offsets[c + 1]] for c in lists])
+        scores = self._scores(query_vector, rows)
+        k = min(k, len(scores))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        candidates = top if rows is None else rows[top]
+        return list(zip(candidates.tolist(), scores[top].tolist()))
+
+    def query(self, query_vector, k=10, nprobe=4):
+        # Same shape as an /api/silk/query response
+        return {"results": [{**self.chunks[row], "score": score} for row, score in self.search(query_vector, k, nprobe)]}
+
+
+def snapshot(client, memory_bank, directory, dtype="float16", ivf_lists=0, probes=None,
+             probe_limit=100, max_probes=500, previous=None, ingestion=None):
+    """Crawl `memory_bank` and write a LocalIndex snapshot to `directory`.
+
+    Embeddings of chunks already in `previous` (a LocalIndex of the same bank)
+    are reused, so a refresh after an ingestion only embeds new chunks.
+    """
+    start = time.perf_counter()
+    chunks, probes_used = crawl_bank(client, memory_bank, probes, probe_limit, max_probes)
+    if not chunks:
+        raise RuntimeError(f"No chunks found in memory bank '{memory_bank}'")
+
+    known = {}
+    if previous is not None:
+        for row, chunk in enumerate(previous.chunks):
+            vector = np.asarray(previous.vectors[row], dtype=np.float32)
+            if previous.scales is not None:
+                vector = vector * previous.scales[row]
+            known[_content_hash(hit_text(chunk))] = vector
+
+    vectors = []
+    embedded = 0
+    for chunk in chunks:
+        digest = _content_hash(hit_text(chunk))
+        if digest not in known:
+            known[digest] = np.asarray(embedding_vector(client.embedding(hit_text(chunk))), dtype=np.float32)
+            embedded += 1
+        vectors.append(known[digest])
+    matrix = _normalize_rows(np.vstack(vectors).astype(np.float32))
+
+    tmp_directory = f"{directory.rstrip(os.sep)}.tmp"
+    if os.path.exists(tmp_directory):
+        _remove_tree(tmp_directory)
+    os.makedirs(tmp_directory)
+    stored, scales = quantize(matrix, dtype)
+    np.save(os.path.join(tmp_directory, "vectors.npy"), stored)
+    if scales is not None:
+        np.save(os.path.join(tmp_directory, "scales.npy"), scales)
+    ivf_lists = min(ivf_lists, len(matrix))
+    if ivf_lists:
+        centroids, assignment = kmeans(matrix, ivf_lists)
+        order = np.argsort(assignment, kind="stable")
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=ivf_lists))])
+        np.save(os.path.join(tmp_directory, "ivf_centroids.npy"), centroids.astype(np.float32))
+        np.save(os.path.join(tmp_directory, "ivf_order.npy"), order)
+        np.save(os.path.join(tmp_directory, "ivf_offsets.npy"), offsets)
+    with open(os.path.join(tmp_directory, "chunks.jsonl"), "w") as f:
+        for chunk in chunks:
+            f.write(json.dumps({key: value for key, value in chunk.items() if key != "score"}) + "\n")
+    with open(os.path.join(tmp_directory, "meta.json"), "w") as f:
+        json.dump({
+            "memory_bank": memory_bank,
+            "dtype": dtype,
+            "dim": int(matrix.shape[1]),
+            "count": len(chunks),
+            "ivf_lists": ivf_lists,
+            "created": time.time(),
+            "ingestion": ingestion,
+        }, f, indent=2)
+
+    # Swap the finished snapshot in; readers holding the old memory map keep working
+    if os.path.exists(directory):
+        old_directory = f"{directory.rstrip(os.sep)}.old"
+        if os.path.exists(old_directory):
+            _remove_tree(old_directory)
+        os.replace(directory, old_directory)
+    os.replace(tmp_directory, directory)
+    print(f"Snapshot of '{memory_bank}': {len(chunks)} chunks from {probes_used} probes, "
+          f"{embedded} embedded ({len(chunks) - embedded} reused) in {time.perf_counter() - start:.1f}s")
+    return LocalIndex(directory)
+
+
+def _remove_tree(directory):
+    for name in os.listdir(directory):
+        os.remove(os.path.join(directory, name))
+    os.rmdir(directory)
+
+
+def _ingestion_signature(item):
+    if item is None:
+        return None
+    return [item.get('status'), item.get('processedChunks'), item.get('totalChunks'),
+            item.get('processedFiles'), item.get('totalFiles')]
+
+
+class LocalReplicas:
+    """Local indexes for the memory banks that have a snapshot under `root`.
+
+    `maybe_refresh()` checks the server's ingestions at most every
+    `check_interval` seconds and re-snapshots, in a background thread, any bank
+    whose ingestion completed since its snapshot was taken. start() runs the
+    check on a background timer, off the request path.
+    """
+
+    def __init__(self, client, root=LOCAL_INDEX_DIR, check_interval=30.0):
+        self.client = client
+        self.root = root
+        self.check_interval = check_interval
+        self._indexes = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._last_check = 0.0
+
+    def get(self, memory_bank):
+        with self._lock:
+            if memory_bank not in self._indexes:
+                directory = os.path.join(self.root, memory_bank)
+                if not os.path.exists(os.path.join(directory, "meta.json")):
+                    return None
+                self._indexes[memory_bank] = LocalIndex(directory)
+            return self._indexes[memory_bank]
+
+    def start(self):
+        def run():
+            while True:
+                self.maybe_refresh()
+                time.sleep(self.check_interval)
+
+        threading.Thread(target=run, daemon=True, name="local-replicas").start()
+        return self
+
+    def search(self, query, memory_bank, limit=10, embed=None):
+        # `embed(text)` defaults to one /api/silk/embedding request
+        index = self.get(memory_bank)
+        vector = embedding_vector((embed or self.client.embedding)(str(query)))
+        return index.query(vector, limit)
+
+    def maybe_refresh(self):
+        if not os.path.isdir(self.root):
+            return
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+        try:
+            items = self.client.get("/api/silk/ingestions").json().get('IngestionItems', [])
+        except Exception as e:
+            print(f"Could not check ingestions for local replicas: {e}")
+            return
+        for item in items:
+            bank = item.get('memoryBankName')
+            index = self.get(bank)
+            signature = _ingestion_signature(item)
+            if (index is None or item.get('status') != "complete" or bank in self._refreshing
+                    or index.meta.get("ingestion") == signature):
+                continue
+            self._refreshing.add(bank)
+            threading.Thread(target=self._refresh, args=(bank, index, signature), daemon=True).start()
+
+    def _refresh(self, memory_bank, previous, signature):
+        try:
+            index = snapshot(self.client, memory_bank, os.path.join(self.root, memory_bank),
+                             previous.meta["dtype"], previous.meta.get("ivf_lists", 0),
+                             previous=previous, ingestion=signature)
+            with self._lock:
+                self._indexes[memory_bank] = index
+        except Exception as e:
+            print(f"Refreshing local replica of '{memory_bank}' failed: {e}")
+        finally:
+            self._refreshing.discard(memory_bank)
+
+
+def main():
+    from dabarqus_client import DabarqusClient
+
+    parser = argparse.ArgumentParser(description="Snapshot a memory bank into a local, memory-mapped vector index")
+    parser.add_argument("command", choices=["snapshot", "query"])
+    parser.add_argument("--memory-bank", required=True, help="Name of the memory bank")
+    parser.add_argument("--server-url", default="http://localhost:6568", help="Dabarqus server URL")
+    parser.add_argument("--index-dir", default=LOCAL_INDEX_DIR, help="Where local indexes are kept")
+    parser.add_argument("--dtype", choices=["float16", "int8"], default="float16")
+    parser.add_argument("--ivf-lists", type=int, default=0, help="Build an IVF index with this many lists (0 = exact search)")
+    parser.add_argument("--probes", help="File with one probe query per line to start the crawl from")
+    parser.add_argument("--max-probes", type=int, default=500)
+    parser.add_argument("--query", help="Query text for the query command")
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    client = DabarqusClient(args.server_url)
+    directory = os.path.join(args.index_dir, args.memory_bank)
+    if args.command == "snapshot":
+        probes = None
+        if args.probes:
+            with open(args.probes, "r") as f:
+                probes = [line.strip() for line in f if line.strip()]
+        items = client.get("/api/silk/ingestions").json().get('IngestionItems', [])
+        item = next((item for item in items if item.get('memoryBankName') == args.memory_bank), None)
+        previous = LocalIndex(directory) if os.path.exists(os.path.join(directory, "meta.json")) else None
+        snapshot(client, args.memory_bank, directory, args.dtype, args.ivf_lists, probes,
+                 max_probes=args.max_probes, previous=previous, ingestion=_ingestion_signature(item))
+    else:
+        index = LocalIndex(directory)
+        vector = embedding_vector(client.embedding(args.query))
+        start = time.perf_counter()
+        results = index.query(vector, args.limit)
+        print(f"{len(results['results'])} results in {(time.perf_counter() - start) * 1e6:.0f} µs")
+        for hit in results["results"]:
+            print(f"{hit['score']:.3f}  {hit_text(hit)[:100]}")
+
+
+if __name__ == "__main__":
+    main()
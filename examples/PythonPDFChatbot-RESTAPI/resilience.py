@@ -0,0 +1,225 @@
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# Deadlines, hedged requests, retries and a circuit breaker for Dabarqus calls.
+#
+# A call runs in a worker thread so the caller gets an answer (or
+# DeadlineExceeded) by its deadline even if the request itself hangs. If an
+# idempotent call has not answered by the recent p95 latency, a duplicate is
+# sent and whichever finishes first wins. Failed idempotent calls are retried
+# with full-jitter backoff while time remains. After repeated failures the
+# circuit opens and calls fail fast until the health check passes again.
+
+
+class ResilienceError(Exception):
+    pass
+
+
+class DeadlineExceeded(ResilienceError):
+    pass
+
+
+class CircuitOpenError(ResilienceError):
+    pass
+
+
+def is_retryable(exc):
+    # Client errors (4xx) will not succeed on a second attempt
+    status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status is None or status >= 500
+
+
+class LatencyTracker:
+    def __init__(self, window=200):
+        self.samples = deque(maxlen=window)
+        self.lock = threading.Lock()
+
+    def record(self, seconds):
+        with self.lock:
+            self.samples.append(seconds)
+
+    def percentile(self, p, min_samples=20):
+        with self.lock:
+            if len(self.samples) < min_samples:
+                return None
+            values = sorted(self.samples)
+        return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures.
+
+    While open, `health_check` (e.g. GET /api/silk/health) is probed in the
+    background at most every `probe_interval` seconds; the circuit closes
+    again once it succeeds. Without a health check, one trial call is let
+    through after `probe_interval`.
+    """
+
+    def __init__(self, name="dabarqus", failure_threshold=5, probe_interval=5.0, health_check=None):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.probe_interval = probe_interval
+        self.health_check = health_check
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.last_probe = 0.0
+        self.probing = False
+        self.lock = threading.Lock()
+        self.times_opened = 0
+
+    def allow(self):
+        with self.lock:
+            if self.state == "closed":
+                return True
+            now = time.monotonic()
+            if now - self.last_probe < self.probe_interval or self.probing:
+                return False
+            self.last_probe = now
+            if self.health_check is None:
+                # Half-open: this call is the trial
+                return True
+            self.probing = True
+        threading.Thread(target=self._probe, daemon=True).start()
+        return False
+
+    def _probe(self):
+        try:
+            self.health_check()
+            healthy = True
+        except Exception:
+            healthy = False
+        with self.lock:
+            self.probing = False
+            if healthy and self.state == "open":
+                self.state = "closed"
+                self.failures = 0
+                print(f"Circuit breaker {self.name}: health check passed, closed")
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            if self.state == "open":
+                self.state = "closed"
+                print(f"Circuit breaker {self.name}: trial call succeeded, closed")
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == "closed" and self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = self.last_probe = time.monotonic()
+                self.times_opened += 1
+                print(f"Circuit breaker {self.name}: opened after {self.failures} consecutive failures")
+
+
+class ResilientCaller:
+    """Runs calls to one kind of endpoint with a deadline, hedging, retries
+    and an optional CircuitBreaker, counting what each of them did."""
+
+    def __init__(self, name, deadline=10.0, hedge_percentile=95, min_hedge_delay=0.02, retries=2,
+                 backoff=0.1, breaker=None, workers=16):
+        self.name = name
+        self.deadline = deadline
+        self.hedge_percentile = hedge_percentile
+        self.min_hedge_delay = min_hedge_delay
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = breaker
+        self.latency = LatencyTracker()
+        # Abandoned (timed out or out-hedged) requests finish here in the background
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"resilient-{name}")
+        self.lock = threading.Lock()
+        self.counters = {
+            "calls": 0, "successes": 0, "failures": 0, "deadline_exceeded": 0, "retries": 0,
+            "hedges": 0, "hedge_wins": 0, "short_circuited": 0, "stale_served": 0,
+        }
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def hedge_delay(self):
+        p = self.latency.percentile(self.hedge_percentile)
+        return None if p is None else max(self.min_hedge_delay, p)
+
+    def call(self, fn, idempotent=True, deadline=None):
+        """Return fn(), raising CircuitOpenError, DeadlineExceeded or the last
+        error from fn. Only idempotent calls are hedged and retried."""
+        self.count("calls")
+        if self.breaker is not None and not self.breaker.allow():
+            self.count("short_circuited")
+            raise CircuitOpenError(f"{self.name}: circuit open, Dabarqus unhealthy")
+
+        deadline_at = time.monotonic() + (deadline or self.deadline)
+        attempts = 1 + (self.retries if idempotent else 0)
+        for attempt in range(attempts):
+            try:
+                result = self._attempt(fn, idempotent, deadline_at)
+            except DeadlineExceeded:
+                self.count("deadline_exceeded")
+                self.count("failures")
+                if self.breaker is not None:
+                    self.breaker.record_failure()
+                raise
+            except Exception as e:
+                # Only Dabarqus being unhealthy counts against the breaker, not a bad request
+                if self.breaker is not None and is_retryable(e):
+                    self.breaker.record_failure()
+                remaining = deadline_at - time.monotonic()
+                if attempt + 1 >= attempts or not is_retryable(e) or remaining <= 0:
+                    self.count("failures")
+                    raise
+                self.count("retries")
+                time.sleep(min(remaining, random.uniform(0, self.backoff * 2 ** attempt)))
+                continue
+            self.count("successes")
+            if self.breaker is not None:
+                self.breaker.record_success()
+            return result
+
+    def _attempt(self, fn, idempotent, deadline_at):
+        start = time.monotonic()
+        pending = {self.executor.submit(fn): False}  # future -> is hedge
+        hedge_delay = self.hedge_delay() if idempotent else None
+        error = None
+        hedged = False  # at most one hedge per attempt, even if it fails while the original is pending
+        while pending:
+            timeout = deadline_at - time.monotonic()
+            hedge_due = hedge_delay is not None and not hedged
+            if hedge_due:
+                timeout = min(timeout, start + hedge_delay - time.monotonic())
+            done, _ = wait(pending, timeout=max(0.0, timeout), return_when=FIRST_COMPLETED)
+            for future in done:
+                is_hedge = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                self.latency.record(time.monotonic() - start)
+                if is_hedge:
+                    self.count("hedge_wins")
+                return result
+            if done:
+                continue
+            if time.monotonic() >= deadline_at:
+                raise DeadlineExceeded(f"{self.name}: no response within the deadline")
+            if hedge_due:
+                self.count("hedges")
+                hedged = True
+                pending[self.executor.submit(fn)] = True
+        raise error
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+        p95 = self.latency.percentile(95)
+        stats["p95_ms"] = p95 * 1000 if p95 is not None else None
+        if self.breaker is not None:
+            stats["breaker"] = self.breaker.state
+            stats["breaker_opened"] = self.breaker.times_opened
+        return stats
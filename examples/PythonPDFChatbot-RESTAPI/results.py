@@ -0,0 +1,77 @@
+# Helpers for working with /api/silk/query and /api/silk/embedding responses.
+#
+# The query endpoint returns either a bare list of hits or an object holding
+# the list (e.g. {"results": [...]}); each hit carries the chunk text, a score
+# and some metadata about the source document. These helpers hide those
+# differences from the rest of the example.
+
+HIT_LIST_KEYS = ("results", "Results", "hits", "data")
+TEXT_KEYS = ("text", "content", "chunk", "document")
+SCORE_KEYS = ("score", "similarity", "relevance")
+SOURCE_KEYS = ("source", "file", "fileName", "filename", "path", "reference")
+
+
+def get_hits(data):
+    if data is None:
+        return []
+    if isinstance(data, list):
+        return data
+    if isinstance(data, dict):
+        for key in HIT_LIST_KEYS:
+            if isinstance(data.get(key), list):
+                return data[key]
+    return []
+
+
+def with_hits(data, hits):
+    # Rebuild a response of the same shape as `data` holding `hits`
+    if isinstance(data, dict):
+        for key in HIT_LIST_KEYS:
+            if isinstance(data.get(key), list):
+                return {**data, key: hits}
+        return {**data, "results": hits}
+    return hits
+
+
+def hit_text(hit):
+    if isinstance(hit, str):
+        return hit
+    for key in TEXT_KEYS:
+        if isinstance(hit.get(key), str):
+            return hit[key]
+    return ""
+
+
+def hit_score(hit):
+    if isinstance(hit, dict):
+        for key in SCORE_KEYS:
+            if isinstance(hit.get(key), (int, float)):
+                return float(hit[key])
+    return 0.0
+
+
+def hit_source(hit):
+    if not isinstance(hit, dict):
+        return ""
+    for container in (hit, hit.get("metadata") or {}):
+        for key in SOURCE_KEYS:
+            if container.get(key):
+                return str(container[key])
+    return ""
+
+
+def hit_key(hit):
+    # Identity of a chunk for de-duplication across result sets
+    return (hit_source(hit), hit_text(hit))
+
+
+def embedding_vector(data):
+    # /api/silk/embedding returns {"data": ...}; accept the whole response, the
+    # OpenAI-style [{"embedding": [...]}] list, or a bare vector
+    if isinstance(data, dict):
+        if "data" in data:
+            return embedding_vector(data["data"])
+        return data.get("embedding")
+    if isinstance(data, list) and data and isinstance(data[0], dict):
+        return data[0].get("embedding")
+    return data
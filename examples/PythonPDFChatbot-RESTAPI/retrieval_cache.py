@@ -0,0 +1,151 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_query(query):
+    return " ".join(str(query).lower().split())
+
+
+class RetrievalCache:
+    """LRU + TTL cache for /api/silk/query results.
+
+    Entries are keyed on the normalized (memory bank, query, limit) and evicted
+    least-recently-used first once either `max_entries` or `max_bytes` is
+    exceeded. `fetch_ingestions`, if given, returns the server's ingestion items
+    (as from /api/silk/ingestions); it is checked at most every
+    `ingestion_check_interval` seconds and a bank's entries are dropped when an
+    ingestion into it completes.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024, ttl=300.0,
+                 fetch_ingestions=None, ingestion_check_interval=5.0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.fetch_ingestions = fetch_ingestions
+        self.ingestion_check_interval = ingestion_check_interval
+
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._ingestions = None  # bank -> (status, counters) as last seen
+        self._last_ingestion_check = 0.0
+
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.stale_hits = 0
+
+    def _key(self, memory_bank, query, limit):
+        return (memory_bank, normalize_query(query), int(limit) if limit is not None else None)
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def get(self, memory_bank, query, limit):
+        self.check_ingestions()
+        key = self._key(memory_bank, query, limit)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] < time.monotonic():
+                # Left in place (until evicted or replaced) for get_stale()
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, memory_bank, query, limit, value, size=None):
+        if size is None:
+            size = len(json.dumps(value, default=str))
+        if size > self.max_bytes:
+            return
+        key = self._key(memory_bank, query, limit)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, size, value)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def get_stale(self, memory_bank, query, limit):
+        # Entry regardless of TTL, for serving while the backend is unavailable
+        key = self._key(memory_bank, query, limit)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self.stale_hits += 1
+            return entry[2]
+
+    def get_or_fetch(self, memory_bank, query, limit, fetch):
+        value = self.get(memory_bank, query, limit)
+        if value is None:
+            value = fetch()
+            if value is not None:
+                self.put(memory_bank, query, limit, value)
+        return value
+
+    def invalidate_bank(self, memory_bank):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == memory_bank]:
+                self._remove(key)
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def check_ingestions(self, force=False):
+        if self.fetch_ingestions is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_ingestion_check < self.ingestion_check_interval:
+            return
+        self._last_ingestion_check = now
+        try:
+            items = self.fetch_ingestions()
+        except Exception as e:
+            print(f"Could not check ingestions, cache not refreshed: {e}")
+            return
+
+        seen = {}
+        for item in items:
+            counters = (item.get('processedChunks'), item.get('totalChunks'),
+                        item.get('processedFiles'), item.get('totalFiles'))
+            seen[item.get('memoryBankName')] = (item.get('status'), counters)
+
+        if self._ingestions is not None:
+            for bank, (status, counters) in seen.items():
+                # A bank whose ingestion finished since the last check: either
+                # one we saw running, or a new/changed completed ingestion
+                if status == "complete" and self._ingestions.get(bank) != (status, counters):
+                    self.invalidate_bank(bank)
+        self._ingestions = seen
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "expirations": self.expirations,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "stale_hits": self.stale_hits,
+            }
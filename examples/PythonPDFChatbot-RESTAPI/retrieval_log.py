@@ -0,0 +1,254 @@
+import argparse
+import atexit
+import glob
+import gzip
+import json
+import os
+import queue
+import threading
+import time
+import zlib
+from collections import deque
+from datetime import datetime
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+EXTENSIONS = {None: ".jsonl", "gzip": ".jsonl.gz", "zstd": ".jsonl.zst"}
+
+
+def _open_log(path, mode):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode)
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError("zstandard is not installed; run `pip install zstandard` to use zstd logs")
+        return zstandard.open(path, mode)
+    return open(path, mode)
+
+
+class RetrievalLogWriter:
+    """Appends retrieval records to a rotating JSONL log from a background thread.
+
+    Callers only put the record on a bounded queue; serialization, compression
+    and disk writes happen on the writer thread, in batches. When the queue is
+    full, `policy` decides whether the record is dropped ("drop") or the caller
+    waits for room ("block"). A new file is started once the current one holds
+    `max_bytes` of (uncompressed) JSON or is `max_age` seconds old.
+    """
+
+    def __init__(self, directory='./retrievals/', max_bytes=64 * 1024 * 1024, max_age=3600.0,
+                 compression=None, queue_size=1024, policy="drop", batch_size=256, flush_interval=1.0):
+        if compression not in EXTENSIONS:
+            raise ValueError(f"Unknown compression: {compression}")
+        if compression == "zstd" and zstandard is None:
+            raise RuntimeError("zstandard is not installed; run `pip install zstandard` to use zstd logs")
+        if policy not in ("drop", "block"):
+            raise ValueError(f"Unknown queue policy: {policy}")
+
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.compression = compression
+        self.policy = policy
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._file = None
+        self._path = None
+        self._opened_at = 0.0
+        self._bytes = 0
+        self._sequence = 0
+
+        self.written = 0
+        self.dropped = 0
+        self.rotations = 0
+
+        self._thread = threading.Thread(target=self._run, name="retrieval-log", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    @property
+    def current_path(self):
+        return self._path
+
+    def log(self, record):
+        if self.policy == "block":
+            self._queue.put(record)
+            return True
+        try:
+            self._queue.put_nowait(record)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def _rotate(self):
+        if self._file is not None:
+            self._file.close()
+            self.rotations += 1
+        os.makedirs(self.directory, exist_ok=True)
+        self._sequence += 1
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self._path = os.path.join(
+            self.directory, f"retrievals_{timestamp}_{self._sequence:04d}{EXTENSIONS[self.compression]}"
+        )
+        self._file = _open_log(self._path, "wb")
+        self._opened_at = time.monotonic()
+        self._bytes = 0
+
+    def _write(self, batch):
+        if (self._file is None or self._bytes >= self.max_bytes
+                or time.monotonic() - self._opened_at >= self.max_age):
+            self._rotate()
+        data = "".join(json.dumps(record, default=str) + "\n" for record in batch).encode("utf-8")
+        self._file.write(data)
+        self._file.flush()
+        self._bytes += len(data)
+        self.written += len(batch)
+
+    def _run(self):
+        while True:
+            batch = []
+            try:
+                record = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            while record is not None:
+                batch.append(record)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    record = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                try:
+                    self._write(batch)
+                except Exception as e:
+                    self.dropped += len(batch)
+                    print(f"Failed to write retrieval log: {e}")
+            for _ in range(len(batch) + (record is None)):
+                self._queue.task_done()
+            if record is None:
+                break
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+
+def log_files(path):
+    if os.path.isfile(path):
+        return [path]
+    files = []
+    for extension in EXTENSIONS.values():
+        files.extend(glob.glob(os.path.join(path, f"*{extension}")))
+    # File names start with a timestamp and sequence number, so this is write order
+    return sorted(set(files), key=os.path.basename)
+
+
+def _truncated_errors():
+    # What reading a compressed log that is still open, or was never closed, raises at its end
+    errors = (EOFError, zlib.error, gzip.BadGzipFile)
+    if zstandard is not None:
+        errors += (zstandard.ZstdError,)
+    return errors
+
+
+def read_log(path):
+    # Yield every record from a log file, or from all log files in a directory
+    truncated = _truncated_errors()
+    for file_path in log_files(path):
+        with _open_log(file_path, "rb") as f:
+            try:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        # A partially written final line from an unclean shutdown
+                        continue
+            except truncated:
+                # The live log, or one left by an unclean shutdown: keep what was decoded
+                continue
+
+
+def summarize(path):
+    count = 0
+    first = last = None
+    queries = {}
+    banks = {}
+    for record in read_log(path):
+        count += 1
+        first = record.get("timestamp") if first is None else first
+        last = record.get("timestamp", last)
+        queries[record.get("query")] = queries.get(record.get("query"), 0) + 1
+        banks[record.get("memorybank")] = banks.get(record.get("memorybank"), 0) + 1
+    print(f"Files: {len(log_files(path))}")
+    print(f"Records: {count}")
+    if count:
+        print(f"From {datetime.fromtimestamp(first)} to {datetime.fromtimestamp(last)}")
+        print(f"Memory banks: {banks}")
+        print("Most frequent queries:")
+        for query, n in sorted(queries.items(), key=lambda item: item[1], reverse=True)[:10]:
+            print(f"  {n:6d}  {query}")
+
+
+def replay(path, server_url, speed=0.0):
+    # Re-issue the logged queries, optionally preserving their spacing in time
+    from dabarqus_client import DabarqusClient
+
+    client = DabarqusClient(server_url)
+    previous = None
+    latencies = []
+    errors = 0
+    for record in read_log(path):
+        if speed and previous is not None:
+            time.sleep(max(0.0, (record["timestamp"] - previous) / speed))
+        previous = record["timestamp"]
+        start = time.perf_counter()
+        try:
+            client.query(record["query"], record["memorybank"], record.get("limit", 10))
+        except Exception as e:
+            errors += 1
+            print(f"Query failed: {e}")
+            continue
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    if latencies:
+        print(f"Replayed {len(latencies)} queries ({errors} errors), "
+              f"median {latencies[len(latencies) // 2]:.1f} ms, max {latencies[-1]:.1f} ms")
+    else:
+        print(f"No queries replayed ({errors} errors)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or replay the retrieval log")
+    parser.add_argument("command", choices=["summary", "show", "replay"])
+    parser.add_argument("path", nargs="?", default="./retrievals/", help="Log file or directory")
+    parser.add_argument("--tail", type=int, default=10, help="Number of records to show")
+    parser.add_argument("--server-url", default="http://localhost:6568", help="Dabarqus server URL for replay")
+    parser.add_argument("--speed", type=float, default=0.0, help="Replay at this multiple of the recorded rate (0 = as fast as possible)")
+    args = parser.parse_args()
+
+    if args.command == "summary":
+        summarize(args.path)
+    elif args.command == "show":
+        for record in deque(read_log(args.path), maxlen=args.tail):
+            print(json.dumps(record, indent=2))
+    else:
+        replay(args.path, args.server_url, args.speed)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,31 +1,50 @@
-import uuid
 import time
-import os
 import threading
 import sys
 import itertools
 import requests
 import ollama
+from dabarqus_client import get_client
+from retrieval_cache import RetrievalCache
+from rewrite_cache import RewriteCache
+from retrieval_log import RetrievalLogWriter
+from local_index import LocalReplicas
+from microbatch import BurstBatch, EmbeddingBatch, MicroBatcher
+from resilience import CircuitBreaker, ResilienceError, ResilientCaller
 from colorama import Fore, Back, Style
 
-def serialize_response(json_string, directory='./retrievals/'):
-    # Ensure the directory exists
-    if not os.path.exists(directory):
-        os.makedirs(directory)
+# Shared result cache; entries for a bank are dropped when an ingestion into it completes
+retrieval_cache = RetrievalCache(
+    fetch_ingestions=lambda: get_client().get("/api/silk/ingestions").json().get('IngestionItems', [])
+)
 
-    # Generate a unique filename using timestamp and UUID
-    unique_filename = f"{int(time.time())}_{uuid.uuid4()}.json"
-    file_path = os.path.join(directory, unique_filename)
+# Concurrent embedding and query requests from all chat sessions, gathered into
+# batches over a few milliseconds
+embedding_batcher = MicroBatcher(
+    EmbeddingBatch(lambda texts: get_client().embeddings(texts), lambda text: get_client().embedding(text)),
+    name="embedding",
+)
+query_batcher = MicroBatcher(
+    BurstBatch(lambda prompt, memory_bank, limit: get_client().query(prompt, memory_bank, limit)),
+    name="query",
+)
 
-    # Write the JSON string to the file
-    with open(file_path, 'w') as file:
-        file.write(json_string)
+# Keyword rewrites, reused for repeated (exact) and paraphrased (embedding similarity) prompts
+rewrite_cache = RewriteCache(embed=embedding_batcher, path="rewrite_cache.json")
 
-    # Provide the link to the file
-    print(Fore.LIGHTBLUE_EX + f"Retrieved info has been save to {file_path}" + Style.RESET_ALL)
-    print("___")
-    print()
-    return file_path
+# Retrieval responses are appended to a rotating JSONL log by a background thread
+retrieval_log = RetrievalLogWriter(directory='./retrievals/', compression="gzip")
+
+# Deadline, hedging, retries and a /api/silk/health-driven circuit breaker for queries
+query_resilience = ResilientCaller(
+    "query",
+    deadline=10.0,
+    breaker=CircuitBreaker("query", health_check=lambda: get_client().get("/api/silk/health")),
+)
+
+# In-process replicas of memory banks snapshotted with `python local_index.py snapshot`;
+# a background timer re-snapshots a bank when an ingestion into it completes
+local_replicas = LocalReplicas(get_client()).start()
 
 def convert_prompt_to_retrieval_prompt(prompt, prompt_template, model="llama3"):
     # llm = Ollama(
@@ -41,6 +60,17 @@ def convert_prompt_to_retrieval_prompt(prompt, prompt_template, model="llama3"):
     ])
     return response
 
+def get_retrieval_keywords(prompt, prompt_template, model="llama3"):
+    keywords = rewrite_cache.rewrite(
+        prompt,
+        lambda p: convert_prompt_to_retrieval_prompt(p, prompt_template, model)['message']['content'].strip(),
+        context=model,
+    )
+    stats = rewrite_cache.stats()
+    print(Fore.LIGHTBLUE_EX + f"Rewrite cache: {stats['exact_hits']} exact / {stats['semantic_hits']} semantic hits, "
+          f"{stats['misses']} misses, {stats['llm_ms_saved'] / 1000:.1f}s of LLM time saved" + Style.RESET_ALL)
+    return keywords
+
 def display_spinner_and_wait_message(stop_event, message=""):
     spinner = itertools.cycle(['-', '\\', '|', '/'])
     while not stop_event.is_set():  # Check the stop event
@@ -52,26 +82,66 @@ def display_spinner_and_wait_message(stop_event, message=""):
     sys.stdout.flush()
 
 
-def retrieve_data(prompt, memory_bank, query_limit=10):
+def retrieve_data(prompt, memory_bank, query_limit=10, use_cache=True, show_spinner=True):
+    if use_cache:
+        cached = retrieval_cache.get(memory_bank, prompt, query_limit)
+        if cached is not None:
+            stats = retrieval_cache.stats()
+            print(Fore.LIGHTBLUE_EX + f"Retrieved info served from cache (hits: {stats['hits']}, misses: {stats['misses']})" + Style.RESET_ALL)
+            return cached
+
     stop_event = threading.Event()
     t = threading.Thread(target=display_spinner_and_wait_message, args=(stop_event, "Retrieving info from database..."))
-    t.start()
-
-    url = "http://localhost:6568/api/silk/query"
-    params = {
-        "q": prompt,
-        "limit": query_limit,
-        "memorybank": memory_bank  # Changed from "memoryBank" to "memorybank"
-    }
+    if show_spinner:
+        t.start()
 
     try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()  # Raises an HTTPError for bad responses
-        serialize_response(response.text)
-        return response.json()
-    except requests.exceptions.RequestException as e:
+        # Pooled keep-alive request; raises an HTTPError for bad responses
+        response = query_resilience.call(lambda: query_batcher((prompt, memory_bank, query_limit)))
+        data = response.json()
+        retrieval_log.log({
+            "timestamp": time.time(),
+            "memorybank": memory_bank,
+            "query": prompt,
+            "limit": query_limit,
+            "response": data,
+        })
+        if use_cache:
+            retrieval_cache.put(memory_bank, prompt, query_limit, data, size=len(response.content))
+        return data
+    except (requests.exceptions.RequestException, ResilienceError) as e:
         print(f"An error occurred: {e}")
-        return None
+        # While Dabarqus is unavailable, an expired cached result beats none
+        stale = retrieval_cache.get_stale(memory_bank, prompt, query_limit) if use_cache else None
+        if stale is not None:
+            query_resilience.count("stale_served")
+            print(Fore.LIGHTBLUE_EX + "Serving a stale cached result" + Style.RESET_ALL)
+        stats = query_resilience.stats()
+        print(f"Query resilience: {stats['failures']} failures, {stats['deadline_exceeded']} deadlines exceeded, "
+              f"{stats['retries']} retries, {stats['hedges']} hedges, {stats['short_circuited']} short-circuited, "
+              f"breaker {stats['breaker']}")
+        return stale
     finally:
         stop_event.set()  # Signal the spinner thread to stop
-        t.join()  # Wait for the spinner thread to finish
\ No newline at end of file
+        if show_spinner:
+            t.join()  # Wait for the spinner thread to finish
+
+
+def search_local_replica(prompt, memory_bank, query_limit=10):
+    # The snapshot answers in-process; only the query embedding goes to Dabarqus,
+    # batched and under the query deadline. Any failure falls back to the server.
+    try:
+        data = query_resilience.call(
+            lambda: local_replicas.search(prompt, memory_bank, query_limit, embed=embedding_batcher)
+        )
+    except Exception as e:
+        print(f"Local replica of '{memory_bank}' failed, querying Dabarqus instead: {e}")
+        return retrieve_data(prompt, memory_bank, query_limit, show_spinner=False)
+    retrieval_log.log({
+        "timestamp": time.time(),
+        "memorybank": memory_bank,
+        "query": prompt,
+        "limit": query_limit,
+        "response": data,
+    })
+    return data
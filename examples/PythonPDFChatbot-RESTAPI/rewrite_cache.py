@@ -0,0 +1,182 @@
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from results import embedding_vector
+from retrieval_cache import normalize_query
+
+
+class RewriteCache:
+    """Two-tier cache for the keyword rewrite LLM call.
+
+    Tier one is an exact match on the normalized prompt. Tier two embeds the
+    prompt with `embed(text)` (e.g. /api/silk/embedding) and reuses the stored
+    rewrite of the most similar earlier prompt when the cosine similarity is at
+    least `similarity_threshold`. Entries are scoped by `context` (the model,
+    usually), and evicted least-recently-used beyond `max_entries`. When a
+    path is given they are saved to `path` as JSON in the background,
+    `save_delay` seconds after a new rewrite, and again at exit.
+    """
+
+    def __init__(self, embed=None, max_entries=512, similarity_threshold=0.92, path=None, save_delay=5.0):
+        self.embed = embed
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.path = path
+        self.save_delay = save_delay
+
+        # (context, normalized prompt) -> {"keywords", "vector", "llm_ms"}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._save_timer = None
+        self._dirty = False
+
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.llm_ms_spent = 0.0
+        self.llm_ms_saved = 0.0
+
+        if path and os.path.exists(path):
+            self.load()
+        if path:
+            atexit.register(self.flush)
+
+    def _embed(self, prompt):
+        if self.embed is None:
+            return None
+        try:
+            vector = np.asarray(embedding_vector(self.embed(prompt)), dtype=np.float32)
+        except Exception as e:
+            print(f"Could not embed prompt, skipping semantic rewrite cache: {e}")
+            return None
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def _most_similar(self, context, vector):
+        with self._lock:
+            candidates = [(key, entry) for key, entry in self._entries.items()
+                          if key[0] == context and entry["vector"] is not None
+                          and len(entry["vector"]) == len(vector)]
+        if not candidates:
+            return None, 0.0
+        matrix = np.array([entry["vector"] for _, entry in candidates], dtype=np.float32)
+        similarities = matrix @ vector
+        best = int(np.argmax(similarities))
+        return candidates[best][0], float(similarities[best])
+
+    def _store(self, key, keywords, vector, llm_ms):
+        with self._lock:
+            self._entries[key] = {
+                "keywords": keywords,
+                "vector": vector.tolist() if vector is not None else None,
+                "llm_ms": llm_ms,
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def rewrite(self, prompt, rewrite_fn, context=""):
+        key = (context, normalize_query(prompt))
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                self.llm_ms_saved += entry["llm_ms"]
+                return entry["keywords"]
+
+        vector = self._embed(prompt)
+        if vector is not None:
+            similar_key, similarity = self._most_similar(context, vector)
+            if similar_key is not None and similarity >= self.similarity_threshold:
+                with self._lock:
+                    entry = self._entries.get(similar_key)
+                    if entry is not None:
+                        self.semantic_hits += 1
+                        self.llm_ms_saved += entry["llm_ms"]
+                if entry is not None:
+                    # Remember the paraphrase too, so it is an exact hit next time
+                    self._store(key, entry["keywords"], vector, entry["llm_ms"])
+                    return entry["keywords"]
+
+        start = time.perf_counter()
+        keywords = rewrite_fn(prompt)
+        llm_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self.misses += 1
+            self.llm_ms_spent += llm_ms
+        self._store(key, keywords, vector, llm_ms)
+        if self.path:
+            self._schedule_save()
+        return keywords
+
+    def _schedule_save(self):
+        # Debounced: a burst of new rewrites is written once, off the request path
+        with self._lock:
+            self._dirty = True
+            if self._save_timer is not None:
+                return
+            self._save_timer = threading.Timer(self.save_delay, self.flush)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def flush(self):
+        with self._lock:
+            self._save_timer = None
+            dirty, self._dirty = self._dirty, False
+        if dirty:
+            try:
+                self.save()
+            except OSError as e:
+                print(f"Could not save rewrite cache to {self.path}: {e}")
+
+    def save(self):
+        with self._lock:
+            records = [{"context": context, "prompt": prompt, **entry}
+                       for (context, prompt), entry in self._entries.items()]
+        # One writer at a time, each through its own temp file in the same directory
+        with self._save_lock:
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)),
+                                            prefix=os.path.basename(self.path), suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump(records, f)
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+
+    def load(self):
+        try:
+            with open(self.path, "r") as f:
+                records = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Could not load rewrite cache from {self.path}: {e}")
+            return
+        with self._lock:
+            for record in records[-self.max_entries:]:
+                self._entries[(record["context"], record["prompt"])] = {
+                    "keywords": record["keywords"],
+                    "vector": record.get("vector"),
+                    "llm_ms": record.get("llm_ms", 0.0),
+                }
+
+    def stats(self):
+        with self._lock:
+            lookups = self.exact_hits + self.semantic_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+                "llm_ms_spent": self.llm_ms_spent,
+                "llm_ms_saved": self.llm_ms_saved,
+            }
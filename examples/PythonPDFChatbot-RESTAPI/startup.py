@@ -0,0 +1,141 @@
+import threading
+import time
+
+# Lets the UI come up before Dabarqus and Ollama have answered: dropdown choices
+# are fetched in a background thread and refreshed periodically, and the
+# selected model and memory banks are pre-warmed off the request path.
+
+
+class BackgroundChoices:
+    """Dropdown choices loaded by a background thread.
+
+    `loaders` maps a name to (load function, default). get() never blocks; it
+    returns the default until the first load finishes. `version` increases
+    whenever a reload changes any value. `on_ready(values)` is called once,
+    after the first load.
+    """
+
+    def __init__(self, loaders, refresh_interval=60.0, on_ready=None):
+        self.loaders = loaders
+        self.refresh_interval = refresh_interval
+        self.on_ready = on_ready
+        self.values = {name: default for name, (_, default) in loaders.items()}
+        self.version = 0
+        self.ready = threading.Event()
+        self.lock = threading.Lock()
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True, name="background-choices").start()
+        return self
+
+    def _run(self):
+        self.refresh()
+        self.ready.set()
+        if self.on_ready is not None:
+            self.on_ready(dict(self.values))
+        while True:
+            time.sleep(self.refresh_interval)
+            self.refresh()
+
+    def refresh(self):
+        for name, (load, _) in self.loaders.items():
+            start = time.perf_counter()
+            try:
+                value = load()
+            except Exception as e:
+                print(f"Background load of {name} failed: {e}")
+                continue
+            with self.lock:
+                if value != self.values[name]:
+                    self.values[name] = value
+                    self.version += 1
+            if not self.ready.is_set():
+                print(f"Loaded {name} in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    def get(self, name):
+        with self.lock:
+            return self.values[name]
+
+    def wait(self, timeout=None):
+        return self.ready.wait(timeout)
+
+
+def parse_duration(value):
+    # Ollama-style keep_alive ("30m", "1h", "90s" or a number of seconds) in seconds
+    value = str(value).strip()
+    units = {"s": 1, "m": 60, "h": 3600}
+    if value and value[-1] in units:
+        return float(value[:-1]) * units[value[-1]]
+    return float(value)
+
+
+class Prewarmer:
+    """Runs warm-up calls (model load, first embedding/query) once per target
+    in the background, and labels chat turns as cold or warm.
+
+    A target counts as warm for `keep_alive` seconds after it was warmed up or
+    last used by a turn (touch()), matching how long Ollama keeps the model
+    loaded; after that it is warmed up again.
+    """
+
+    def __init__(self, keep_alive=None):
+        self.keep_alive = keep_alive
+        self.warm_ms = {}  # target -> warm-up duration
+        self.warm_at = {}  # target -> time.monotonic() it was last warmed up or used
+        self.running = set()
+        self.lock = threading.Lock()
+        self.first_turn = {}  # "cold"/"warm" -> latency of the first turn in that state
+
+    def _is_warm(self, target, now):
+        warm_at = self.warm_at.get(target)
+        return warm_at is not None and (self.keep_alive is None or now - warm_at < self.keep_alive)
+
+    def warm(self, target, fn):
+        with self.lock:
+            if self._is_warm(target, time.monotonic()) or target in self.running:
+                return
+            self.running.add(target)
+        threading.Thread(target=self._run, args=(target, fn), daemon=True).start()
+
+    def _run(self, target, fn):
+        start = time.perf_counter()
+        try:
+            fn()
+        except Exception as e:
+            print(f"Pre-warming {target} failed: {e}")
+            return
+        finally:
+            with self.lock:
+                self.running.discard(target)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self.lock:
+            self.warm_ms[target] = elapsed_ms
+            self.warm_at[target] = time.monotonic()
+        print(f"Pre-warmed {target} in {elapsed_ms:.0f} ms")
+
+    def touch(self, targets):
+        # A turn that used the targets keeps them loaded for another keep_alive
+        now = time.monotonic()
+        with self.lock:
+            for target in targets:
+                self.warm_at[target] = now
+
+    def is_warm(self, targets):
+        now = time.monotonic()
+        with self.lock:
+            return all(self._is_warm(target, now) for target in targets)
+
+    def time_first_update(self, updates, started_at, warm):
+        """Pass through a chat turn's UI updates, recording the time from
+        `started_at` (perf_counter) to the first one."""
+        state = "warm" if warm else "cold"
+        first = True
+        for update in updates:
+            if first:
+                first = False
+                latency_ms = (time.perf_counter() - started_at) * 1000
+                with self.lock:
+                    self.first_turn.setdefault(state, latency_ms)
+                    summary = ", ".join(f"first {name} turn {ms:.0f} ms" for name, ms in self.first_turn.items())
+                print(f"Turn latency to first token: {latency_ms:.0f} ms ({state}); {summary}")
+            yield update
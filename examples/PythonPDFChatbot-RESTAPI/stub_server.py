@@ -0,0 +1,348 @@
+# Stand-in for the Dabarqus service (and Ollama's chat API) for offline and
+# performance testing of the chatbot examples.
+#
+# Query responses are replayed from recorded traffic: the retrieval log written
+# by retrieval_log.py, and the one-file-per-query JSON files the older
+# serialize_response wrote. A recorded (memory bank, query) is replayed exactly;
+# other queries get the recording with the most similar query. Latency is drawn
+# from a configurable distribution per endpoint, errors can be injected, and a
+# fake LLM streams a canned answer at a set token rate.
+#
+#   python stub_server.py --recordings ./retrievals/ --latency query=lognormal:40,0.5 --error-rate 0.01
+#   OLLAMA_HOST=http://127.0.0.1:6568 python app.py
+import argparse
+import glob
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from results import get_hits
+from retrieval_log import read_log
+
+DEFAULT_ANSWER = (
+    "Based on the recipes in your memory bank, here is what I found. "
+    "Preheat the oven, combine the ingredients as listed, and bake until golden. "
+    "The reference for this recipe is included in the retrieved results."
+)
+
+# Endpoint groups that latency can be configured for
+ENDPOINTS = ("health", "query", "memorybanks", "embedding", "ingestions", "llm")
+
+
+def parse_latency(spec):
+    """Latency sampler in ms from a spec like "fixed:20", "uniform:10,50",
+    "normal:30,5", "lognormal:40,0.5" (median, sigma) or "exp:25" (mean)."""
+    kind, _, values = spec.partition(":")
+    params = [float(value) for value in values.split(",") if value]
+    if kind == "fixed":
+        return lambda rng: params[0]
+    if kind == "uniform":
+        return lambda rng: rng.uniform(params[0], params[1])
+    if kind == "normal":
+        return lambda rng: max(0.0, rng.gauss(params[0], params[1]))
+    if kind == "lognormal":
+        return lambda rng: rng.lognormvariate(math.log(params[0]), params[1])
+    if kind == "exp":
+        return lambda rng: rng.expovariate(1.0 / params[0])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+def _words(text):
+    return set(re.findall(r"\w+", str(text).lower()))
+
+
+def hashed_embedding(text, dim=384):
+    # Deterministic bag-of-words vector, so paraphrases come out similar
+    vector = [0.0] * dim
+    for word in re.findall(r"\w+", str(text).lower()):
+        digest = hashlib.md5(word.encode("utf-8")).digest()
+        index = int.from_bytes(digest[:4], "little") % dim
+        vector[index] += 1.0 if digest[4] & 1 else -1.0
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [value / norm for value in vector]
+
+
+class Recordings:
+    def __init__(self):
+        self.exact = {}  # (bank, normalized query) -> response
+        self.by_query = []  # (words, response)
+        self.anonymous = []  # responses without a recorded query
+        self.banks = set()
+
+    def load(self, path):
+        for record in read_log(path):
+            self.add(record.get("memorybank"), record.get("query"), record.get("response"))
+        for file_path in glob.glob(os.path.join(path, "*.json")) if os.path.isdir(path) else []:
+            try:
+                with open(file_path, "r") as f:
+                    self.add(None, None, json.load(f))
+            except (OSError, ValueError):
+                continue
+
+    def add(self, bank, query, response):
+        if response is None:
+            return
+        if bank:
+            self.banks.add(bank)
+        if isinstance(query, str):
+            self.exact[(bank, " ".join(query.lower().split()))] = response
+            self.by_query.append((_words(query), response))
+        else:
+            self.anonymous.append(response)
+
+    def __len__(self):
+        return len(self.exact) + len(self.anonymous)
+
+    def lookup(self, bank, query, choose):
+        # choose(sequence) picks a recording when no query is similar
+        response = self.exact.get((bank, " ".join(str(query).lower().split())))
+        if response is not None:
+            return response
+        words = _words(query)
+        best, best_score = None, 0.0
+        for recorded_words, recorded in self.by_query:
+            union = len(words | recorded_words)
+            score = len(words & recorded_words) / union if union else 0.0
+            if score > best_score:
+                best, best_score = recorded, score
+        if best is not None:
+            return best
+        if self.anonymous:
+            return choose(self.anonymous)
+        return None
+
+
+class StubConfig:
+    def __init__(self, recordings=None, latency=None, error_rate=0.0, error_status=503, seed=0,
+                 banks=None, answer=DEFAULT_ANSWER, tokens_per_sec=50.0, ingest_seconds=10.0, models=None):
+        self.recordings = recordings or Recordings()
+        self.latency = {endpoint: parse_latency("fixed:0") for endpoint in ENDPOINTS}
+        for endpoint, spec in (latency or {}).items():
+            self.latency[endpoint] = parse_latency(spec)
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.banks = set(banks or []) | self.recordings.banks
+        self.answer = answer
+        self.tokens_per_sec = tokens_per_sec
+        self.ingest_seconds = ingest_seconds
+        self.models = models or ["llama3:latest"]
+        self.ingestions = {}  # bank -> (started_at, total files)
+        self.requests = 0
+
+    def sample(self, endpoint):
+        with self.rng_lock:
+            self.requests += 1
+            delay = self.latency[endpoint](self.rng) / 1000
+            failed = self.rng.random() < self.error_rate
+        return delay, failed
+
+    def choice(self, sequence):
+        # The shared RNG keeps runs reproducible for a seed; only the draw is locked
+        with self.rng_lock:
+            return self.rng.choice(sequence)
+
+    def synthetic_results(self, query, limit):
+        return {"results": [
+            {"text": f"Stub result {i + 1} for: {query}", "score": round(1.0 - i * 0.05, 3),
+             "metadata": {"source": f"stub_document_{i + 1}.pdf"}}
+            for i in range(limit)
+        ]}
+
+
+def make_handler(config):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Send headers and body in one write; separate small writes hit delayed ACKs on keep-alive
+        wbufsize = 64 * 1024
+
+        def log_message(self, *args):
+            pass
+
+        def _send_json(self, payload, status=200):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _delay(self, endpoint):
+            delay, failed = config.sample(endpoint)
+            time.sleep(delay)
+            if failed:
+                self._send_json({"error": "injected failure"}, config.error_status)
+            return not failed
+
+        def _read_json(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            return json.loads(self.rfile.read(length) or b"{}") if length else {}
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = {key: values[0] for key, values in parse_qs(url.query).items()}
+            if url.path in ("/health", "/api/silk/health"):
+                if self._delay("health"):
+                    self._send_json({"status": "OK"})
+            elif url.path == "/api/silk/query":
+                if self._delay("query"):
+                    self._query(params)
+            elif url.path == "/api/silk/memorybanks":
+                if self._delay("memorybanks"):
+                    self._send_json({"SilkMemoryBanks": [{"name": bank} for bank in sorted(config.banks)]})
+            elif url.path == "/api/silk/ingestions":
+                if self._delay("ingestions"):
+                    self._send_json({"IngestionItems": self._ingestions()})
+            elif url.path == "/api/silk/store/enqueue":
+                bank = params.get("memoryBankName", "Default")
+                config.ingestions[bank] = (time.monotonic(), 100)
+                config.banks.add(bank)
+                self._send_json({"status": "enqueued", "memoryBankName": bank})
+            elif url.path == "/api/tags":
+                self._send_json({"models": [{"name": model, "model": model} for model in config.models]})
+            else:
+                self._send_json({"error": f"Unknown endpoint {url.path}"}, 404)
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            body = self._read_json()
+            if url.path == "/api/silk/embedding":
+                if self._delay("embedding"):
+                    inputs = body.get("input", "")
+                    inputs = inputs if isinstance(inputs, list) else [inputs]
+                    self._send_json({"data": [{"embedding": hashed_embedding(text), "index": i} for i, text in enumerate(inputs)]})
+            elif url.path == "/api/chat":
+                if self._delay("llm"):
+                    self._chat(body)
+            elif url.path == "/api/generate":
+                if self._delay("llm"):
+                    self._generate(body)
+            else:
+                self._send_json({"error": f"Unknown endpoint {url.path}"}, 404)
+
+        def _query(self, params):
+            query = params.get("q", "")
+            bank = params.get("memorybank") or params.get("bank")
+            limit = int(params.get("limit") or 10)
+            response = config.recordings.lookup(bank, query, config.choice)
+            if response is None:
+                response = config.synthetic_results(query, limit)
+            elif isinstance(response, dict) and get_hits(response):
+                response = {**response, "results": get_hits(response)[:limit]}
+            self._send_json(response)
+
+        def _ingestions(self):
+            items = []
+            for bank, (started_at, total_files) in config.ingestions.items():
+                fraction = min(1.0, (time.monotonic() - started_at) / config.ingest_seconds) if config.ingest_seconds else 1.0
+                items.append({
+                    "memoryBankName": bank,
+                    "status": "complete" if fraction >= 1.0 else "running",
+                    "progress": fraction * 100,
+                    "processedFiles": int(fraction * total_files),
+                    "totalFiles": total_files,
+                    "processedChunks": int(fraction * total_files * 10),
+                    "totalChunks": total_files * 10,
+                    "error": "",
+                })
+            return items
+
+        def _chat_chunk(self, model, content, done):
+            return {
+                "model": model,
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "message": {"role": "assistant", "content": content},
+                "done": done,
+            }
+
+        def _generate_chunk(self, model, content, done):
+            return {
+                "model": model,
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "response": content,
+                "done": done,
+            }
+
+        def _chat(self, body):
+            # Ollama /api/chat: one JSON object per line while streaming
+            self._answer(body, self._chat_chunk)
+
+        def _generate(self, body):
+            # Ollama /api/generate; an empty prompt only loads the model (used to pre-warm it)
+            model = body.get("model", config.models[0])
+            if not body.get("prompt"):
+                self._send_json({**self._generate_chunk(model, "", True), "done_reason": "load"})
+                return
+            self._answer(body, self._generate_chunk)
+
+        def _answer(self, body, make_chunk):
+            model = body.get("model", config.models[0])
+            tokens = re.findall(r"\S+\s*", config.answer)
+            if not body.get("stream", True):
+                time.sleep(len(tokens) / config.tokens_per_sec if config.tokens_per_sec else 0)
+                self._send_json(make_chunk(model, config.answer, True))
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for token in tokens + [None]:
+                if token is not None and config.tokens_per_sec:
+                    time.sleep(1.0 / config.tokens_per_sec)
+                line = json.dumps(make_chunk(model, token or "", token is None)).encode("utf-8") + b"\n"
+                self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+
+    return Handler
+
+
+def start_server(config, host="127.0.0.1", port=0):
+    """Start the stub in a daemon thread; returns (server, base url)."""
+    server = ThreadingHTTPServer((host, port), make_handler(config))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record/replay stand-in for the Dabarqus and Ollama APIs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6568)
+    parser.add_argument("--recordings", nargs="*", default=["./retrievals/"], help="Retrieval logs or directories to replay")
+    parser.add_argument("--bank", action="append", default=[], help="Extra memory bank names to list")
+    parser.add_argument("--latency", action="append", default=[],
+                        help=f"ENDPOINT=DIST, e.g. query=lognormal:40,0.5; endpoints: {', '.join(ENDPOINTS)}")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with an error")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--seed", type=int, default=0, help="Seed for latency and error sampling")
+    parser.add_argument("--tokens-per-sec", type=float, default=50.0, help="Fake LLM streaming rate")
+    parser.add_argument("--ingest-seconds", type=float, default=10.0, help="How long a fake ingestion takes")
+    args = parser.parse_args()
+
+    recordings = Recordings()
+    for path in args.recordings:
+        if os.path.exists(path):
+            recordings.load(path)
+    latency = dict(spec.split("=", 1) for spec in args.latency)
+    config = StubConfig(recordings, latency, args.error_rate, args.error_status, args.seed,
+                        args.bank or ["Default"], tokens_per_sec=args.tokens_per_sec, ingest_seconds=args.ingest_seconds)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(config))
+    server.daemon_threads = True
+    print(f"Stub server on http://{args.host}:{args.port} replaying {len(recordings)} recorded responses")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()